@@ -3,7 +3,8 @@ from .models import (
     Company, Activity, CompanyActivity, Framework, CompanyFramework,
     DataElement, FrameworkElement, DataElementFrameworkMapping, ProfilingQuestion,
     CompanyProfileAnswer, Meter, CompanyDataSubmission, CompanyChecklist,
-    ChecklistFrameworkMapping
+    ChecklistFrameworkMapping, EvidenceUpload, EvidenceBlob, StorageUsage, EmissionFactor,
+    MeterMonthlyRollup, SiteQuarterlyRollup, CompanyYearlyRollup, QualityFlag, ReportJob
 )
 
 
@@ -89,7 +90,7 @@ class MeterAdmin(admin.ModelAdmin):
 @admin.register(CompanyDataSubmission)
 class CompanyDataSubmissionAdmin(admin.ModelAdmin):
     list_display = ['company', 'element', 'meter', 'reporting_year', 'reporting_period', 'status', 'updated_at']
-    list_filter = ['reporting_year', 'reporting_period', 'element', 'updated_at']
+    list_filter = ['reporting_year', 'period_granularity', 'reporting_period', 'element', 'updated_at']
     search_fields = ['company__name', 'element__name_plain']
     
     def status(self, obj):
@@ -97,6 +98,73 @@ class CompanyDataSubmissionAdmin(admin.ModelAdmin):
     status.short_description = 'Status'
 
 
+@admin.register(EvidenceUpload)
+class EvidenceUploadAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'company', 'submission', 'received_bytes', 'total_size', 'status', 'updated_at']
+    list_filter = ['status', 'updated_at']
+    search_fields = ['filename', 'company__name', 'sha256']
+    readonly_fields = ['id', 'sha256']
+
+
+@admin.register(EvidenceBlob)
+class EvidenceBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'file', 'size', 'ref_count', 'created_at']
+    search_fields = ['sha256', 'file']
+    readonly_fields = ['sha256', 'file', 'size', 'ref_count', 'created_at']
+
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    list_display = ['company', 'site', 'file_count', 'bytes_used', 'updated_at']
+    list_filter = ['company']
+    readonly_fields = ['company', 'site', 'file_count', 'bytes_used', 'updated_at']
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'company', 'site', 'year', 'status', 'progress', 'data_version', 'size', 'created_at']
+    list_filter = ['status', 'company', 'year']
+    readonly_fields = [
+        'company', 'site', 'framework_id', 'year', 'requested_by', 'data_version', 'status', 'progress', 'stage',
+        'artifact', 'content_hash', 'size', 'error', 'created_at', 'started_at', 'finished_at',
+    ]
+
+
+@admin.register(QualityFlag)
+class QualityFlagAdmin(admin.ModelAdmin):
+    list_display = ['submission', 'company', 'rule', 'message', 'detected_at']
+    list_filter = ['rule', 'company']
+    readonly_fields = ['company', 'submission', 'rule', 'message', 'detected_at']
+
+
+@admin.register(MeterMonthlyRollup)
+class MeterMonthlyRollupAdmin(admin.ModelAdmin):
+    list_display = ['company', 'site', 'meter', 'framework_element', 'year', 'month', 'total', 'readings']
+    list_filter = ['company', 'year']
+    readonly_fields = ['company', 'site', 'meter', 'framework_element', 'year', 'month', 'total', 'readings', 'updated_at']
+
+
+@admin.register(SiteQuarterlyRollup)
+class SiteQuarterlyRollupAdmin(admin.ModelAdmin):
+    list_display = ['company', 'site', 'framework_element', 'year', 'quarter', 'total', 'readings']
+    list_filter = ['company', 'year']
+    readonly_fields = ['company', 'site', 'framework_element', 'year', 'quarter', 'total', 'readings', 'updated_at']
+
+
+@admin.register(CompanyYearlyRollup)
+class CompanyYearlyRollupAdmin(admin.ModelAdmin):
+    list_display = ['company', 'framework_element', 'year', 'total', 'readings']
+    list_filter = ['company', 'year']
+    readonly_fields = ['company', 'framework_element', 'year', 'total', 'readings', 'updated_at']
+
+
+@admin.register(EmissionFactor)
+class EmissionFactorAdmin(admin.ModelAdmin):
+    list_display = ['source', 'emirate', 'valid_from', 'valid_to', 'factor', 'unit', 'scope', 'reference']
+    list_filter = ['source', 'emirate', 'scope']
+    search_fields = ['source', 'reference']
+
+
 @admin.register(CompanyChecklist)
 class CompanyChecklistAdmin(admin.ModelAdmin):
     list_display = ['company', 'element', 'framework_id', 'is_required', 'cadence', 'created_at']
@@ -0,0 +1,178 @@
+"""
+Batch API endpoint - runs several API calls in one HTTP round trip
+"""
+import io
+import json
+import logging
+import threading
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .authentication import CsrfExemptSessionAuthentication
+from .db_router import current_request_state
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+def batch_handler():
+    """The middleware chain for sub-requests, built once per process"""
+    global _handler
+    if _handler is None:
+        with _handler_lock:
+            if _handler is None:
+                handler = BaseHandler()
+                handler.load_middleware()
+                _handler = handler
+    return _handler
+
+
+@receiver(setting_changed)
+def reset_batch_handler(setting, **kwargs):
+    global _handler
+    if setting == 'MIDDLEWARE':
+        _handler = None
+
+
+class BatchView(APIView):
+    """
+    Execute a list of API sub-requests inside a single Django request.
+
+    POST /api/batch/
+        {"requests": [{"method": "GET", "path": "/api/meters/", "query": {"company_id": 1}}, ...]}
+
+    Each sub-request goes through the full middleware stack, like a request
+    of its own - security, sessions, CSRF and read replica stickiness all
+    apply. Sub-requests reuse the outer request's authenticated user, so auth,
+    profile and company lookups are resolved once per batch. Results are
+    returned in request order, each with its own status.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        items = request.data.get('requests')
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'requests must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+        if len(items) > max_requests:
+            return Response(
+                {'error': f'A batch may contain at most {max_requests} requests'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        handler = batch_handler()
+        results = [self._execute(handler, request, item) for item in items]
+        return Response({'results': results})
+
+    def _execute(self, handler, request, item):
+        if not isinstance(item, dict):
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'error': 'Each request must be an object'}}
+
+        method = str(item.get('method', 'GET')).upper()
+        url = urlsplit(str(item.get('path', '')))
+        path = url.path
+
+        if method not in ALLOWED_METHODS:
+            return {'path': path, 'status': status.HTTP_405_METHOD_NOT_ALLOWED,
+                    'body': {'error': f'Method {method} not allowed'}}
+        if not path.startswith('/api/') or path.rstrip('/') == request.path.rstrip('/'):
+            return {'path': path, 'status': status.HTTP_400_BAD_REQUEST,
+                    'body': {'error': 'Only non-batch /api/ paths can be batched'}}
+
+        try:
+            resolve(path)
+        except Resolver404:
+            return {'path': path, 'status': status.HTTP_404_NOT_FOUND, 'body': {'error': 'Not found'}}
+
+        sub_request = self._build_sub_request(request, method, path, url.query, item)
+        try:
+            response = handler.get_response(sub_request)
+        except Exception:
+            logger.exception(f"[BATCH] Sub-request {method} {path} failed")
+            response = None
+
+        if response is None:
+            return {'path': path, 'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    'body': {'error': 'Internal server error'}}
+        try:
+            # The handler has already logged view errors; their details stay out of the response
+            if response.status_code >= 500:
+                return {'path': path, 'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        'body': {'error': 'Internal server error'}}
+            if response.streaming:
+                return {'path': path, 'status': status.HTTP_400_BAD_REQUEST,
+                        'body': {'error': 'Streamed responses (downloads, exports) cannot be batched'}}
+            return {'path': path, 'status': response.status_code, 'body': self._response_body(response)}
+        finally:
+            response.close()
+
+    @staticmethod
+    def _build_sub_request(request, method, path, query_string, item):
+        """A WSGI request carrying the outer request's headers, cookies and user"""
+        outer = request._request
+        query = item.get('query') or {}
+        if query:
+            extra = urlencode(query, doseq=True)
+            query_string = f'{query_string}&{extra}' if query_string else extra
+
+        body = b''
+        if 'body' in item and method != 'GET':
+            body = json.dumps(item['body']).encode('utf-8')
+
+        environ = {
+            key: value for key, value in outer.META.items()
+            # The batch response is compressed as a whole
+            if key != 'HTTP_ACCEPT_ENCODING' and not key.startswith('wsgi.')
+        }
+        environ.update({
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': outer.META.get('SCRIPT_NAME', ''),
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.url_scheme': outer.META.get('wsgi.url_scheme', 'https' if outer.is_secure() else 'http'),
+        })
+        sub_request = WSGIRequest(environ)
+
+        # Shared auth and tenant context: AuthenticationMiddleware hands out the
+        # cached user, which carries the userprofile/company lookups already made
+        sub_request._cached_user = request.user
+        sub_request.replica_parent_state = current_request_state()
+        return sub_request
+
+    @staticmethod
+    def _response_body(response):
+        # DRF responses: use the data directly instead of rendering and re-parsing
+        if hasattr(response, 'data'):
+            return response.data
+
+        if hasattr(response, 'render'):
+            response.render()
+        content = response.content.decode(response.charset or 'utf-8')
+        if response.get('Content-Type', '').startswith('application/json'):
+            try:
+                return json.loads(content)
+            except ValueError:
+                pass
+        return content
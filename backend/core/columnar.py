@@ -0,0 +1,204 @@
+"""
+Columnar response encoding for bulk data endpoints.
+
+Requested with ``?format=columnar`` on the tasks, checklist and submission
+listings. Element, meter, site and user definitions are sent once in lookup
+tables keyed by ID, and rows are sent as parallel column arrays that reference
+them, instead of repeating names and long descriptions on every row.
+"""
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """JSON renderer selected by ``?format=columnar``"""
+    format = 'columnar'
+
+
+def is_columnar(request):
+    """True when content negotiation picked the columnar renderer"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return getattr(renderer, 'format', None) == ColumnarJSONRenderer.format
+
+
+def _columns(names, rows):
+    """Transpose row tuples into a {column: [values]} mapping"""
+    columns = {name: [] for name in names}
+    for row in rows:
+        for name, value in zip(names, row):
+            columns[name].append(value)
+    return columns
+
+
+def _evidence_url(submission):
+    """The tenant-checked download URL; the storage path under /media/ is never sent"""
+    return reverse('evidence-download', args=[submission.id]) if submission.evidence_file else None
+
+
+def _element_entry(element, detailed=True):
+    entry = {'name': element.name, 'unit': element.unit}
+    if detailed:
+        entry.update({
+            'description': element.description,
+            'category': element.category,
+            'is_metered': element.is_metered,
+        })
+    return entry
+
+
+def _meter_entry(meter):
+    return {
+        'name': meter.name,
+        'type': meter.type,
+        'location': meter.location_description,
+        'account_number': meter.account_number,
+        'status': meter.status,
+        'site': meter.site_id,
+    }
+
+
+def _user_lookup(user_ids):
+    """Fetch every referenced user in one query"""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+    users = User.objects.filter(id__in=user_ids).values('id', 'username', 'first_name', 'last_name', 'email')
+    return {user.pop('id'): user for user in users}
+
+
+SUBMISSION_COLUMNS = [
+    'submission', 'value', 'evidence_file', 'status',
+    'assigned_to', 'assigned_by', 'assigned_at', 'updated_at',
+]
+
+
+def _submission_values(submission):
+    return (
+        submission.id,
+        submission.value,
+        _evidence_url(submission),
+        submission.status,
+        submission.assigned_to_id,
+        submission.assigned_by_id,
+        submission.assigned_at,
+        submission.updated_at,
+    )
+
+
+def encode_tasks(site_groups, reporting_year, reporting_period):
+    """
+    Encode data collection tasks.
+
+    ``site_groups`` is a list of ``(site_dict, tasks)`` pairs as produced by
+    ``DataCollectionService.get_data_collection_tasks``; a single-site request
+    is passed as one group.
+    """
+    names = ['type', 'element', 'meter', 'site', 'cadence'] + SUBMISSION_COLUMNS
+    elements, meters, sites, rows = {}, {}, {}, []
+
+    for site, tasks in site_groups:
+        sites[site['id']] = {'name': site['name']}
+        for task in tasks:
+            element = task['element']
+            meter = task['meter']
+            submission = task['submission']
+            elements.setdefault(element.element_id, _element_entry(element))
+            if meter:
+                meters.setdefault(meter.id, _meter_entry(meter))
+            rows.append((
+                task['type'],
+                element.element_id,
+                meter.id if meter else None,
+                site['id'],
+                task['cadence'],
+            ) + _submission_values(submission))
+
+    columns = _columns(names, rows)
+    return {
+        'format': 'columnar',
+        'reporting_year': reporting_year,
+        'reporting_period': reporting_period,
+        'count': len(rows),
+        'elements': elements,
+        'meters': meters,
+        'sites': sites,
+        'users': _user_lookup(columns['assigned_to'] + columns['assigned_by']),
+        'columns': columns,
+    }
+
+
+def encode_checklist(items, aggregate=False):
+    """
+    Encode checklist items.
+
+    With ``aggregate`` the rows are deduplicated by element, as in the All
+    Locations view, and each row lists the IDs of the sites it applies to.
+    """
+    elements, sites = {}, {}
+    grouped = {}
+
+    for item in items:
+        element = item.element
+        elements.setdefault(element.element_id, _element_entry(element))
+        if item.site_id:
+            sites.setdefault(item.site_id, {'name': item.site.name, 'location': item.site.location})
+        if aggregate:
+            row = grouped.setdefault(element.element_id, [item, []])
+            if item.site_id and item.site_id not in row[1]:
+                row[1].append(item.site_id)
+        else:
+            grouped[item.id] = [item, item.site_id]
+
+    if aggregate:
+        names = ['id', 'element', 'is_required', 'cadence', 'framework_id', 'sites']
+        ordered = sorted(
+            grouped.values(),
+            key=lambda row: (row[0].element.category, row[0].element.name_plain)
+        )
+    else:
+        names = ['id', 'element', 'is_required', 'cadence', 'framework_id', 'site']
+        ordered = grouped.values()
+
+    rows = [
+        (item.id, item.element_id, item.is_required, item.cadence, item.framework_id, site_ref)
+        for item, site_ref in ordered
+    ]
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'elements': elements,
+        'sites': sites,
+        'columns': _columns(names, rows),
+    }
+
+
+def encode_submissions(submissions):
+    """Encode a page of ``CompanyDataSubmission`` rows"""
+    names = ['element', 'meter', 'site', 'reporting_year', 'reporting_period'] + SUBMISSION_COLUMNS
+    elements, meters, rows = {}, {}, []
+
+    for submission in submissions:
+        element = submission.element_instance
+        element_ref = element.element_id if element else None
+        if element:
+            elements.setdefault(element_ref, _element_entry(element, detailed=False))
+        if submission.meter_id:
+            meters.setdefault(submission.meter_id, _meter_entry(submission.meter))
+        rows.append((
+            element_ref,
+            submission.meter_id,
+            submission.site_id,
+            submission.reporting_year,
+            submission.reporting_period,
+        ) + _submission_values(submission))
+
+    columns = _columns(names, rows)
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'elements': elements,
+        'meters': meters,
+        'users': _user_lookup(columns['assigned_to'] + columns['assigned_by']),
+        'columns': columns,
+    }
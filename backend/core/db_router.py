@@ -0,0 +1,143 @@
+"""
+Read replica routing - analytic reads go to the 'replica' alias, everything else to the primary
+"""
+import contextlib
+import functools
+import inspect
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+# Set while a dashboard, report, export or catalogue read runs
+_replica_reads = ContextVar('replica_reads', default=False)
+# Stickiness of the current request; None outside requests
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class RequestState:
+    """
+    Whether the current request must read from the primary, and whether it wrote.
+
+    A batch sub-request gets its own state with the batch request's state as
+    parent: it inherits the parent's pinning and hands its writes back to it
+    when it ends.
+    """
+
+    def __init__(self, pinned=False, parent=None):
+        self.pinned = pinned or (parent is not None and parent.pinned)
+        self.wrote = False
+        self.parent = parent
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.databases
+
+
+def current_request_state():
+    return _request_state.get()
+
+
+def begin_request(pinned=False, parent=None):
+    state = RequestState(pinned, parent)
+    _request_state.set(state)
+    return state
+
+
+def end_request(state=None):
+    """Finish a request, restoring the parent state of a sub-request"""
+    parent = state.parent if state is not None else None
+    if parent is not None and state.wrote:
+        parent.pinned = parent.wrote = True
+    _request_state.set(parent)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Route the reads made inside the block to the replica (see ReadReplicaRouter)"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _iterate_in_replica_reads(generator):
+    """Re-enter replica_reads() for each step, since a generator's body runs wherever it's consumed"""
+    try:
+        while True:
+            with replica_reads():
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        generator.close()
+
+
+def read_from_replica(func):
+    """Decorator for read-only analytic code; also covers generators such as streaming exports"""
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            return _iterate_in_replica_reads(func(*args, **kwargs))
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """View mixin: GET, HEAD and OPTIONS requests read from the replica"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ReadReplicaRouter:
+    """
+    Send reads inside replica_reads() to the replica alias when one is
+    configured (REPLICA_DATABASE_URL); all other reads and every write go to
+    the primary.
+
+    A read stays on the primary when:
+    - the request has already written. The write is recorded in the request
+      state, and ReplicaStickinessMiddleware keeps the client on the primary
+      for REPLICA_STICKY_SECONDS afterwards.
+    - a transaction is open on the primary. This includes every TestCase test,
+      where the replica is a mirror that can't see the test's uncommitted
+      rows.
+    """
+
+    @staticmethod
+    def _use_replica():
+        if not _replica_reads.get() or not replica_configured():
+            return False
+        state = _request_state.get()
+        if state is not None and state.pinned:
+            return False
+        return not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+    def db_for_read(self, model, **hints):
+        return REPLICA_ALIAS if self._use_replica() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_ALIAS} or None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db == REPLICA_ALIAS else None
@@ -0,0 +1,103 @@
+"""
+Emission factor lookups - a compiled in-memory interval index over EmissionFactor
+"""
+import logging
+import re
+import threading
+from bisect import bisect_right
+
+from django.db.models import Count, Max
+
+from .models import EmissionFactor, reporting_period_parts
+
+logger = logging.getLogger(__name__)
+
+# Factor output units, normalised to kg CO2e
+UNIT_TO_KG = {
+    'kgco2e': 1.0,
+    'kgco2': 1.0,
+    'tco2e': 1000.0,
+    'tco2': 1000.0,
+    'tonnesco2e': 1000.0,
+    'gco2e': 0.001,
+}
+
+
+def to_kg(factor, unit):
+    """Convert a factor expressed in `unit` to kg CO2e"""
+    key = re.sub(r'[^a-z0-9]', '', str(unit or 'kg CO2e').lower())
+    return float(factor) * UNIT_TO_KG.get(key, 1.0)
+
+
+def period_date(year, period):
+    """First day of a reporting period ('Jan'..'Dec', 'Q1'..'Q4', anything else is the whole year)"""
+    return reporting_period_parts(year, period)[2]
+
+
+class EmissionFactorIndex:
+    """
+    Every EmissionFactor row compiled into sorted interval lists per
+    (source, emirate), so a lookup is a bisect instead of a query.
+
+    The index is built once per process and rebuilt when the table changes,
+    detected from the row count and latest updated_at. current() costs one
+    aggregate query; callers should fetch the index once per batch and do all
+    their lookups against it.
+    """
+
+    _compiled = None
+    _lock = threading.Lock()
+
+    def __init__(self, rows, version):
+        self.version = version
+        # (source, emirate) -> (starts, ends, entries), sorted by valid_from
+        self._intervals = {}
+        for row in rows:
+            starts, ends, entries = self._intervals.setdefault((row['source'], row['emirate']), ([], [], []))
+            starts.append(row['valid_from'])
+            ends.append(row['valid_to'])
+            entries.append({
+                'id': row['id'],
+                'factor': to_kg(row['factor'], row['unit']),
+                'activity_unit': row['activity_unit'],
+                'scope': row['scope'],
+                'reference': row['reference'],
+            })
+
+    @staticmethod
+    def table_version():
+        state = EmissionFactor.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return f"{state['count']}-{state['updated'].timestamp() if state['updated'] else 0}"
+
+    @classmethod
+    def current(cls, version=None):
+        """The compiled index; pass version when the caller has just read table_version()"""
+        version = version or cls.table_version()
+        with cls._lock:
+            if cls._compiled is None or cls._compiled.version != version:
+                rows = EmissionFactor.objects.order_by('source', 'emirate', 'valid_from').values(
+                    'id', 'source', 'emirate', 'valid_from', 'valid_to', 'factor', 'unit', 'activity_unit', 'scope',
+                    'reference',
+                )
+                cls._compiled = cls(rows, version)
+                logger.info(f"[EMISSION_FACTORS] Compiled {len(rows)} factors (version {version})")
+            return cls._compiled
+
+    def lookup(self, source, emirate, on):
+        """The factor for source valid on date `on` in emirate, falling back to the all-emirates row"""
+        for key in ((source, emirate), (source, '')):
+            intervals = self._intervals.get(key)
+            if not intervals:
+                continue
+            starts, ends, entries = intervals
+            position = bisect_right(starts, on) - 1
+            if position >= 0 and (ends[position] is None or on <= ends[position]):
+                return entries[position]
+        return None
+
+    def resolve(self, element_id, meter_type, emirate, on):
+        """An element-specific factor if there is one, otherwise the factor for its meter type"""
+        entry = self.lookup(element_id, emirate, on)
+        if entry is None and meter_type:
+            entry = self.lookup(meter_type, emirate, on)
+        return entry
@@ -0,0 +1,212 @@
+"""
+Carbon emissions aggregation - a company-year of metered data in one vectorized pass
+"""
+import logging
+import re
+
+from django.utils import timezone
+
+from .db_router import read_from_replica
+from .emission_factors import EmissionFactorIndex, period_date, to_kg
+from .models import MONTH_ORDER, FrameworkElement
+from .reports import DataVersion
+from .rollups import ConsumptionRollups
+from .units import base_unit, conversion_factor
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional - the same totals are computed with plain Python loops
+    np = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_UNIT = 'kg CO2e'
+
+SCOPES = ['scope_1', 'scope_2', 'scope_3', 'unscoped']
+MONTHS = sorted(MONTH_ORDER, key=MONTH_ORDER.get)
+
+
+def _number(value):
+    """Parse a submitted value as a float, or None if it isn't numeric"""
+    try:
+        number = float(str(value).replace(',', '').strip())
+    except (TypeError, ValueError):
+        return None
+    return number if number == number and number not in (float('inf'), float('-inf')) else None
+
+
+class CarbonAggregator:
+    """
+    Scope 1/2/3 totals for a company and reporting year.
+
+    The company-year's meter x month consumption rollups, which are in base
+    units (kWh, m³, kg), are loaded with one values_list() query into parallel arrays (value, site, month, scope,
+    source and factor slot indices). Emissions are value x factor[slot] in a single multiply and
+    the totals per scope, site, month and source are bincounts over the index
+    arrays. Without NumPy the same arrays are summed in one Python loop.
+
+    Factors are resolved per element and period from the EmissionFactor
+    table for the company's emirate. Elements without a row there use the
+    legacy carbon_specifications emission_factor: a number or a mapping of
+    emirate -> number (with an optional 'default'). Table factors are per unit
+    of their activity_unit, legacy ones (and table rows without an
+    activity_unit) per unit of the element's unit; both are converted to
+    the base unit of the rollups, and everything is normalised to kg CO2e. A
+    factor whose unit doesn't convert to the element's is not applied and
+    its readings are counted under skipped['unit_mismatch'].
+    """
+
+    @staticmethod
+    def scope_of(specs):
+        """Normalise the different scope shapes in carbon_specifications to 'scope_N'"""
+        scope = specs.get('scope')
+        if isinstance(scope, dict):
+            numbers = scope.get('scope_number') or []
+            scope = numbers[0] if numbers else None
+        match = re.search(r'[123]', str(scope)) if scope is not None else None
+        return f'scope_{match.group(0)}' if match else 'unscoped'
+
+    @staticmethod
+    def factor_for(specs, emirate):
+        """Emission factor for one element in kg CO2e per input unit, or None if it has none"""
+        factor = specs.get('emission_factor')
+        if isinstance(factor, dict):
+            factor = factor.get(emirate, factor.get('default'))
+        factor = _number(factor) if factor is not None else None
+        if factor is None:
+            return None
+        return to_kg(factor, specs.get('unit', REPORT_UNIT))
+
+    @classmethod
+    def factor_resolver(cls, element_ids, emirate, year, factors_version=None):
+        """
+        resolve(element_id, period) -> (kg CO2e per base unit, scope, table entry or None).
+
+        Factors come from the EmissionFactor index as valid on the first day of
+        the period; elements with no row there fall back to the legacy
+        carbon_specifications factor. When no factor applies the result is
+        (None, reason, None), reason being 'no_factor' or 'unit_mismatch'.
+        Results are memoised per element and period.
+        """
+        index = EmissionFactorIndex.current(factors_version)
+        elements = {
+            element_id: (meter_type, specs or {}, unit)
+            for element_id, meter_type, specs, unit in FrameworkElement.objects.filter(
+                element_id__in=element_ids
+            ).values_list('element_id', 'meter_type', 'carbon_specifications', 'unit')
+        }
+        resolved = {}
+
+        def resolve(element_id, period):
+            key = (element_id, period)
+            if key not in resolved:
+                meter_type, specs, unit = elements.get(element_id, (None, {}, ''))
+                entry = index.resolve(element_id, meter_type, emirate, period_date(year, period))
+                if entry is not None:
+                    factor, scope, activity_unit = entry['factor'], entry['scope'], entry['activity_unit'] or unit
+                else:
+                    factor, scope, activity_unit = cls.factor_for(specs, emirate), cls.scope_of(specs), unit
+                # Activity units in one base unit of the element's unit
+                per_base = conversion_factor(base_unit(unit)[0], activity_unit)
+                if factor is None:
+                    resolved[key] = (None, 'no_factor', None)
+                elif per_base is None:
+                    resolved[key] = (None, 'unit_mismatch', None)
+                else:
+                    resolved[key] = (factor * float(per_base), scope, entry)
+            return resolved[key]
+
+        return resolve
+
+    @staticmethod
+    def rows(company, year, site_id=None):
+        return ConsumptionRollups.meter_months(company, year, site_id=site_id).values_list(
+            'site_id', 'site__name', 'month', 'framework_element_id', 'meter__type', 'total', 'readings'
+        )
+
+    @classmethod
+    def build(cls, company, year, site_id=None, factors_version=None):
+        rows = list(cls.rows(company, year, site_id=site_id))
+        resolve = cls.factor_resolver({row[3] for row in rows}, company.emirate, year, factors_version)
+
+        sites, sources, slots = {}, {}, {}
+        site_names = {}
+        values, site_index, month_index, scope_index, source_index, slot_index = [], [], [], [], [], []
+        readings = 0
+        skipped = {'no_factor': 0, 'unit_mismatch': 0}
+
+        for site, site_name, month, element_id, meter_type, total, count in rows:
+            period = MONTHS[month - 1]
+            factor, scope, _ = resolve(element_id, period)
+            if factor is None:
+                skipped[scope] += count
+                continue
+            readings += count
+            site_names[site] = site_name or 'Company-wide'
+            values.append(float(total))
+            site_index.append(sites.setdefault(site, len(sites)))
+            month_index.append(month - 1)
+            scope_index.append(SCOPES.index(scope))
+            source_index.append(sources.setdefault((meter_type or 'Other', scope), len(sources)))
+            # One factor slot per element and period, so factors can change during the year
+            slot_index.append(slots.setdefault((element_id, period), len(slots)))
+
+        slot_factors = [resolve(element_id, period)[0] for element_id, period in slots]
+        by_scope, by_site, by_month, by_source = cls._aggregate(
+            values, slot_factors, slot_index,
+            (scope_index, len(SCOPES)), (site_index, len(sites)), (month_index, 12), (source_index, len(sources)),
+        )
+
+        return {
+            'company_id': company.id,
+            'year': year,
+            'unit': REPORT_UNIT,
+            'generated_at': timezone.now().isoformat(),
+            'total': round(sum(by_scope), 3),
+            'by_scope': {scope: round(total, 3) for scope, total in zip(SCOPES, by_scope)},
+            'by_site': sorted(
+                [
+                    {'site_id': site, 'site_name': site_names[site], 'emissions': round(by_site[index], 3)}
+                    for site, index in sites.items()
+                ],
+                key=lambda entry: -entry['emissions'],
+            ),
+            'by_month': [{'month': month, 'emissions': round(by_month[index], 3)} for index, month in enumerate(MONTHS)],
+            'by_source': sorted(
+                [
+                    {'source': source, 'scope': scope, 'emissions': round(by_source[index], 3)}
+                    for (source, scope), index in sources.items()
+                ],
+                key=lambda entry: -entry['emissions'],
+            ),
+            'submissions': readings,
+            'skipped': skipped,
+        }
+
+    @staticmethod
+    def _aggregate(values, slot_factors, slot_index, *groupings):
+        """Sum value x factor into each (index, size) grouping; returns one list of totals per grouping"""
+        if np is not None:
+            factors = np.asarray(slot_factors, dtype=np.float64)
+            emissions = np.asarray(values, dtype=np.float64) * factors[np.asarray(slot_index, dtype=np.intp)]
+            return [
+                np.bincount(np.asarray(index, dtype=np.intp), weights=emissions, minlength=size).tolist()
+                for index, size in groupings
+            ]
+
+        totals = [[0.0] * size for _, size in groupings]
+        for row, value in enumerate(values):
+            emission = value * slot_factors[slot_index[row]]
+            for group, (index, _) in enumerate(groupings):
+                totals[group][index[row]] += emission
+        return totals
+
+    @classmethod
+    @read_from_replica
+    def get(cls, company, year, site_id=None):
+        factors_version = EmissionFactorIndex.table_version()
+        return DataVersion.cached(
+            'emissions', company.id, {'year': year, 'site': site_id or '', 'factors': factors_version},
+            lambda: cls.build(company, year, site_id=site_id, factors_version=factors_version)
+        )
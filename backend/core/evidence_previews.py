@@ -0,0 +1,161 @@
+"""
+Preview generation for evidence files, run by the run_preview_worker command
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from .models import EvidenceBlob
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow is optional (see requirements_no_pillow.txt) - image previews are skipped
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+PDF_EXTENSIONS = {'.pdf'}
+PREVIEW_QUALITY = 75
+PDF_RENDER_TIMEOUT = 30  # seconds
+
+
+class PreviewService:
+    """
+    Generates compact JPEG previews for evidence blobs.
+
+    Previews are produced once per blob (so deduplicated evidence shares one
+    preview) and saved next to the original as <sha256>.preview.jpg. Images
+    need Pillow; PDFs are rasterised with poppler's pdftoppm when it is on the
+    PATH. Anything else is marked unsupported and reviewers get the original.
+
+    Rendering never happens in a web worker. New blobs start out 'pending',
+    which is the queue: run_preview_worker processes claim them with a
+    conditional UPDATE to 'processing', so any number of workers can run.
+    """
+
+    @staticmethod
+    def preview_name(name):
+        return f'{os.path.splitext(name)[0]}.preview.jpg'
+
+    @staticmethod
+    def can_preview(name):
+        extension = os.path.splitext(name)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            return Image is not None
+        if extension in PDF_EXTENSIONS:
+            return shutil.which('pdftoppm') is not None
+        return False
+
+    @staticmethod
+    def claim(sha256):
+        """Move a pending blob to processing; False if another worker got it first"""
+        return bool(EvidenceBlob.objects.filter(pk=sha256, preview_status='pending').update(
+            preview_status='processing', preview_started_at=timezone.now()
+        ))
+
+    @classmethod
+    def claim_next(cls):
+        pending = EvidenceBlob.objects.filter(preview_status='pending').order_by('created_at')
+        for sha256 in pending.values_list('pk', flat=True)[:10]:
+            if cls.claim(sha256):
+                return sha256
+        return None
+
+    @staticmethod
+    def requeue_stale(max_age):
+        """Put blobs whose worker died (claimed more than max_age ago) back in the queue"""
+        return EvidenceBlob.objects.filter(
+            preview_status='processing', preview_started_at__lt=timezone.now() - max_age
+        ).update(preview_status='pending')
+
+    @classmethod
+    def process(cls, sha256):
+        """Generate a claimed blob's preview, marking it failed on any error. Returns the new preview_status."""
+        try:
+            return cls.generate(sha256)
+        except Exception:
+            logger.exception(f"[EVIDENCE_PREVIEW] Preview generation failed for {sha256}")
+            EvidenceBlob.objects.filter(pk=sha256).update(preview_status='failed')
+            return 'failed'
+
+    @classmethod
+    def generate(cls, sha256):
+        """Render and save the preview for one blob. Returns the new preview_status."""
+        blob = EvidenceBlob.objects.filter(pk=sha256).first()
+        if blob is None:
+            return None
+
+        if not cls.can_preview(blob.file.name):
+            EvidenceBlob.objects.filter(pk=sha256).update(preview_status='unsupported')
+            return 'unsupported'
+
+        size = getattr(settings, 'EVIDENCE_PREVIEW_SIZE', 800)
+        extension = os.path.splitext(blob.file.name)[1].lower()
+        if extension in PDF_EXTENSIONS:
+            content = cls._pdf_preview(blob.file, size)
+        else:
+            content = cls._image_preview(blob.file, size)
+
+        storage = blob.file.storage
+        name = cls.preview_name(blob.file.name)
+        if storage.exists(name):
+            storage.delete(name)
+        saved_name = storage.save(name, ContentFile(content))
+
+        updated = EvidenceBlob.objects.filter(pk=sha256).update(preview=saved_name, preview_status='ready')
+        if not updated:
+            # The blob was released while we were rendering
+            storage.delete(saved_name)
+            return None
+
+        logger.info(f"[EVIDENCE_PREVIEW] {blob.file.name}: {blob.size} -> {len(content)} bytes")
+        return 'ready'
+
+    @staticmethod
+    def _image_preview(field, size):
+        with field.open('rb'):
+            with Image.open(field) as image:
+                # Lets JPEG decode at a reduced scale instead of full resolution
+                image.draft('RGB', (size, size))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((size, size))
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=PREVIEW_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _pdf_preview(field, size):
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                source = field.path
+            except NotImplementedError:
+                # Remote storage - pdftoppm needs a local file
+                source = os.path.join(workdir, 'source.pdf')
+                with field.open('rb') as remote, open(source, 'wb') as local:
+                    shutil.copyfileobj(remote, local)
+
+            prefix = os.path.join(workdir, 'page')
+            subprocess.run(
+                [
+                    'pdftoppm', '-jpeg', '-jpegopt', f'quality={PREVIEW_QUALITY}',
+                    '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(size),
+                    source, prefix,
+                ],
+                check=True,
+                capture_output=True,
+                timeout=PDF_RENDER_TIMEOUT,
+            )
+            with open(f'{prefix}.jpg', 'rb') as rendered:
+                return rendered.read()
@@ -0,0 +1,591 @@
+"""
+Evidence file storage services
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import CompanyDataSubmission, EvidenceBlob, EvidenceUpload, StorageUsage
+
+logger = logging.getLogger(__name__)
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadError(Exception):
+    """Raised when a chunk can't be applied to an upload session"""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header doesn't overlap the file"""
+
+
+def parse_byte_range(header, size):
+    """
+    Parse a single-range ``Range: bytes=...`` header into (start, end), inclusive.
+
+    Returns None when the header should be ignored (malformed or multi-range),
+    in which case the whole file is served.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class RangeReader:
+    """Read-only view of ``length`` bytes of an open file from its current position"""
+
+    def __init__(self, file_obj, length):
+        self.file = file_obj
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class _MovableFile(File):
+    """File wrapper that lets FileSystemStorage move the part file instead of copying it"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def hash_file(file_obj):
+    """SHA-256 of a file object, read in blocks"""
+    hasher = hashlib.sha256()
+    if hasattr(file_obj, 'chunks'):
+        for block in file_obj.chunks(STREAM_BLOCK_SIZE):
+            hasher.update(block)
+    else:
+        for block in iter(lambda: file_obj.read(STREAM_BLOCK_SIZE), b''):
+            hasher.update(block)
+    file_obj.seek(0)
+    return hasher.hexdigest()
+
+
+class EvidenceStore:
+    """
+    Content-addressed evidence storage.
+
+    Each distinct file is stored once as an EvidenceBlob keyed by SHA-256.
+    Submissions point at the blob, and their evidence_file mirrors the blob's
+    path so existing URLs and serializers keep working. Attach and detach keep
+    the blob's ref_count in step, and a blob is deleted with its file when the
+    last submission lets go of it.
+    """
+
+    @staticmethod
+    def find(sha256, size=None, company_id=None):
+        """
+        The blob stored for this hash, if any.
+
+        With company_id, only a blob one of that company's submissions already
+        references is returned. Use it whenever the hash comes from the client
+        rather than from bytes the server has hashed itself, so a tenant can't
+        attach - or learn about - another tenant's files by hash alone.
+        """
+        blobs = EvidenceBlob.objects.filter(pk=sha256.lower())
+        if company_id is not None:
+            blobs = blobs.filter(submissions__company_id=company_id)
+        blob = blobs.first()
+        if blob and size is not None and blob.size != size:
+            return None
+        return blob
+
+    @staticmethod
+    def store(file_obj, sha256, size, filename):
+        """
+        Return the blob for this content, saving the file only if it is new.
+
+        Returns (blob, created). file_obj may be a Django File or UploadedFile;
+        temporary files are moved into place rather than copied.
+        """
+        blob = EvidenceStore.find(sha256)
+        if blob:
+            return blob, False
+
+        blob = EvidenceBlob(sha256=sha256, size=size)
+        blob.file.save(filename, file_obj, save=False)
+        try:
+            with transaction.atomic():
+                blob.save(force_insert=True)
+        except IntegrityError:
+            # Another worker stored the same content first - keep theirs
+            blob.file.storage.delete(blob.file.name)
+            return EvidenceBlob.objects.get(pk=sha256), False
+
+        # New blobs are 'pending', which queues them for run_preview_worker
+        return blob, True
+
+    @staticmethod
+    def store_upload(uploaded_file):
+        """Hash a request upload and store it, skipping the write when the content already exists"""
+        sha256 = hash_file(uploaded_file)
+        return EvidenceStore.store(uploaded_file, sha256, uploaded_file.size, uploaded_file.name)
+
+    @staticmethod
+    def _lock_evidence(submission):
+        """
+        Lock the submission's row and reload its evidence columns, so what is
+        released is what the row holds now rather than what the caller loaded.
+        Concurrent attaches then release the old blob once between them.
+        Call inside a transaction.
+        """
+        stored = CompanyDataSubmission.objects.select_for_update().filter(pk=submission.pk).values(
+            'evidence_blob_id', 'evidence_file'
+        ).first()
+        if stored is not None:
+            submission.evidence_blob_id = stored['evidence_blob_id']
+            submission.evidence_file = stored['evidence_file']
+        return submission
+
+    @staticmethod
+    def attach(submission, blob):
+        """Point a submission at a blob, releasing whatever evidence it had before"""
+        with transaction.atomic():
+            EvidenceStore._lock_evidence(submission)
+            if submission.evidence_blob_id == blob.pk:
+                return submission
+            EvidenceStore.detach(submission, save=False)
+            EvidenceBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+            submission.evidence_blob = blob
+            submission.evidence_file.name = blob.file.name
+            submission.save(update_fields=['evidence_blob', 'evidence_file', 'updated_at'])
+            StorageAccounting.adjust(submission.company_id, submission.site_id, blob.size, 1)
+        return submission
+
+    @staticmethod
+    def detach(submission, save=True):
+        """
+        Remove a submission's evidence, deleting the stored file once nothing
+        references it. With save=False the caller has locked the row and saves it.
+        """
+        if save:
+            with transaction.atomic():
+                EvidenceStore.detach(EvidenceStore._lock_evidence(submission), save=False)
+                submission.save(update_fields=['evidence_blob', 'evidence_file', 'updated_at'])
+            return submission
+
+        if submission.evidence_file:
+            StorageAccounting.adjust(
+                submission.company_id, submission.site_id, -StorageAccounting.evidence_size(submission), -1
+            )
+
+        if submission.evidence_blob_id:
+            EvidenceStore.release(submission.evidence_blob_id, releasing_submission_id=submission.pk)
+        elif submission.evidence_file:
+            # Legacy per-submission copy
+            submission.evidence_file.delete(save=False)
+
+        submission.evidence_blob = None
+        submission.evidence_file = None
+        return submission
+
+    @staticmethod
+    def release(sha256, releasing_submission_id=None, count=1):
+        """
+        Drop references to a blob and delete it when nothing points at it.
+
+        releasing_submission_id is the submission giving the blob up, when its
+        row still references the blob in the database. count releases several
+        references at once, for submissions deleted together.
+        """
+        with transaction.atomic():
+            blob = EvidenceBlob.objects.select_for_update().filter(pk=sha256).first()
+            if blob is None:
+                return
+            blob.ref_count = max(blob.ref_count - count, 0)
+            if blob.ref_count == 0:
+                # Confirm against the actual references before deleting anything
+                blob.ref_count = blob.submissions.exclude(pk=releasing_submission_id).count()
+            if blob.ref_count > 0:
+                blob.save(update_fields=['ref_count'])
+                return
+
+            names = [blob.file.name] + ([blob.preview.name] if blob.preview else [])
+            storage = blob.file.storage
+            # The FK is PROTECT, so unlink the releasing row before deleting
+            blob.submissions.update(evidence_blob=None, evidence_file='')
+            blob.delete()
+            transaction.on_commit(lambda: [storage.delete(name) for name in names])
+            logger.info(f"[EVIDENCE_STORE] Deleted unreferenced blob {sha256}")
+
+
+class StorageAccounting:
+    """
+    Per-company and per-site evidence storage counters.
+
+    Usage is logical: every submission with evidence counts its file's size,
+    even when the bytes are shared with other submissions through a blob.
+    Counters are adjusted as evidence is attached and removed, so reading them
+    never touches the filesystem; rebuild_storage_usage recomputes them.
+    """
+
+    @staticmethod
+    def evidence_size(submission):
+        if submission.evidence_blob_id:
+            size = EvidenceBlob.objects.filter(pk=submission.evidence_blob_id).values_list('size', flat=True).first()
+            return size or 0
+        try:
+            return submission.evidence_file.size
+        except (OSError, ValueError):
+            return 0  # Legacy file already gone from storage
+
+    @staticmethod
+    def adjust(company_id, site_id, bytes_delta, count_delta):
+        """Apply a delta; only increments create a missing counter row"""
+        if not bytes_delta and not count_delta:
+            return
+        counters = StorageUsage.objects.filter(company_id=company_id, site_id=site_id)
+        changes = {
+            'bytes_used': Greatest(F('bytes_used') + bytes_delta, 0),
+            'file_count': Greatest(F('file_count') + count_delta, 0),
+            'updated_at': timezone.now(),
+        }
+        if counters.update(**changes) or count_delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                StorageUsage.objects.create(
+                    company_id=company_id, site_id=site_id, bytes_used=bytes_delta, file_count=count_delta
+                )
+        except IntegrityError:
+            counters.update(**changes)  # Created concurrently
+
+    @staticmethod
+    def usage(company, site=None):
+        counters = StorageUsage.objects.filter(company=company).select_related('site').order_by('site__name')
+        if site is not None:
+            counters = counters.filter(site=site)
+        sites = [
+            {
+                'site_id': counter.site_id,
+                'site_name': counter.site.name if counter.site else None,
+                'bytes_used': counter.bytes_used,
+                'file_count': counter.file_count,
+            }
+            for counter in counters
+        ]
+        return {
+            'bytes_used': sum(entry['bytes_used'] for entry in sites),
+            'file_count': sum(entry['file_count'] for entry in sites),
+            'sites': sites,
+        }
+
+    @staticmethod
+    def rebuild(company_id=None):
+        """Recompute counters from the database (blob sizes) and storage (legacy files only)"""
+        submissions = CompanyDataSubmission.objects.exclude(evidence_file='')
+        if company_id:
+            submissions = submissions.filter(company_id=company_id)
+
+        totals = {}
+        for row in submissions.filter(evidence_blob__isnull=False).values('company_id', 'site_id').annotate(
+            bytes_used=Sum('evidence_blob__size'), file_count=Count('id')
+        ):
+            totals[(row['company_id'], row['site_id'])] = [row['bytes_used'], row['file_count']]
+
+        legacy = submissions.filter(evidence_blob__isnull=True).values_list('company_id', 'site_id', 'evidence_file')
+        for company, site, name in legacy.iterator(chunk_size=2000):
+            try:
+                size = default_storage.size(name)
+            except OSError:
+                continue
+            entry = totals.setdefault((company, site), [0, 0])
+            entry[0] += size
+            entry[1] += 1
+
+        with transaction.atomic():
+            existing = StorageUsage.objects.all()
+            if company_id:
+                existing = existing.filter(company_id=company_id)
+            existing.delete()
+            StorageUsage.objects.bulk_create([
+                StorageUsage(company_id=company, site_id=site, bytes_used=size, file_count=count)
+                for (company, site), (size, count) in totals.items()
+            ])
+        return totals
+
+
+class EvidenceGarbageCollector:
+    """
+    Finds evidence files in storage that nothing in the database points at.
+
+    Referenced names come from submissions (legacy per-submission files) and
+    blobs (originals and previews). Recently written files are skipped so an
+    upload that has saved its file but not yet its row is never collected.
+    """
+
+    ROOT = 'evidence'
+    QUARANTINE_ROOT = 'evidence_quarantine'
+
+    @staticmethod
+    def referenced_names():
+        names = set()
+        sources = [
+            CompanyDataSubmission.objects.exclude(evidence_file='').values_list('evidence_file', flat=True),
+            EvidenceBlob.objects.values_list('file', flat=True),
+            EvidenceBlob.objects.exclude(preview='').values_list('preview', flat=True),
+        ]
+        for source in sources:
+            names.update(source.iterator(chunk_size=5000))
+        return names
+
+    @classmethod
+    def stored_files(cls, storage=default_storage, path=None):
+        """Yield (name, size, modified_timestamp) for every file under the evidence root"""
+        path = path or cls.ROOT
+        try:
+            directories, files = storage.listdir(path)
+        except FileNotFoundError:
+            return
+        for filename in files:
+            name = f'{path}/{filename}'
+            yield name, storage.size(name), storage.get_modified_time(name).timestamp()
+        for directory in directories:
+            yield from cls.stored_files(storage, f'{path}/{directory}')
+
+    @classmethod
+    def unreferenced_files(cls, min_age_seconds=3600, storage=default_storage):
+        referenced = cls.referenced_names()
+        cutoff = time.time() - min_age_seconds
+        for name, size, modified in cls.stored_files(storage):
+            if name not in referenced and modified < cutoff:
+                yield name, size
+
+    @classmethod
+    def quarantine(cls, name, stamp, storage=default_storage):
+        """Move a file under evidence_quarantine/<stamp>/ instead of deleting it"""
+        target = f'{cls.QUARANTINE_ROOT}/{stamp}/{name}'
+        try:
+            source_path, target_path = storage.path(name), storage.path(target)
+        except NotImplementedError:
+            with storage.open(name, 'rb') as source:
+                storage.save(target, source)
+        else:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(source_path, target_path)
+            return target
+        storage.delete(name)
+        return target
+
+    @staticmethod
+    def delete(name, storage=default_storage):
+        storage.delete(name)
+
+    @staticmethod
+    def stale_uploads(max_age_seconds):
+        """Pending chunked uploads nobody has touched for max_age_seconds"""
+        cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+        return EvidenceUpload.objects.filter(status='pending', updated_at__lt=cutoff)
+
+
+class ChunkedUploadService:
+    """Writes resumable evidence uploads straight to disk under MEDIA_ROOT"""
+
+    # upload id -> (offset, hasher, last used). hashlib objects can't be persisted,
+    # so the running hash is a per-worker cache: a worker that missed earlier
+    # chunks rebuilds it from the part file, and idle or surplus entries expire.
+    _running_hashes = OrderedDict()
+    RUNNING_HASH_TTL = 60 * 60
+    RUNNING_HASH_LIMIT = 256
+
+    @staticmethod
+    def upload_dir():
+        path = os.path.join(settings.MEDIA_ROOT, 'evidence_uploads')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def part_path(upload):
+        return os.path.join(ChunkedUploadService.upload_dir(), f'{upload.id}.part')
+
+    @staticmethod
+    def parse_content_range(header, content_length, upload):
+        """Return (start, end) for a chunk; without a header the chunk is appended at the current offset"""
+        offset = upload.received_bytes
+        if not header:
+            return offset, offset + content_length - 1
+
+        match = CONTENT_RANGE_RE.match(header.strip())
+        if not match:
+            raise UploadError('Invalid Content-Range header', offset)
+        start, end = int(match.group(1)), int(match.group(2))
+        if end < start:
+            raise UploadError('Invalid Content-Range header', offset)
+        if match.group(3) != '*' and int(match.group(3)) != upload.total_size:
+            raise UploadError('Content-Range total does not match the upload size', offset)
+        return start, end
+
+    @classmethod
+    def write_chunk(cls, upload, stream, start, end):
+        """
+        Stream one byte range from the request body to the part file.
+
+        Chunks must be contiguous: a range starting past the current offset is
+        rejected, and bytes we already have are skipped so a retried chunk is
+        harmless. The caller holds the upload row locked, so upload.received_bytes
+        is the offset no other request is writing from. Returns the new offset.
+        """
+        offset = upload.received_bytes
+        if start > offset:
+            raise UploadError('Chunk does not start at the current offset', offset)
+        if end >= upload.total_size:
+            raise UploadError('Chunk extends past the declared file size', offset)
+
+        length = end - start + 1
+        skip = offset - start
+        if skip >= length:
+            return offset  # Already received this range
+
+        hasher = cls._running_hash(upload, offset)
+
+        # Discard the part of a retried chunk we already have
+        while skip > 0:
+            data = stream.read(min(STREAM_BLOCK_SIZE, skip))
+            if not data:
+                return offset
+            skip -= len(data)
+
+        path = cls.part_path(upload)
+        remaining = length - (offset - start)
+        written = 0
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+            part.seek(offset)
+            while remaining > 0:
+                data = stream.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not data:
+                    break  # Connection dropped - keep what arrived so the client can resume
+                part.write(data)
+                if hasher is not None:
+                    hasher.update(data)
+                written += len(data)
+                remaining -= len(data)
+            part.truncate(offset + written)
+
+        new_offset = offset + written
+        if hasher is not None:
+            cls._remember_hash(upload.id, new_offset, hasher)
+        return new_offset
+
+    @classmethod
+    def _running_hash(cls, upload, offset):
+        """The hash of the first offset bytes, rebuilt from the part file when this worker doesn't have it"""
+        entry = cls._running_hashes.pop(upload.id, None)
+        if entry and entry[0] == offset:
+            return entry[1]
+
+        hasher = hashlib.sha256()
+        if offset == 0:
+            return hasher
+        try:
+            with open(cls.part_path(upload), 'rb') as part:
+                remaining = offset
+                while remaining > 0:
+                    block = part.read(min(STREAM_BLOCK_SIZE, remaining))
+                    if not block:
+                        return None  # Part file is short; finalize re-hashes whatever is on disk
+                    hasher.update(block)
+                    remaining -= len(block)
+        except FileNotFoundError:
+            return None
+        return hasher
+
+    @classmethod
+    def _remember_hash(cls, upload_id, offset, hasher):
+        now = time.monotonic()
+        cls._running_hashes[upload_id] = (offset, hasher, now)
+        cls._running_hashes.move_to_end(upload_id)
+        # Entries are kept in last-used order, so expired ones are at the front
+        while cls._running_hashes:
+            oldest_id, (_, _, last_used) = next(iter(cls._running_hashes.items()))
+            if len(cls._running_hashes) <= cls.RUNNING_HASH_LIMIT and now - last_used < cls.RUNNING_HASH_TTL:
+                break
+            del cls._running_hashes[oldest_id]
+
+    @classmethod
+    def file_hash(cls, upload):
+        """SHA-256 of the part file, from the running hash when this worker has it"""
+        entry = cls._running_hashes.pop(upload.id, None)
+        if entry and entry[0] == upload.total_size:
+            return entry[1].hexdigest()
+
+        hasher = hashlib.sha256()
+        with open(cls.part_path(upload), 'rb') as part:
+            for block in iter(lambda: part.read(STREAM_BLOCK_SIZE), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    @classmethod
+    def attach_to_submission(cls, upload, sha256):
+        """
+        Attach the finished upload to its submission through the evidence store.
+
+        New content is moved from the part file into blob storage without a
+        copy; content that is already stored is attached and the part discarded.
+        Returns (submission, deduplicated). deduplicated only reports content
+        the upload's company already held, so the response says nothing about
+        other companies' files.
+        """
+        blob = EvidenceStore.find(sha256, upload.total_size, company_id=upload.company_id)
+        deduplicated = blob is not None
+        if blob is None:
+            # store() reuses content another company holds and only moves the part file when it is new
+            with open(cls.part_path(upload), 'rb') as part:
+                blob, _ = EvidenceStore.store(_MovableFile(part), sha256, upload.total_size, upload.filename)
+        cls.discard(upload)
+        return EvidenceStore.attach(upload.submission, blob), deduplicated
+
+    @classmethod
+    def discard(cls, upload):
+        cls._running_hashes.pop(upload.id, None)
+        try:
+            os.remove(cls.part_path(upload))
+        except FileNotFoundError:
+            pass
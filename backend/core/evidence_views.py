@@ -0,0 +1,387 @@
+"""
+Evidence file API views
+"""
+import logging
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .authentication import CsrfExemptSessionAuthentication
+from .evidence_service import (
+    STREAM_BLOCK_SIZE, ChunkedUploadService, EvidenceStore, RangeNotSatisfiable, RangeReader,
+    UploadError, parse_byte_range
+)
+from .exports import EvidenceArchiveExporter
+from .models import CompanyDataSubmission, EvidenceUpload, Site
+from .serializers import CompanyDataSubmissionSerializer
+from .views import get_user_company, submissions_not_editable
+
+logger = logging.getLogger(__name__)
+
+
+def _upload_state(upload):
+    return {
+        'id': str(upload.id),
+        'submission_id': upload.submission_id,
+        'filename': upload.filename,
+        'total_size': upload.total_size,
+        'offset': upload.received_bytes,
+        'status': upload.status,
+        'sha256': upload.sha256 or None,
+        'chunk_size': getattr(settings, 'EVIDENCE_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024),
+    }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class EvidenceUploadViewSet(viewsets.ViewSet):
+    """
+    Resumable chunked evidence uploads.
+
+    POST   /evidence-uploads/                    start: {submission_id, filename, size, sha256?}
+    PUT    /evidence-uploads/{id}/               raw bytes with Content-Range: bytes start-end/total
+    GET    /evidence-uploads/{id}/               current offset, for resuming
+    POST   /evidence-uploads/{id}/finalize/      verify and attach to the submission
+    DELETE /evidence-uploads/{id}/               abort
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def _get_upload(self, pk, lock=False, edit=False):
+        """The upload, if the user's company owns it; with edit, only if they may also edit its submission"""
+        uploads = EvidenceUpload.objects.select_related(
+            'submission__framework_element', 'submission__element', 'submission__meter', 'submission__evidence_blob'
+        )
+        if lock:
+            uploads = uploads.select_for_update(of=('self',))  # Only the upload row; the joined rows stay unlocked
+        upload = get_object_or_404(uploads, pk=pk)
+        company = get_user_company(self.request.user, upload.company_id)
+        if edit and submissions_not_editable(self.request.user, company, [upload.submission]):
+            raise PermissionDenied("You don't have permission to edit this submission")
+        return upload
+
+    def create(self, request):
+        submission_id = request.data.get('submission_id')
+        filename = os.path.basename(str(request.data.get('filename') or ''))
+
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+
+        if not submission_id or not filename or size <= 0:
+            return Response(
+                {'error': 'submission_id, filename and a positive size are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_size = getattr(settings, 'EVIDENCE_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+        if size > max_size:
+            return Response(
+                {'error': f'File exceeds the maximum evidence size of {max_size} bytes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        submission = get_object_or_404(CompanyDataSubmission, pk=submission_id)
+        try:
+            company = get_user_company(request.user, submission.company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        if submissions_not_editable(request.user, company, [submission]):
+            return Response(
+                {'error': "You don't have permission to edit this submission"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # Skip the transfer when the client's hash matches a file this company already holds. Content
+        # stored only by other companies is uploaded in full and deduplicated once the server hashed it.
+        sha256 = str(request.data.get('sha256') or '').lower()
+        blob = EvidenceStore.find(sha256, size, company_id=submission.company_id) if sha256 else None
+        if blob is not None:
+            EvidenceStore.attach(submission, blob)
+            upload = EvidenceUpload.objects.create(
+                company_id=submission.company_id,
+                submission=submission,
+                user=request.user,
+                filename=filename,
+                total_size=size,
+                received_bytes=size,
+                sha256=blob.sha256,
+                status='complete',
+            )
+            return Response({
+                **_upload_state(upload),
+                'deduplicated': True,
+                'submission': CompanyDataSubmissionSerializer(submission).data,
+            })
+
+        upload = EvidenceUpload.objects.create(
+            company_id=submission.company_id,
+            submission=submission,
+            user=request.user,
+            filename=filename,
+            total_size=size,
+        )
+        return Response(_upload_state(upload), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        try:
+            upload = self._get_upload(pk)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        return Response(_upload_state(upload))
+
+    def update(self, request, pk=None):
+        """Append one chunk. The body is read from the raw stream, never buffered whole."""
+        # Chunks for one upload are applied one at a time: the row lock makes a racing
+        # chunk wait for the offset this one leaves, instead of writing from the same offset
+        with transaction.atomic():
+            try:
+                upload = self._get_upload(pk, lock=True, edit=True)
+            except PermissionDenied as e:
+                return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+            if upload.status == 'complete':
+                return Response(
+                    {'error': 'Upload already finalized', **_upload_state(upload)},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+                start, end = ChunkedUploadService.parse_content_range(
+                    request.META.get('HTTP_CONTENT_RANGE'), content_length, upload
+                )
+                upload.received_bytes = ChunkedUploadService.write_chunk(upload, request._request, start, end)
+            except UploadError as e:
+                return Response(
+                    {'error': str(e), 'offset': e.offset},
+                    status=status.HTTP_409_CONFLICT
+                )
+            upload.save(update_fields=['received_bytes', 'updated_at'])
+        return Response(_upload_state(upload))
+
+    def destroy(self, request, pk=None):
+        try:
+            upload = self._get_upload(pk)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        ChunkedUploadService.discard(upload)
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Check the upload is complete, hash it and attach it to the submission"""
+        # Locked like update, so a repeated finalize waits and then sees the upload completed
+        # instead of hashing a part file the first one has already moved into the store
+        with transaction.atomic():
+            try:
+                upload = self._get_upload(pk, lock=True, edit=True)
+            except PermissionDenied as e:
+                return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+            if upload.status == 'complete':
+                return Response({'upload': _upload_state(upload)})
+
+            if not upload.is_complete:
+                return Response(
+                    {'error': 'Upload is incomplete', 'offset': upload.received_bytes},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            digest = ChunkedUploadService.file_hash(upload)
+            expected = request.data.get('sha256')
+            if expected and expected.lower() != digest:
+                return Response(
+                    {'error': 'Checksum mismatch', 'sha256': digest},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            submission, deduplicated = ChunkedUploadService.attach_to_submission(upload, digest)
+            upload.sha256 = digest
+            upload.status = 'complete'
+            upload.save(update_fields=['sha256', 'status', 'updated_at'])
+
+        logger.info(f"[EVIDENCE_UPLOAD] Attached {upload.filename} ({upload.total_size} bytes) to submission {submission.id}"
+                    f"{' (deduplicated)' if deduplicated else ''}")
+        return Response({
+            'upload': _upload_state(upload),
+            'deduplicated': deduplicated,
+            'submission': CompanyDataSubmissionSerializer(submission).data,
+        })
+
+
+class EvidenceDownloadView(APIView):
+    """
+    Authenticated, tenant-checked evidence download.
+
+    GET /api/evidence/{submission_id}/              original file, inline
+    GET /api/evidence/{submission_id}/?download=1   as an attachment
+    GET /api/evidence/{submission_id}/?preview=1    downscaled preview, once generated
+
+    Files are streamed in blocks and never read whole into the worker. Single
+    byte ranges (206), If-Range and the usual conditional headers are honoured.
+    With EVIDENCE_DOWNLOAD_MODE set to 'x-accel-redirect' (nginx) or
+    'x-sendfile' (Apache/lighttpd) the view only checks access and hands the
+    transfer, including ranges, to the web server.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, submission_id):
+        submission = get_object_or_404(
+            CompanyDataSubmission.objects.select_related('evidence_blob'), pk=submission_id
+        )
+        try:
+            get_user_company(request.user, submission.company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        blob = submission.evidence_blob
+        preview = request.query_params.get('preview') in ('1', 'true')
+        if preview:
+            if not blob or blob.preview_status != 'ready' or not blob.preview:
+                return Response({'error': 'No preview available'}, status=status.HTTP_404_NOT_FOUND)
+            field = blob.preview
+        else:
+            field = submission.evidence_file
+        if not field:
+            return Response({'error': 'No evidence file'}, status=status.HTTP_404_NOT_FOUND)
+
+        storage, name = field.storage, field.name
+        try:
+            size = storage.size(name)
+            last_modified = int(storage.get_modified_time(name).timestamp())
+        except (OSError, NotImplementedError):
+            logger.warning(f"[EVIDENCE_DOWNLOAD] {name} for submission {submission.id} is missing from storage")
+            return Response({'error': 'Evidence file is missing'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Blob content never changes for a given hash, so the hash is a strong validator
+        if blob and field.name in (blob.file.name, blob.preview.name):
+            etag = quote_etag(f"{blob.sha256}{'-preview' if preview else ''}")
+        else:
+            etag = quote_etag(f'{size:x}-{last_modified:x}')
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            mode = getattr(settings, 'EVIDENCE_DOWNLOAD_MODE', 'django')
+            if mode in ('x-accel-redirect', 'x-sendfile'):
+                response = self._offload(mode, storage, name)
+            else:
+                response = self._stream(request, storage, name, size, etag, last_modified)
+            if response.status_code != status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE:
+                response['Content-Disposition'] = content_disposition_header(
+                    request.query_params.get('download') in ('1', 'true'), os.path.basename(name)
+                )
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        # Private to the tenant, and revalidated since a submission's evidence can be replaced
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @staticmethod
+    def _stream(request, storage, name, size, etag, last_modified):
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and EvidenceDownloadView._if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_byte_range(range_header, size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        handle = storage.open(name, 'rb')
+        if byte_range is None:
+            response = FileResponse(handle, filename=os.path.basename(name))
+        else:
+            start, end = byte_range
+            handle.seek(start)
+            response = FileResponse(
+                RangeReader(handle, end - start + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        response.block_size = STREAM_BLOCK_SIZE
+        return response
+
+    @staticmethod
+    def _if_range_matches(request, etag, last_modified):
+        """A Range only applies if the client's If-Range still matches the file"""
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range:
+            return True
+        if if_range.startswith('"'):
+            return if_range == etag
+        if if_range.startswith('W/'):
+            return False  # Weak validators can't be used with ranges
+        return parse_http_date_safe(if_range) == last_modified
+
+    @staticmethod
+    def _offload(mode, storage, name):
+        response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        if mode == 'x-accel-redirect':
+            prefix = getattr(settings, 'EVIDENCE_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{quote(name)}"
+        else:
+            response['X-Sendfile'] = storage.path(name)
+        return response
+
+
+class EvidenceExportView(APIView):
+    """
+    Stream every evidence file for a company and reporting year as one ZIP.
+
+    GET /api/evidence/export/?company_id=1&year=2025[&site_id=3]
+
+    The archive is built while it is sent and includes manifest.csv mapping
+    each file to its site, element, meter and period.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        company_id = request.query_params.get('company_id')
+        year = request.query_params.get('year')
+        site_id = request.query_params.get('site_id')
+        if not company_id or not year or not year.isdigit() or (site_id and not site_id.isdigit()):
+            return Response({'error': 'company_id and a numeric year are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            company = get_user_company(request.user, company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+        site = None
+        if site_id:
+            site = get_object_or_404(Site, pk=site_id, company=company)
+
+        submissions = EvidenceArchiveExporter.submissions(company, int(year), site_id=site_id)
+        logger.info(f"[EVIDENCE_EXPORT] {request.user.username} exporting evidence for {company.company_code} {year}")
+
+        response = StreamingHttpResponse(EvidenceArchiveExporter.stream(submissions), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(
+            True, EvidenceArchiveExporter.filename(company, year, site)
+        )
+        patch_cache_control(response, private=True, no_store=True)
+        return response
@@ -0,0 +1,292 @@
+"""
+Streaming exports - archives are generated on the fly, never held in memory or on disk
+"""
+import csv
+import io
+import logging
+import os
+import re
+import tempfile
+import zipfile
+
+from django.urls import reverse
+
+from .db_router import read_from_replica
+from .evidence_service import STREAM_BLOCK_SIZE
+from .models import MONTH_ORDER, CompanyDataSubmission
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    # openpyxl is optional - only CSV exports are available without it
+    Workbook = None
+
+logger = logging.getLogger(__name__)
+
+# Formats that are already compressed - deflating them again only costs CPU
+STORED_EXTENSIONS = {
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.gz',
+    '.docx', '.xlsx', '.pptx', '.mp4', '.heic',
+}
+
+MANIFEST_COLUMNS = [
+    'file', 'submission_id', 'site', 'element_id', 'element_name', 'meter', 'meter_type',
+    'reporting_year', 'reporting_period', 'value', 'sha256', 'size', 'updated_at', 'status',
+]
+
+
+class _StreamBuffer:
+    """Write-only sink that hands back whatever zipfile wrote since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _safe_name(value):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(value)).strip('_') or 'unknown'
+
+
+class EvidenceArchiveExporter:
+    """
+    Builds a ZIP of a company's evidence for one reporting year.
+
+    The archive is produced by a generator: zipfile writes into a small
+    buffer that is drained after every block, so memory use stays at one
+    block regardless of archive size. Files shared through the evidence
+    store are added once and referenced by every submission in the manifest.
+    """
+
+    @staticmethod
+    def submissions(company, year, site_id=None):
+        queryset = CompanyDataSubmission.objects.filter(
+            company=company, reporting_year=year
+        ).exclude(evidence_file='').select_related('site', 'framework_element', 'element', 'meter', 'evidence_blob')
+        if site_id:
+            queryset = queryset.filter(site_id=site_id)
+        return queryset.order_by('site__name', 'framework_element_id', 'meter_id', 'id')
+
+    @staticmethod
+    def filename(company, year, site=None):
+        parts = [company.company_code, str(year)] + ([_safe_name(site.name)] if site else []) + ['evidence']
+        return f"{'_'.join(parts)}.zip"
+
+    @staticmethod
+    def _arcname(submission, used_names):
+        element = submission.element_instance
+        element_id = getattr(element, 'element_id', None) or getattr(element, 'id', 'unknown')
+        period = submission.reporting_period
+        period_label = f'{MONTH_ORDER[period]:02d}-{period}' if period in MONTH_ORDER else _safe_name(period)
+        parts = [_safe_name(element_id)]
+        if submission.meter_id:
+            parts.append(_safe_name(submission.meter.name))
+        parts.append(os.path.basename(submission.evidence_file.name))
+
+        site = _safe_name(submission.site.name) if submission.site_id else 'company'
+        name = f"{site}/{period_label}/{'_'.join(parts)}"
+        base, extension = os.path.splitext(name)
+        counter = 1
+        while name in used_names:
+            counter += 1
+            name = f'{base}_{counter}{extension}'
+        used_names.add(name)
+        return name
+
+    @classmethod
+    @read_from_replica
+    def stream(cls, submissions):
+        """Yield the ZIP archive in chunks"""
+        buffer = _StreamBuffer()
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(MANIFEST_COLUMNS)
+
+        archived = {}  # storage name -> arcname, so shared blobs are written once
+        used_names = set()
+
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for submission in submissions.iterator(chunk_size=500):
+                field = submission.evidence_file
+                element = submission.element_instance
+                row_status = 'included'
+                size = None
+
+                if field.name in archived:
+                    arcname = archived[field.name]
+                    row_status = 'included (shared)'
+                else:
+                    arcname = cls._arcname(submission, used_names)
+                    try:
+                        size = field.storage.size(field.name)
+                        yield from cls._write_member(archive, buffer, field, arcname, size, submission.updated_at)
+                        archived[field.name] = arcname
+                    except OSError:
+                        logger.warning(f"[EVIDENCE_EXPORT] {field.name} for submission {submission.id} is missing")
+                        arcname, row_status = '', 'missing'
+
+                writer.writerow([
+                    arcname,
+                    submission.id,
+                    submission.site.name if submission.site_id else '',
+                    getattr(element, 'element_id', None) or getattr(element, 'id', ''),
+                    submission.element_name,
+                    submission.meter.name if submission.meter_id else '',
+                    submission.meter.type if submission.meter_id else '',
+                    submission.reporting_year,
+                    submission.reporting_period,
+                    submission.value,
+                    submission.evidence_blob_id or '',
+                    submission.evidence_blob.size if submission.evidence_blob_id else (size if size is not None else ''),
+                    submission.updated_at.isoformat(),
+                    row_status,
+                ])
+
+            archive.writestr('manifest.csv', manifest.getvalue().encode('utf-8-sig'))
+        yield buffer.drain()
+
+    @staticmethod
+    def _write_member(archive, buffer, field, arcname, size, modified):
+        extension = os.path.splitext(arcname)[1].lower()
+        info = zipfile.ZipInfo(arcname, date_time=modified.timetuple()[:6])
+        info.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        info.file_size = size  # Lets zipfile pick zip64 headers up front for very large files
+
+        with field.storage.open(field.name, 'rb') as source, archive.open(info, mode='w') as member:
+            for block in iter(lambda: source.read(STREAM_BLOCK_SIZE), b''):
+                member.write(block)
+                data = buffer.drain()
+                if data:
+                    yield data
+        yield buffer.drain()  # Data descriptor written on close
+
+
+class SubmissionExporter:
+    """
+    Streams CompanyDataSubmission rows as CSV or XLSX.
+
+    Rows are read with values_list() over iterator(chunk_size), already joined
+    to site, element and meter names, so no model instances are built and
+    memory stays flat however many rows there are.
+    """
+
+    CHUNK_SIZE = 2000
+
+    # (header, values_list lookup)
+    COLUMNS = [
+        ('submission_id', 'id'),
+        ('site', 'site__name'),
+        ('framework', 'framework_element__framework_id'),
+        ('element_id', 'framework_element_id'),
+        ('element_name', 'framework_element__name_plain'),
+        ('legacy_element', 'element__name'),
+        ('category', 'framework_element__category'),
+        ('unit', 'framework_element__unit'),
+        ('meter', 'meter__name'),
+        ('meter_type', 'meter__type'),
+        ('reporting_year', 'reporting_year'),
+        ('reporting_period', 'reporting_period'),
+        ('value', 'value'),
+        ('evidence_url', 'evidence_file'),  # Exported as the authenticated download URL, never the storage path
+        ('assigned_to', 'assigned_to__username'),
+        ('updated_at', 'updated_at'),
+    ]
+
+    @staticmethod
+    def submissions(company, year=None, site_id=None, framework_id=None):
+        queryset = CompanyDataSubmission.objects.filter(company=company)
+        if year:
+            queryset = queryset.filter(reporting_year=year)
+        if site_id:
+            queryset = queryset.filter(site_id=site_id)
+        if framework_id:
+            queryset = queryset.filter(framework_element__framework_id=framework_id)
+        return queryset.order_by('site__name', 'reporting_year', 'framework_element_id', 'meter_id', 'id')
+
+    @staticmethod
+    def xlsx_available():
+        return Workbook is not None
+
+    @classmethod
+    def headers(cls):
+        return [header for header, _ in cls.COLUMNS] + ['status']
+
+    @classmethod
+    def rows(cls, queryset):
+        lookups = [lookup for _, lookup in cls.COLUMNS]
+        value_index = lookups.index('value')
+        evidence_index = lookups.index('evidence_file')
+        for row in queryset.values_list(*lookups).iterator(chunk_size=cls.CHUNK_SIZE):
+            row = list(row)
+            row[-1] = row[-1].isoformat() if row[-1] else ''
+            row_status = cls._status(row[value_index], row[evidence_index])
+            row[evidence_index] = reverse('evidence-download', args=[row[0]]) if row[evidence_index] else ''
+            yield row + [row_status]
+
+    @staticmethod
+    def _status(value, evidence_file):
+        # Mirrors CompanyDataSubmission.status without building the instance
+        if value == 'INACTIVE_PERIOD':
+            return 'inactive'
+        has_value = bool(value and value.strip())
+        if has_value and evidence_file:
+            return 'complete'
+        if has_value or evidence_file:
+            return 'partial'
+        return 'missing'
+
+    @classmethod
+    @read_from_replica
+    def stream_csv(cls, queryset, rows_per_chunk=500):
+        """Yield the CSV in chunks of rows_per_chunk rows"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')  # BOM so Excel detects UTF-8
+        writer.writerow(cls.headers())
+
+        pending = 0
+        for row in cls.rows(queryset):
+            writer.writerow(row)
+            pending += 1
+            if pending >= rows_per_chunk:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue().encode('utf-8')
+
+    @classmethod
+    @read_from_replica
+    def stream_xlsx(cls, queryset):
+        """
+        Yield an XLSX workbook built by openpyxl in write-only mode.
+
+        Write-only sheets spool rows to temporary files, and the finished
+        workbook is written to a temporary file and streamed from there, so
+        memory doesn't grow with the row count. Raises RuntimeError when
+        openpyxl isn't installed.
+        """
+        if Workbook is None:
+            raise RuntimeError('XLSX export requires openpyxl')
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Submissions')
+        sheet.append(cls.headers())
+        for row in cls.rows(queryset):
+            sheet.append(row)
+
+        with tempfile.TemporaryFile() as output:
+            workbook.save(output)
+            output.seek(0)
+            for block in iter(lambda: output.read(STREAM_BLOCK_SIZE), b''):
+                yield block
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import CompanyDataSubmission
+from core.reports import DataVersion
+from core.rollups import ConsumptionRollups
+
+
+class Command(BaseCommand):
+    help = 'Fill value_numeric and value_normalized on submissions from their text values, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-id', type=int, help='Only backfill this company')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Submissions updated per transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every row, not just rows with a value but no value_numeric')
+
+    def handle(self, *args, **options):
+        queryset = CompanyDataSubmission.objects.exclude(value='')
+        if not options['all']:
+            queryset = queryset.filter(value_numeric__isnull=True)
+        if options['company_id']:
+            queryset = queryset.filter(company_id=options['company_id'])
+        queryset = queryset.select_related('framework_element', 'element').only(
+            'id', 'company_id', 'site_id', 'meter_id', 'reporting_year', 'reporting_period',
+            'value', 'value_numeric', 'value_normalized', 'framework_element__unit', 'element__unit'
+        ).order_by('pk')
+
+        # Walk by primary key so each batch is an index range scan, not a growing OFFSET
+        last_pk = 0
+        scanned = changed = 0
+        companies = set()
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            scanned += len(batch)
+
+            dirty, changes = [], []
+            for submission in batch:
+                before = (submission.value_numeric, submission.value_normalized)
+                snapshot = ConsumptionRollups.snapshot(submission)
+                submission.refresh_numeric_value()
+                if (submission.value_numeric, submission.value_normalized) != before:
+                    dirty.append(submission)
+                    changes.append((snapshot, ConsumptionRollups.snapshot(submission)))
+                    companies.add(submission.company_id)
+
+            if dirty:
+                with transaction.atomic():
+                    CompanyDataSubmission.objects.bulk_update(dirty, CompanyDataSubmission.NUMERIC_FIELDS)
+                    ConsumptionRollups.apply_changes(changes)
+                changed += len(dirty)
+            self.stdout.write(f'  ...{scanned} scanned, {changed} updated')
+
+        # Reports that read value_numeric must not serve results computed before the backfill
+        for company_id in companies:
+            DataVersion.bump(company_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Backfilled {changed} of {scanned} submissions across {len(companies)} companies'
+        ))
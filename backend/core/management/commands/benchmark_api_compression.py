@@ -0,0 +1,127 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils.text import compress_string
+
+from core.middleware import brotli
+
+
+class Command(BaseCommand):
+    help = ('Measure response size and latency of the large API endpoints with and without compression, '
+            'the cost of each brotli quality, and the savings on small bodies behind API_COMPRESSION_MIN_SIZE')
+
+    BROTLI_QUALITIES = [1, 4, 6, 9, 11]
+    SMALL_SIZES = [256, 512, 1024, 1460, 2048, 4096]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User to run the requests as')
+        parser.add_argument('--company-id', type=int, required=True)
+        parser.add_argument('--site-id', type=int, help='Limit tasks/checklist to one site (default: All Locations)')
+        parser.add_argument('--year', type=int, default=2025)
+        parser.add_argument('--month', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per endpoint and encoding')
+        parser.add_argument('--bandwidth-mbps', type=float, default=10.0,
+                            help='Link speed used to estimate transfer time')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' not found")
+
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+
+        scope = {'company_id': options['company_id']}
+        if options['site_id']:
+            scope['site_id'] = options['site_id']
+
+        endpoints = [
+            ('tasks', '/api/data-collection/tasks/', dict(scope, year=options['year'], month=options['month'])),
+            ('checklist', '/api/checklist/', scope),
+            ('framework-elements', '/api/framework-elements/', {}),
+            ('users', '/api/users/', {}),
+        ]
+        encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+        bytes_per_ms = options['bandwidth_mbps'] * 1_000_000 / 8 / 1000
+
+        self.stdout.write(
+            f"{'endpoint':<20}{'encoding':<10}{'bytes':>10}{'ratio':>8}{'server ms':>11}{'transfer ms':>13}{'total ms':>10}"
+        )
+        bodies = {}
+        for name, path, params in endpoints:
+            baseline = None
+            for encoding in encodings:
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    response = client.get(path, params, HTTP_ACCEPT_ENCODING=encoding)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                if response.status_code != 200:
+                    self.stdout.write(self.style.WARNING(f'{name:<20}{encoding:<10} HTTP {response.status_code}'))
+                    break
+
+                size = len(response.content)
+                if encoding == 'identity':
+                    bodies[name] = response.content
+                baseline = baseline or size
+                server_ms = statistics.median(timings)
+                transfer_ms = size / bytes_per_ms
+                self.stdout.write(
+                    f'{name:<20}{encoding:<10}{size:>10}{size / baseline:>8.2f}'
+                    f'{server_ms:>11.1f}{transfer_ms:>13.1f}{server_ms + transfer_ms:>10.1f}'
+                )
+
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('brotli is not installed - only gzip was measured'))
+        self.encoder_table(bodies, options['repeat'], bytes_per_ms)
+        if bodies:
+            self.small_body_table(max(bodies.values(), key=len), options['repeat'])
+
+    def encoder_table(self, bodies, repeat, bytes_per_ms):
+        """Size and compression time of each encoder setting on the identity bodies"""
+        encoders = [('gzip', compress_string)]
+        if brotli is not None:
+            encoders += [
+                (f'br q{quality}', lambda body, quality=quality: brotli.compress(body, quality=quality))
+                for quality in self.BROTLI_QUALITIES
+            ]
+
+        self.stdout.write(f"\n{'endpoint':<20}{'encoder':<10}{'bytes':>10}{'ratio':>8}{'encode ms':>11}{'total ms':>10}")
+        for name, body in bodies.items():
+            for label, encode in encoders:
+                size, encode_ms = self.measure(encode, body, repeat)
+                self.stdout.write(
+                    f'{name:<20}{label:<10}{size:>10}{size / len(body):>8.2f}'
+                    f'{encode_ms:>11.2f}{encode_ms + size / bytes_per_ms:>10.1f}'
+                )
+        self.stdout.write(f'(brotli quality in use: {getattr(settings, "API_COMPRESSION_BROTLI_QUALITY", 4)})')
+
+    def small_body_table(self, body, repeat):
+        """What compressing a body of each size saves, as a prefix of a real response"""
+        quality = getattr(settings, 'API_COMPRESSION_BROTLI_QUALITY', 4)
+        self.stdout.write(f"\n{'body bytes':>10}{'gzip':>8}{'gzip us':>9}" + (f"{'br':>8}{'br us':>9}" if brotli else ''))
+        for length in self.SMALL_SIZES:
+            chunk = body[:length]
+            gzip_size, gzip_ms = self.measure(compress_string, chunk, repeat)
+            line = f'{len(chunk):>10}{gzip_size:>8}{gzip_ms * 1000:>9.0f}'
+            if brotli is not None:
+                br_size, br_ms = self.measure(lambda data: brotli.compress(data, quality=quality), chunk, repeat)
+                line += f'{br_size:>8}{br_ms * 1000:>9.0f}'
+            self.stdout.write(line)
+        self.stdout.write(f'(API_COMPRESSION_MIN_SIZE: {getattr(settings, "API_COMPRESSION_MIN_SIZE", 1024)})')
+
+    @staticmethod
+    def measure(encode, body, repeat):
+        """(compressed size, median milliseconds) of encode(body)"""
+        timings = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            compressed = encode(body)
+            timings.append((time.perf_counter() - start) * 1000)
+        return len(compressed), statistics.median(timings)
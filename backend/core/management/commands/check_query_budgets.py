@@ -0,0 +1,257 @@
+import contextlib
+import io
+import re
+import uuid
+from collections import Counter
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.models import (
+    Company, CompanyChecklist, CompanyDataSubmission, CompanyFramework, Framework, FrameworkElement, Meter,
+    ReportJob, Site, UserProfile
+)
+from core.reports import DataVersion
+
+# (name, path, params, queries). {company}, {site}, {year} and {month} are filled in.
+# core.tests.test_query_budgets holds the budgets, query by query, for the main endpoints; this runs
+# them against a bigger tenant. No budget depends on the number of sites, meters or rows, so a view
+# that queries per element, meter, site or row overruns them.
+ENDPOINT_BUDGETS = [
+    ('companies', '/api/companies/', {}, 6),
+    ('company progress', '/api/companies/{company}/progress/', {}, 8),
+    ('company storage', '/api/companies/{company}/storage/', {}, 4),
+    ('company frameworks', '/api/companies/{company}/frameworks/', {}, 7),
+    ('sites', '/api/sites/', {'company_id': '{company}'}, 5),
+    ('frameworks', '/api/frameworks/', {}, 4),
+    ('framework elements for company', '/api/framework-elements/for_company/', {'company_id': '{company}'}, 5),
+    ('profiling questions', '/api/profiling-questions/for_company/', {'company_id': '{company}'}, 4),
+    ('checklist', '/api/checklist/', {'company_id': '{company}', 'site_id': '{site}'}, 5),
+    ('meters', '/api/meters/', {'company_id': '{company}', 'site_id': '{site}'}, 5),
+    ('tasks (site)', '/api/data-collection/tasks/',
+     {'company_id': '{company}', 'site_id': '{site}', 'year': '{year}', 'month': '{month}'}, 7),
+    # Checklists, meters and submissions of every site are read together
+    ('tasks (all locations)', '/api/data-collection/tasks/',
+     {'company_id': '{company}', 'year': '{year}', 'month': '{month}'}, 7),
+    ('progress (site)', '/api/data-collection/progress/',
+     {'company_id': '{company}', 'site_id': '{site}', 'year': '{year}', 'month': '{month}'}, 5),
+    ('progress (all locations)', '/api/data-collection/progress/',
+     {'company_id': '{company}', 'year': '{year}', 'month': '{month}'}, 4),
+    ('export', '/api/data-collection/export/', {'company_id': '{company}', 'year': '{year}'}, 4),
+    # Yearly progress first makes sure every month's slots exist, with the queries of one task load
+    ('dashboard', '/api/dashboard/', {'company_id': '{company}'}, 16),
+    ('coverage report', '/api/reports/coverage/', {'company_id': '{company}', 'year': '{year}'}, 6),
+    ('emissions report', '/api/reports/emissions/', {'company_id': '{company}', 'year': '{year}'}, 7),
+    ('consumption report', '/api/reports/consumption/', {'company_id': '{company}', 'year': '{year}'}, 8),
+    ('quality flags', '/api/reports/quality/', {'company_id': '{company}', 'year': '{year}'}, 4),
+    ('year comparison', '/api/reports/year-comparison/', {'company_id': '{company}', 'year': '{year}'}, 7),
+    ('report jobs', '/api/reports/jobs/', {'company_id': '{company}', 'year': '{year}'}, 4),
+]
+
+SCAN, INDEX, COVERING = 'scan', 'index', 'covering'
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Build a synthetic tenant inside a rolled-back transaction, call every tenant API endpoint '
+        'and check its query count against a budget that holds for any number of sites, then EXPLAIN '
+        'the hot lookups. core.tests.test_query_budgets enforces the budgets in the test suite'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sites', type=int, default=3, help='Sites in the synthetic tenant')
+        parser.add_argument('--elements', type=int, default=12, help='Framework elements (a third of them metered)')
+        parser.add_argument('--meters-per-type', type=int, default=2, help='Meters per site and metered type')
+        parser.add_argument('--year', type=int, default=date.today().year - 1)
+        parser.add_argument('--only', help='Only endpoints whose name contains this text')
+        parser.add_argument('--show-queries', action='store_true', help='Print the SQL of endpoints over budget')
+        parser.add_argument('--skip-explain', action='store_true', help='Only check query counts')
+
+    def handle(self, *args, **options):
+        self.failures = []
+        try:
+            with transaction.atomic():
+                tenant = self._build_tenant(options)
+                self._check_endpoints(tenant, options)
+                if not options['skip_explain']:
+                    self._check_plans(tenant)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        if self.failures:
+            raise CommandError(f"{len(self.failures)} checks failed: {', '.join(self.failures)}")
+        self.stdout.write(self.style.SUCCESS('✅ All endpoints within their query budgets'))
+
+    def _build_tenant(self, options):
+        tag = uuid.uuid4().hex[:6].upper()
+        year = options['year']
+        user = User.objects.create(username=f'query-budget-{tag}', email=f'{tag.lower()}@example.com')
+        company = Company.objects.create(
+            name=f'Query Budget {tag}', company_code=f'QB{tag}', emirate='dubai', sector='hospitality', user=user
+        )
+        user.company = company
+        user.save(update_fields=['company'])
+        UserProfile.objects.create(user=user, role='admin', email=user.email, company=company)
+
+        framework, _ = Framework.objects.get_or_create(
+            framework_id='QB-FRAMEWORK', defaults={'name': 'Query budget framework', 'type': 'voluntary'}
+        )
+        CompanyFramework.objects.create(company=company, framework=framework)
+
+        meter_types = ['Electricity Consumption', 'Water Consumption']
+        elements = []
+        for index in range(options['elements']):
+            metered = index % 3 == 0
+            meter_type = meter_types[(index // 3) % len(meter_types)] if metered else None
+            elements.append(FrameworkElement(
+                element_id=f'QB-{tag}-{index:03d}', framework_id=framework.framework_id, sector='hospitality',
+                official_code=f'QB-{index:03d}', name_plain=meter_type or f'Query budget element {index}',
+                description='Synthetic element', unit='kWh' if metered else 'count', cadence='monthly',
+                type='must-have', category='ESG'[index % 3], prompt='Value', metered=metered,
+                quality_checks=[{'type': 'non_negative'}],
+                carbon_specifications={'emission_factor': 0.4, 'scope': 'scope_2'} if metered else None,
+            ))
+        FrameworkElement.objects.bulk_create(elements)
+
+        sites = [Site.objects.create(company=company, name=f'Site {index + 1}') for index in range(options['sites'])]
+        meters = Meter.objects.bulk_create([
+            Meter(company=company, site=site, type=meter_type, name=f'Meter {number + 1}', user=user)
+            for site in sites for meter_type in meter_types for number in range(options['meters_per_type'])
+        ])
+        CompanyChecklist.objects.bulk_create([
+            CompanyChecklist(company=company, site=site, element=element, cadence='monthly',
+                             framework_id=framework.framework_id)
+            for site in sites for element in elements
+        ])
+
+        # A year of data: every slot for every month, saved one by one so signals and rollups run as in production
+        months = [date(year, month, 1).strftime('%b') for month in range(1, 13)]
+        for site in sites:
+            for element in elements:
+                element_meters = [meter for meter in meters if meter.site_id == site.id and meter.type == element.name_plain]
+                for meter in element_meters or [None]:
+                    for number, month in enumerate(months):
+                        CompanyDataSubmission.objects.create(
+                            company=company, site=site, framework_element=element, meter=meter, user=user,
+                            reporting_year=year, reporting_period=month, value=str(100 + number),
+                        )
+
+        self.stdout.write(
+            f'🏗️  Synthetic tenant {company.company_code}: {len(sites)} sites, {len(elements)} elements, '
+            f'{len(meters)} meters, {CompanyDataSubmission.objects.filter(company=company).count()} submissions'
+        )
+        return {'user': user, 'company': company, 'sites': sites, 'elements': elements, 'meters': meters,
+                'year': year, 'month': 6}
+
+    def _check_endpoints(self, tenant, options):
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(tenant['user'])
+        values = {
+            'company': tenant['company'].id, 'site': tenant['sites'][0].id,
+            'year': tenant['year'], 'month': tenant['month'],
+        }
+
+        # The first load of a month creates its submission slots (the dashboard does so for the current
+        # year); budgets are for loads after that, with the report caches invalidated again
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.get('/api/data-collection/tasks/', {'company_id': values['company'], 'year': values['year'],
+                                                        'month': values['month']})
+            client.get('/api/dashboard/', {'company_id': values['company']})
+        DataVersion.bump(tenant['company'].id)
+
+        self.stdout.write(f"\n{'endpoint':<34}{'status':>7}{'queries':>9}{'budget':>8}")
+        for name, path, params, budget in ENDPOINT_BUDGETS:
+            if options['only'] and options['only'] not in name:
+                continue
+            url = path.format(**values)
+            query = {key: value.format(**values) for key, value in params.items()}
+
+            with CaptureQueriesContext(connection) as captured, contextlib.redirect_stdout(io.StringIO()):
+                response = client.get(url, query)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+            count = len(captured.captured_queries)
+            ok = response.status_code == 200 and count <= budget
+            line = f'{name:<34}{response.status_code:>7}{count:>9}{budget:>8}'
+            self.stdout.write(line if ok else self.style.ERROR(line))
+            if not ok:
+                self.failures.append(name)
+                if options['show_queries']:
+                    self._show_repeated(captured.captured_queries)
+
+    def _show_repeated(self, queries):
+        """The most frequent query shapes (literals replaced), which is where an N+1 shows up"""
+        shapes = Counter(re.sub(r"'[^']*'|\b\d+\b", '?', query['sql']) for query in queries)
+        for shape, count in shapes.most_common(5):
+            self.stdout.write(f'    {count:>5} x {shape[:200]}')
+
+    def _hot_lookups(self, tenant):
+        company, site, year = tenant['company'], tenant['sites'][0], tenant['year']
+        element = next(element for element in tenant['elements'] if element.metered)
+        meter = next(meter for meter in tenant['meters'] if meter.site_id == site.id and meter.type == element.name_plain)
+        return [
+            ('submission slot', COVERING, CompanyDataSubmission.objects.filter(
+                company=company, site=site, framework_element=element, meter=meter,
+                reporting_year=year, reporting_period='Jun',
+            ).values_list('id')),
+            ('site month submissions', INDEX, CompanyDataSubmission.objects.filter(
+                company=company, site=site, period_granularity='month', period_start=date(year, 6, 1),
+            )),
+            ('company month range', INDEX, CompanyDataSubmission.objects.filter(
+                CompanyDataSubmission.period_filter(date(year, 4, 1), date(year, 12, 1)), company=company,
+            )),
+            ('element numeric totals', COVERING, CompanyDataSubmission.objects.filter(
+                company=company, framework_element=element, reporting_year=year,
+            ).values('reporting_period').annotate(total=Sum('value_normalized')).order_by()),
+            ('active meters by type', COVERING, Meter.objects.filter(
+                company=company, site=site, type=element.name_plain, status='active',
+            ).values_list('id')),
+            ('site checklist', INDEX, CompanyChecklist.objects.filter(company=company, site=site)),
+            ('report job reuse', INDEX, ReportJob.objects.filter(
+                company=company, year=year, data_version=company.data_version, status='complete',
+            )),
+        ]
+
+    @staticmethod
+    def _classify(plan):
+        """(scan | index | covering, index name) from EXPLAIN output on SQLite or PostgreSQL"""
+        for line in plan.splitlines():
+            text = line.strip()
+            if 'USING COVERING INDEX' in text or text.startswith('Index Only Scan') or '-> Index Only Scan' in text:
+                return COVERING, text
+            if 'USING INDEX' in text or 'USING INTEGER PRIMARY KEY' in text or 'Index Scan' in text:
+                return INDEX, text
+        return SCAN, plan.splitlines()[0] if plan else ''
+
+    def _check_plans(self, tenant):
+        if connection.vendor == 'postgresql':
+            # A small synthetic tenant makes sequential scans cheapest; ask whether an index can serve the lookup
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING(f'EXPLAIN checks are not supported on {connection.vendor}'))
+            return
+
+        self.stdout.write(f"\n{'lookup':<28}{'expected':>10}{'plan':>10}  detail")
+        for name, expected, queryset in self._hot_lookups(tenant):
+            kind, detail = self._classify(queryset.explain())
+            line = f'{name:<28}{expected:>10}{kind:>10}  {detail[:90]}'
+            if kind == SCAN:
+                self.stdout.write(self.style.ERROR(line))
+                self.failures.append(f'{name} plan')
+            elif expected == COVERING and kind != COVERING:
+                # Index-only plans also depend on the visibility map on PostgreSQL, so this is advisory
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
@@ -0,0 +1,66 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from core.evidence_service import EvidenceStore, hash_file
+from core.models import CompanyDataSubmission, EvidenceBlob
+
+
+class Command(BaseCommand):
+    help = 'Move existing evidence files into the content-addressed store, keeping one copy of each distinct file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without changing anything')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        legacy = CompanyDataSubmission.objects.filter(
+            evidence_blob__isnull=True
+        ).exclude(evidence_file='').exclude(evidence_file__isnull=True).order_by('id')
+
+        self.stdout.write(f'🔍 Checking {legacy.count()} submissions with unmanaged evidence files...')
+
+        seen = {}  # sha256 -> first path seen in this run
+        migrated = duplicates = missing = 0
+        bytes_saved = 0
+
+        for submission in legacy.iterator(chunk_size=500):
+            field = submission.evidence_file
+            if not field.storage.exists(field.name):
+                missing += 1
+                self.stdout.write(self.style.WARNING(f'  ⚠️ Submission {submission.id}: {field.name} is missing on disk'))
+                continue
+
+            with field.storage.open(field.name, 'rb') as handle:
+                sha256 = hash_file(handle)
+                size = field.storage.size(field.name)
+                already_stored = sha256 in seen or EvidenceBlob.objects.filter(pk=sha256).exists()
+
+                if already_stored:
+                    duplicates += 1
+                    bytes_saved += size
+                if dry_run:
+                    seen.setdefault(sha256, field.name)
+                    continue
+
+                blob, _ = EvidenceStore.store(File(handle), sha256, size, os.path.basename(field.name))
+
+            # attach() releases the legacy copy, removing it from disk
+            EvidenceStore.attach(submission, blob)
+            seen.setdefault(sha256, blob.file.name)
+            migrated += 1
+
+        # Recount references in case earlier runs were interrupted
+        if not dry_run:
+            for blob in EvidenceBlob.objects.annotate(refs=Count('submissions')).iterator():
+                if blob.refs != blob.ref_count:
+                    EvidenceBlob.objects.filter(pk=blob.pk).update(ref_count=blob.refs)
+
+        verb = 'Would migrate' if dry_run else 'Migrated'
+        self.stdout.write(f'\n✅ {verb} {legacy.count() - missing if dry_run else migrated} evidence files')
+        self.stdout.write(f'♻️ Duplicates: {duplicates} ({bytes_saved / (1024 * 1024):.2f} MB '
+                          f'{"reclaimable" if dry_run else "reclaimed"})')
+        if missing:
+            self.stdout.write(self.style.WARNING(f'⚠️ {missing} files were missing on disk and left untouched'))
@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import EvidenceArchiveExporter
+from core.models import Company, Site
+
+
+class Command(BaseCommand):
+    help = "Write a ZIP of a company's evidence files for a reporting year, with a CSV manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-id', type=int, required=True)
+        parser.add_argument('--year', type=int, required=True)
+        parser.add_argument('--site-id', type=int, help='Limit the export to one site')
+        parser.add_argument('--output', help='Archive path, or - for stdout (default: <code>_<year>_evidence.zip)')
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company_id'])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company_id']} not found")
+
+        site = None
+        if options['site_id']:
+            try:
+                site = Site.objects.get(pk=options['site_id'], company=company)
+            except Site.DoesNotExist:
+                raise CommandError(f"Site {options['site_id']} not found for {company.name}")
+
+        submissions = EvidenceArchiveExporter.submissions(company, options['year'], site_id=options['site_id'])
+        output = options['output'] or EvidenceArchiveExporter.filename(company, options['year'], site)
+
+        written = 0
+        if output == '-':
+            for chunk in EvidenceArchiveExporter.stream(submissions):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(output, 'wb') as archive:
+            for chunk in EvidenceArchiveExporter.stream(submissions):
+                archive.write(chunk)
+                written += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Exported {submissions.count()} evidence submissions to {output} ({written / (1024 * 1024):.2f} MB)'
+        ))
@@ -0,0 +1,95 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.evidence_service import ChunkedUploadService, EvidenceGarbageCollector
+from core.models import EvidenceUpload
+from core.services import DataCollectionService
+
+
+def _mb(size):
+    return f'{size / (1024 * 1024):.2f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Delete orphaned submissions and remove or quarantine evidence files nothing references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be collected, with sizes')
+        parser.add_argument('--company-id', type=int, help='Only collect orphaned submissions for this company')
+        parser.add_argument('--batch-size', type=int, default=500, help='Submissions deleted per transaction')
+        parser.add_argument('--files', choices=['quarantine', 'delete', 'skip'], default='quarantine',
+                            help='What to do with unreferenced evidence files (default: quarantine)')
+        parser.add_argument('--min-age-hours', type=float, default=1,
+                            help='Leave files and uploads younger than this alone (default: 1)')
+        parser.add_argument('--stale-upload-days', type=float, default=7,
+                            help='Abort pending chunked uploads idle for this long (default: 7)')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        min_age = options['min_age_hours'] * 3600
+        if dry_run:
+            self.stdout.write('🔍 Dry run - nothing will be changed\n')
+
+        self._collect_submissions(dry_run, options['company_id'], options['batch_size'])
+        self._collect_uploads(dry_run, options['stale_upload_days'] * 86400, min_age)
+        if options['files'] != 'skip':
+            self._collect_files(dry_run, options['files'], min_age)
+
+    def _collect_submissions(self, dry_run, company_id, batch_size):
+        orphans = DataCollectionService.orphaned_submissions(company_id=company_id)
+        if dry_run:
+            count = orphans.count()
+            self.stdout.write(f'🗂️ Orphaned submissions: {count}')
+            return
+
+        deleted = DataCollectionService.delete_in_batches(orphans, batch_size=batch_size)
+        self.stdout.write(f'🗂️ Deleted {deleted} orphaned submissions')
+
+    def _collect_uploads(self, dry_run, max_age, min_age):
+        stale = EvidenceGarbageCollector.stale_uploads(max_age)
+        known = set(str(upload_id) for upload_id in EvidenceUpload.objects.values_list('id', flat=True))
+
+        upload_dir = ChunkedUploadService.upload_dir()
+        cutoff = time.time() - min_age
+        stray_parts = []
+        for entry in os.scandir(upload_dir):
+            upload_id = entry.name[:-len('.part')] if entry.name.endswith('.part') else None
+            if upload_id and upload_id not in known and entry.stat().st_mtime < cutoff:
+                stray_parts.append((entry.path, entry.stat().st_size))
+
+        stale_bytes = sum(upload.received_bytes for upload in stale)
+        stray_bytes = sum(size for _, size in stray_parts)
+        verb = 'Would abort' if dry_run else 'Aborted'
+        self.stdout.write(f'⏳ {verb} {stale.count()} stale uploads ({_mb(stale_bytes)}) '
+                          f'and {len(stray_parts)} stray part files ({_mb(stray_bytes)})')
+        if dry_run:
+            return
+
+        for upload in stale:
+            ChunkedUploadService.discard(upload)
+            upload.delete()
+        for path, _ in stray_parts:
+            os.remove(path)
+
+    def _collect_files(self, dry_run, mode, min_age):
+        stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+        count = total = 0
+        for name, size in EvidenceGarbageCollector.unreferenced_files(min_age_seconds=min_age):
+            count += 1
+            total += size
+            if dry_run:
+                self.stdout.write(f'  {name} ({_mb(size)})')
+            elif mode == 'quarantine':
+                EvidenceGarbageCollector.quarantine(name, stamp)
+            else:
+                EvidenceGarbageCollector.delete(name)
+
+        if dry_run:
+            verb = f'Would {mode}'
+        else:
+            verb = 'Quarantined' if mode == 'quarantine' else 'Deleted'
+        suffix = f' into {EvidenceGarbageCollector.QUARANTINE_ROOT}/{stamp}/' if mode == 'quarantine' and not dry_run and count else ''
+        self.stdout.write(f'🧹 {verb} {count} unreferenced evidence files ({_mb(total)}){suffix}')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.evidence_previews import Image, PreviewService
+from core.models import EvidenceBlob
+
+
+class Command(BaseCommand):
+    help = 'Generate previews for evidence blobs that do not have one yet (backfill or retry)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', nargs='+', default=['pending', 'failed'],
+                            choices=[choice for choice, _ in EvidenceBlob.PREVIEW_STATUS_CHOICES],
+                            help='Preview statuses to (re)process (default: pending failed)')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            self.stdout.write(self.style.WARNING('⚠️ Pillow is not installed - image previews will be marked unsupported'))
+
+        blobs = EvidenceBlob.objects.filter(preview_status__in=options['status']).values_list('sha256', flat=True)
+        self.stdout.write(f'🖼️ Generating previews for {blobs.count()} evidence files...')
+
+        results = {}
+        for sha256 in blobs.iterator():
+            # Claimed like run_preview_worker does, so a running worker never renders the same blob
+            claimed = EvidenceBlob.objects.filter(pk=sha256, preview_status__in=options['status']).update(
+                preview_status='processing', preview_started_at=timezone.now()
+            )
+            if not claimed:
+                continue
+            outcome = PreviewService.process(sha256)
+            if outcome == 'failed':
+                self.stdout.write(self.style.ERROR(f'  ❌ {sha256[:12]}: failed, see the log'))
+            results[outcome] = results.get(outcome, 0) + 1
+
+        summary = ', '.join(f'{count} {outcome}' for outcome, count in results.items() if outcome) or 'nothing to do'
+        self.stdout.write(f'\n✅ Done: {summary}')
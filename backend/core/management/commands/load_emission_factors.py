@@ -0,0 +1,62 @@
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import EmissionFactor
+
+COLUMNS = ['source', 'emirate', 'valid_from', 'valid_to', 'factor', 'unit', 'activity_unit', 'scope', 'reference']
+
+
+class Command(BaseCommand):
+    help = ('Load emission factors from a CSV with columns: ' + ', '.join(COLUMNS) +
+            '. Rows are matched on (source, emirate, valid_from) and updated in place.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to the CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without saving anything')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as handle:
+                rows = list(csv.DictReader(handle))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["csv_file"]}: {e}')
+
+        created = updated = 0
+        with transaction.atomic():
+            for line, row in enumerate(rows, start=2):
+                try:
+                    was_created = self._load_row(row)
+                except (KeyError, ValueError, InvalidOperation, ValidationError) as e:
+                    raise CommandError(f'Line {line}: {e}')
+                created += was_created
+                updated += not was_created
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        prefix = '🔍 Dry run - would have ' if options['dry_run'] else '✅ '
+        self.stdout.write(f'{prefix}created {created} and updated {updated} emission factors')
+
+    @staticmethod
+    def _load_row(row):
+        source = row['source'].strip()
+        emirate = (row.get('emirate') or '').strip()
+        valid_from = date.fromisoformat(row['valid_from'].strip())
+        valid_to = (row.get('valid_to') or '').strip()
+
+        factor = EmissionFactor.objects.filter(source=source, emirate=emirate, valid_from=valid_from).first()
+        created = factor is None
+        factor = factor or EmissionFactor(source=source, emirate=emirate, valid_from=valid_from)
+        factor.valid_to = date.fromisoformat(valid_to) if valid_to else None
+        factor.factor = Decimal(row['factor'].strip())
+        factor.unit = (row.get('unit') or '').strip() or 'kg CO2e'
+        factor.activity_unit = (row.get('activity_unit') or '').strip()
+        factor.scope = row['scope'].strip()
+        factor.reference = (row.get('reference') or '').strip()
+        factor.full_clean(validate_unique=False)
+        factor.save()
+        return created
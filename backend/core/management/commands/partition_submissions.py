@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.partitioning import DEFAULT_PARTITION, SubmissionPartitions
+
+
+class Command(BaseCommand):
+    help = ('Manage the reporting_year partitions of the submissions table (PostgreSQL): by default creates the '
+            'partitions of this year and the next SUBMISSION_PARTITIONS_AHEAD years. Migrations never partition the '
+            'table; once it is, revert before migrations that change the submissions model and convert again after.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, help='Years ahead of this one to create partitions for')
+        parser.add_argument('--year', type=int, action='append', dest='years', help='Create this year\'s partition')
+        parser.add_argument('--convert', action='store_true',
+                            help='Partition the (unpartitioned) table, moving the existing rows into it')
+        parser.add_argument('--revert', action='store_true', help='Merge the partitions back into one plain table')
+        parser.add_argument('--status', action='store_true', help='List the partitions and exit')
+
+    def handle(self, *args, **options):
+        if not SubmissionPartitions.supported(connection):
+            raise CommandError(f'Partitioning needs PostgreSQL; this database is {connection.vendor}')
+
+        if options['revert']:
+            result = SubmissionPartitions.revert(connection)
+            if result is None:
+                self.stdout.write('The submissions table is not partitioned')
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✅ Merged {result['rows']} submissions into one table"))
+            return
+
+        if options['convert']:
+            self.stdout.write('🗂️  Partitioning the submissions table (locks it until the rows are copied)...')
+            result = SubmissionPartitions.convert(connection, ahead=options['ahead'])
+            if result is None:
+                self.stdout.write('  ...already partitioned')
+            else:
+                self.stdout.write(f"  ...moved {result['rows']} submissions into {len(result['years'])} year partitions")
+                if result['dropped_foreign_keys']:
+                    self.stdout.write(f"  ...foreign keys now enforced by Django only: "
+                                      f"{', '.join(result['dropped_foreign_keys'])}")
+                self.stdout.write(self.style.WARNING(
+                    '⚠️  Migrations that change the submissions model need --revert first and --convert after'
+                ))
+
+        if not SubmissionPartitions.is_partitioned(connection):
+            raise CommandError('The submissions table is not partitioned; run with --convert')
+
+        if not options['status']:
+            years = options['years'] or SubmissionPartitions.wanted_years(connection, options['ahead'])
+            created = SubmissionPartitions.ensure(connection, years)
+            for name in created:
+                self.stdout.write(f'  ...created {name}')
+
+        for name, bounds, rows in SubmissionPartitions.partitions(connection):
+            self.stdout.write(f'  {name:<44} {bounds:<40} ~{max(rows, 0)} rows')
+        if SubmissionPartitions.default_rows(connection):
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {DEFAULT_PARTITION} holds rows; run without --status to give their years partitions'
+            ))
+
+        if not options['status']:
+            self.stdout.write(self.style.SUCCESS(f'✅ {len(created)} partitions created'))
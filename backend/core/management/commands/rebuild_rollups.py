@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from core.models import Company
+from core.reports import DataVersion
+from core.rollups import ConsumptionRollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the meter x month, site x quarter and company x year consumption rollups from submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-id', type=int, help='Only rebuild this company')
+
+    def handle(self, *args, **options):
+        company_id = options['company_id']
+        counts = ConsumptionRollups.rebuild(company_id=company_id)
+
+        # Cached reports read the rollups - drop them
+        if company_id:
+            DataVersion.bump(company_id)
+        else:
+            Company.objects.update(data_version=F('data_version') + 1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rebuilt {counts['meter_months']} meter-month, {counts['site_quarters']} site-quarter "
+            f"and {counts['company_years']} company-year rollups"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.evidence_service import StorageAccounting
+from core.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-company and per-site evidence storage counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-id', type=int, help='Only rebuild this company')
+
+    def handle(self, *args, **options):
+        totals = StorageAccounting.rebuild(company_id=options['company_id'])
+
+        by_company = {}
+        for (company_id, _), (size, count) in totals.items():
+            entry = by_company.setdefault(company_id, [0, 0])
+            entry[0] += size
+            entry[1] += count
+
+        names = dict(Company.objects.filter(id__in=by_company).values_list('id', 'name'))
+        for company_id, (size, count) in sorted(by_company.items()):
+            self.stdout.write(f'  {names.get(company_id, company_id)}: {count} files, {size / (1024 * 1024):.2f} MB')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt storage counters for {len(by_company)} companies'))
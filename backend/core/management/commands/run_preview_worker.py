@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.evidence_previews import Image, PreviewService
+
+REQUEUE_INTERVAL = 60  # Seconds between stale-claim sweeps while idle
+
+
+class Command(BaseCommand):
+    help = 'Generate previews for newly uploaded evidence files; run as many workers as needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between queue checks when idle')
+        parser.add_argument('--stale-minutes', type=int, default=10,
+                            help='Requeue previews claimed longer ago than this (their worker died)')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'EVIDENCE_PREVIEWS_ENABLED', True):
+            self.stdout.write(self.style.WARNING('⚠️ EVIDENCE_PREVIEWS_ENABLED is off - not generating previews'))
+            return
+        if Image is None:
+            self.stdout.write(self.style.WARNING('⚠️ Pillow is not installed - image previews will be marked unsupported'))
+
+        stale_age = timedelta(minutes=options['stale_minutes'])
+        next_requeue = self.requeue_stale(stale_age)
+
+        results = {}
+        try:
+            while True:
+                sha256 = PreviewService.claim_next()
+                if sha256 is None:
+                    if options['once']:
+                        break
+                    # Pick up previews orphaned by workers that died while this one was running
+                    if time.monotonic() >= next_requeue:
+                        next_requeue = self.requeue_stale(stale_age)
+                    connections.close_all()
+                    time.sleep(options['poll_interval'])
+                    continue
+                outcome = PreviewService.process(sha256)
+                self.stdout.write(f'🖼️ {sha256[:12]}: {outcome}')
+                results[outcome] = results.get(outcome, 0) + 1
+        except KeyboardInterrupt:
+            pass
+
+        summary = ', '.join(f'{count} {outcome}' for outcome, count in results.items() if outcome) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'✅ Done: {summary}'))
+
+    def requeue_stale(self, stale_age):
+        """Requeue previews of dead workers; returns when the next sweep is due"""
+        requeued = PreviewService.requeue_stale(stale_age)
+        if requeued:
+            self.stdout.write(f'  ...requeued {requeued} stale previews')
+        return time.monotonic() + REQUEUE_INTERVAL
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Company
+from core.quality import QualityCheckEngine
+
+
+class Command(BaseCommand):
+    help = "Run the elements' quality_checks over a reporting year and store the flags"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company-id', type=int, help='Only check this company (default: all)')
+        parser.add_argument('--year', type=int, default=datetime.now().year, help='Reporting year (default: current)')
+        parser.add_argument('--site-id', type=int, help='Only check this site')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.order_by('id')
+        if options['company_id']:
+            companies = companies.filter(id=options['company_id'])
+            if not companies.exists():
+                raise CommandError(f"Company {options['company_id']} not found")
+
+        total = 0
+        for company in companies:
+            summary = QualityCheckEngine.run(company, options['year'], site_id=options['site_id'])
+            total += summary['flags']
+            self.stdout.write(f"  {company.name}: {summary['flags']} flags {summary['by_rule']}")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} quality flags for {options['year']}"))
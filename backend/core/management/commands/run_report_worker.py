@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.report_jobs import ReportJobService
+
+
+class Command(BaseCommand):
+    help = 'Render queued report packs; run as many workers as needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between queue checks when idle')
+        parser.add_argument('--stale-minutes', type=int, default=30,
+                            help='Requeue running jobs started longer ago than this (their worker died)')
+        parser.add_argument('--cleanup-days', type=int,
+                            help='Delete jobs and unused artifacts finished more than this many days ago, then exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup_days'] is not None:
+            deleted = ReportJobService.cleanup(timedelta(days=options['cleanup_days']))
+            self.stdout.write(self.style.SUCCESS(f'✅ Deleted {deleted} old report jobs'))
+            return
+
+        requeued = ReportJobService.requeue_stale(timedelta(minutes=options['stale_minutes']))
+        if requeued:
+            self.stdout.write(f'  ...requeued {requeued} stale jobs')
+
+        rendered = 0
+        try:
+            while True:
+                job_id = ReportJobService.claim_next()
+                if job_id is None:
+                    if options['once']:
+                        break
+                    connections.close_all()
+                    time.sleep(options['poll_interval'])
+                    continue
+                self.stdout.write(f'📄 Rendering report job {job_id}')
+                ReportJobService.run(job_id)
+                rendered += 1
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Rendered {rendered} report jobs'))
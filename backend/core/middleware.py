@@ -0,0 +1,139 @@
+"""
+HTTP middleware for the ESG API
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from .db_router import begin_request, end_request, replica_configured
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional - fall back to gzip only
+    brotli = None
+
+
+class ApiCompressionMiddleware:
+    """
+    Compress large JSON API responses with brotli (when installed) or gzip.
+
+    WhiteNoise already serves pre-compressed static files, so this only looks
+    at paths under API_COMPRESSION_PATH_PREFIX. Small bodies, streaming
+    responses and responses that already carry a Content-Encoding are passed
+    through untouched.
+
+    The coding follows the client's Accept-Encoding q-values: a coding with
+    q=0 is never used, and of the acceptable ones the highest q wins, brotli
+    on a tie.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024)
+        self.path_prefix = getattr(settings, 'API_COMPRESSION_PATH_PREFIX', '/api/')
+        self.brotli_quality = getattr(settings, 'API_COMPRESSION_BROTLI_QUALITY', 4)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        # Fast path: anything we would not compress anyway
+        if (
+            not request.path.startswith(self.path_prefix)
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < self.min_size
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        elif encoding == 'gzip':
+            compressed = compress_string(response.content)
+        else:
+            return response
+
+        # Return the original if compression didn't help
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+
+        # The representation changed, so a strong ETag no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
+
+    @staticmethod
+    def accepted_encodings(header):
+        """{coding: q} from an Accept-Encoding header; a malformed q counts as 0"""
+        accepted = {}
+        for item in header.split(','):
+            coding, *params = item.split(';')
+            coding = coding.strip().lower()
+            if not coding:
+                continue
+            quality = 1.0
+            for param in params:
+                name, _, value = param.partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            accepted[coding] = quality
+        return accepted
+
+    @classmethod
+    def choose_encoding(cls, header):
+        """'br', 'gzip' or None for identity"""
+        accepted = cls.accepted_encodings(header)
+        wildcard = accepted.get('*', 0.0)
+        best, best_quality = None, 0.0
+        for coding in (['br'] if brotli is not None else []) + ['gzip']:
+            quality = accepted.get(coding, wildcard)
+            if quality > best_quality:
+                best, best_quality = coding, quality
+        return best
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes for the read replica (core.db_router.ReadReplicaRouter).
+
+    A request that wrote to the primary sets a short-lived cookie, and while
+    it lasts (REPLICA_STICKY_SECONDS) that client's requests read from the
+    primary too, so they don't miss rows the replica hasn't received yet.
+    Passes everything through when no replica is configured.
+    """
+
+    COOKIE_NAME = 'esg_read_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        # Set by BatchView on its sub-requests
+        parent = getattr(request, 'replica_parent_state', None)
+        state = begin_request(pinned=self.COOKIE_NAME in request.COOKIES, parent=parent)
+        response = self.get_response(request)
+        # A streaming body is read after this returns and still needs the state; the next request replaces it
+        if not response.streaming or parent is not None:
+            end_request(state)
+        if state.wrote:
+            response.set_cookie(
+                self.COOKIE_NAME, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax',
+                secure=getattr(settings, 'SESSION_COOKIE_SECURE', False),
+            )
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0027_add_framework_element_to_submissions'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='companydatasubmission',
+            unique_together={('user', 'company', 'site', 'element', 'framework_element', 'meter', 'reporting_year', 'reporting_period')},
+        ),
+        migrations.CreateModel(
+            name='EvidenceUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('total_size', models.BigIntegerField(help_text='Expected file size in bytes')),
+                ('received_bytes', models.BigIntegerField(default=0, help_text='Contiguous bytes written so far')),
+                ('sha256', models.CharField(blank=True, help_text='Content hash, set on finalize', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('complete', 'Complete')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evidence_uploads', to='core.company')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evidence_uploads', to='core.companydatasubmission')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
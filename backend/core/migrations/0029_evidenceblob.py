@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:30
+
+import core.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_evidenceupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvidenceBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to=core.models.evidence_blob_path)),
+                ('size', models.BigIntegerField(help_text='File size in bytes')),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Number of submissions pointing at this blob')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='evidence_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='submissions', to='core.evidenceblob'),
+        ),
+    ]
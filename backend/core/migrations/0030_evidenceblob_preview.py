@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_evidenceblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evidenceblob',
+            name='preview',
+            field=models.FileField(blank=True, help_text='Downscaled JPEG stored next to the original', upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='evidenceblob',
+            name='preview_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
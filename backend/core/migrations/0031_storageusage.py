@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_evidenceblob_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bytes_used', models.BigIntegerField(default=0)),
+                ('file_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to='core.company')),
+                ('site', models.ForeignKey(blank=True, help_text='Null for evidence on submissions without a site', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to='core.site')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='storageusage',
+            constraint=models.UniqueConstraint(fields=('company', 'site'), name='unique_storage_usage_site'),
+        ),
+        migrations.AddConstraint(
+            model_name='storageusage',
+            constraint=models.UniqueConstraint(condition=models.Q(('site__isnull', True)), fields=('company',), name='unique_storage_usage_no_site'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_storageusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, help_text="Bumped whenever the company's submissions or checklist change; keys report caches"),
+        ),
+    ]
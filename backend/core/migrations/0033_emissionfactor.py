@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_company_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmissionFactor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Element meter type (e.g. electricity) or a framework element_id', max_length=100)),
+                ('emirate', models.CharField(blank=True, choices=[('dubai', 'Dubai'), ('abu_dhabi', 'Abu Dhabi'), ('sharjah', 'Sharjah'), ('ajman', 'Ajman'), ('umm_al_quwain', 'Umm Al Quwain'), ('ras_al_khaimah', 'Ras Al Khaimah'), ('fujairah', 'Fujairah')], help_text='Blank applies to every emirate without its own factor', max_length=100)),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField(blank=True, help_text='Inclusive; blank while the factor is current', null=True)),
+                ('factor', models.DecimalField(decimal_places=8, help_text='Emissions per unit of activity', max_digits=18)),
+                ('unit', models.CharField(default='kg CO2e', help_text='Output unit of the factor (kg or t CO2e)', max_length=50)),
+                ('activity_unit', models.CharField(blank=True, help_text='e.g. kWh, m3, L', max_length=50)),
+                ('scope', models.CharField(choices=[('scope_1', 'Scope 1'), ('scope_2', 'Scope 2'), ('scope_3', 'Scope 3')], max_length=20)),
+                ('reference', models.CharField(blank=True, help_text='Publisher and document the factor comes from', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['source', 'emirate', 'valid_from'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='emissionfactor',
+            constraint=models.UniqueConstraint(fields=('source', 'emirate', 'valid_from'), name='unique_emission_factor_start'),
+        ),
+    ]
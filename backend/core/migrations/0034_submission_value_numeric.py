@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_emissionfactor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='value_normalized',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, help_text="value_numeric in the base unit of the element's unit (kWh, m³, kg)", max_digits=24, null=True),
+        ),
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='value_numeric',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, help_text='value parsed as a number; null when blank, inactive or not numeric', max_digits=24, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='companydatasubmission',
+            index=models.Index(fields=['company', 'framework_element', 'reporting_year', 'reporting_period', 'value_numeric'], name='submission_numeric_idx'),
+        ),
+    ]
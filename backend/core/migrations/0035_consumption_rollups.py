@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_submission_value_numeric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteQuarterlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('quarter', models.PositiveSmallIntegerField()),
+                ('total', models.DecimalField(decimal_places=6, default=0, max_digits=28)),
+                ('readings', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='site_rollups', to='core.company')),
+                ('framework_element', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='site_rollups', to='core.frameworkelement')),
+                ('site', models.ForeignKey(blank=True, help_text='Null for meters without a site', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='quarterly_rollups', to='core.site')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MeterMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('total', models.DecimalField(decimal_places=6, default=0, max_digits=28)),
+                ('readings', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_rollups', to='core.company')),
+                ('framework_element', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_rollups', to='core.frameworkelement')),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='core.meter')),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='meter_rollups', to='core.site')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CompanyYearlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('total', models.DecimalField(decimal_places=6, default=0, max_digits=28)),
+                ('readings', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='yearly_rollups', to='core.company')),
+                ('framework_element', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='company_rollups', to='core.frameworkelement')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sitequarterlyrollup',
+            constraint=models.UniqueConstraint(fields=('company', 'site', 'framework_element', 'year', 'quarter'), name='unique_site_quarter_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='sitequarterlyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('site__isnull', True)), fields=('company', 'framework_element', 'year', 'quarter'), name='unique_site_quarter_rollup_no_site'),
+        ),
+        migrations.AddIndex(
+            model_name='metermonthlyrollup',
+            index=models.Index(fields=['company', 'year', 'month'], name='meter_rollup_company_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='metermonthlyrollup',
+            constraint=models.UniqueConstraint(fields=('meter', 'framework_element', 'year', 'month'), name='unique_meter_month_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='companyyearlyrollup',
+            constraint=models.UniqueConstraint(fields=('company', 'framework_element', 'year'), name='unique_company_year_rollup'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_consumption_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QualityFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(choices=[('non_negative', 'Negative value'), ('range', 'Out of range'), ('mom_jump', 'Month-over-month jump'), ('evidence_required', 'Evidence missing')], max_length=50)),
+                ('message', models.CharField(max_length=255)),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quality_flags', to='core.company')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quality_flags', to='core.companydatasubmission')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'rule'], name='quality_flag_company_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='qualityflag',
+            constraint=models.UniqueConstraint(fields=('submission', 'rule'), name='unique_quality_flag'),
+        ),
+    ]
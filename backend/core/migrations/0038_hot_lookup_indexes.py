@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companydatasubmission',
+            index=models.Index(fields=['company', 'site', 'framework_element', 'meter', 'reporting_year', 'reporting_period'], name='submission_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meter',
+            index=models.Index(fields=['company', 'site', 'type', 'status'], name='meter_lookup_idx'),
+        ),
+    ]
@@ -0,0 +1,168 @@
+# Canonical slot key for submissions: fill it and merge duplicate slots (0040 then makes it unique)
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+# Frozen copies of the helpers as they were when this migration was written, so later edits to
+# the live ones (core.models.submission_slot_key, core.rollups.period_*) can't change what it does
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+
+def submission_slot_key(company_id, site_id, data_element_id, framework_element_id, meter_id, year, period):
+    return '|'.join(str(part) for part in (
+        company_id, site_id or 0, data_element_id or 0, framework_element_id or '-', meter_id or 0, year, period,
+    ))
+
+
+def period_month(period):
+    return MONTHS.get(period)
+
+
+def period_quarter(period):
+    month = MONTHS.get(period)
+    if month:
+        return (month - 1) // 3 + 1
+    match = re.fullmatch(r'Q([1-4])', str(period or ''))
+    return int(match.group(1)) if match else None
+
+
+SLOT_COLUMNS = ['company_id', 'site_id', 'element_id', 'framework_element_id', 'meter_id', 'reporting_year',
+                'reporting_period']
+
+
+def fill_slot_keys(CompanyDataSubmission, batch_size=2000):
+    last_pk = 0
+    while True:
+        batch = list(CompanyDataSubmission.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *SLOT_COLUMNS)[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        for submission in batch:
+            submission.slot_key = submission_slot_key(*(getattr(submission, column) for column in SLOT_COLUMNS))
+        CompanyDataSubmission.objects.bulk_update(batch, ['slot_key'])
+
+
+def merge_slot(apps, rows):
+    """
+    Keep one row of a duplicated slot and delete the rest.
+
+    The keeper is the row with a value and evidence if there is one, else the
+    most recently updated. It takes over the value, evidence and assignment of
+    the newest duplicate that has them when it lacks its own. Blob
+    references, storage usage and consumption rollups are adjusted for the
+    deleted rows, since the signals that normally do so don't run in
+    migrations.
+    """
+    EvidenceBlob = apps.get_model('core', 'EvidenceBlob')
+    EvidenceUpload = apps.get_model('core', 'EvidenceUpload')
+    StorageUsage = apps.get_model('core', 'StorageUsage')
+
+    rows = sorted(rows, key=lambda row: (bool(row.value), bool(row.evidence_file), row.updated_at, -row.pk), reverse=True)
+    keeper, duplicates = rows[0], rows[1:]
+    before = [row.value_numeric for row in rows]
+
+    changed = []
+    for row in duplicates:  # Newest first
+        if not keeper.value and row.value:
+            keeper.value, keeper.value_numeric, keeper.value_normalized = row.value, row.value_numeric, row.value_normalized
+            changed += ['value', 'value_numeric', 'value_normalized']
+        if not keeper.evidence_file and row.evidence_file:
+            keeper.evidence_file, keeper.evidence_blob_id = row.evidence_file, row.evidence_blob_id
+            row.evidence_file, row.evidence_blob_id = '', None  # Moved, not released
+            changed += ['evidence_file', 'evidence_blob']
+        if not keeper.assigned_to_id and row.assigned_to_id:
+            keeper.assigned_to_id, keeper.assigned_by_id, keeper.assigned_at = row.assigned_to_id, row.assigned_by_id, row.assigned_at
+            changed += ['assigned_to', 'assigned_by', 'assigned_at']
+    if changed:
+        keeper.save(update_fields=set(changed))
+
+    CompanyDataSubmission = apps.get_model('core', 'CompanyDataSubmission')
+    released_bytes = released_files = 0
+    blob_ids = set()
+    for row in duplicates:
+        if row.evidence_file:
+            released_files += 1
+            if row.evidence_blob_id:
+                blob_ids.add(row.evidence_blob_id)
+                released_bytes += EvidenceBlob.objects.filter(pk=row.evidence_blob_id).values_list('size', flat=True).first() or 0
+    duplicate_ids = [row.pk for row in duplicates]
+    EvidenceUpload.objects.filter(submission_id__in=duplicate_ids).update(submission_id=keeper.pk)
+    CompanyDataSubmission.objects.filter(pk__in=duplicate_ids).delete()
+
+    # Recount the released blobs; rows left unreferenced go, and gc_evidence then collects their files
+    for blob_id in blob_ids:
+        references = CompanyDataSubmission.objects.filter(evidence_blob_id=blob_id).count()
+        if references:
+            EvidenceBlob.objects.filter(pk=blob_id).update(ref_count=references)
+        else:
+            EvidenceBlob.objects.filter(pk=blob_id).delete()
+
+    if released_files:
+        StorageUsage.objects.filter(company_id=keeper.company_id, site_id=keeper.site_id).update(
+            bytes_used=F('bytes_used') - released_bytes, file_count=F('file_count') - released_files
+        )
+
+    # Every row of the slot counted towards the same rollup cells; only the keeper does now
+    if keeper.meter_id and keeper.framework_element_id:
+        total_delta = (keeper.value_numeric or 0) - sum(value for value in before if value is not None)
+        readings_delta = (keeper.value_numeric is not None) - sum(value is not None for value in before)
+        if total_delta or readings_delta:
+            cells = [('CompanyYearlyRollup', {'year': keeper.reporting_year})]
+            if period_quarter(keeper.reporting_period):
+                cells.append(('SiteQuarterlyRollup', {'site_id': keeper.site_id, 'year': keeper.reporting_year,
+                                                      'quarter': period_quarter(keeper.reporting_period)}))
+            if period_month(keeper.reporting_period):
+                cells.append(('MeterMonthlyRollup', {'site_id': keeper.site_id, 'meter_id': keeper.meter_id,
+                                                     'year': keeper.reporting_year,
+                                                     'month': period_month(keeper.reporting_period)}))
+            for model_name, key in cells:
+                apps.get_model('core', model_name).objects.filter(
+                    company_id=keeper.company_id, framework_element_id=keeper.framework_element_id, **key
+                ).update(total=F('total') + total_delta, readings=F('readings') + readings_delta)
+    return len(duplicates)
+
+
+def merge_duplicate_slots(apps, schema_editor):
+    CompanyDataSubmission = apps.get_model('core', 'CompanyDataSubmission')
+    Company = apps.get_model('core', 'Company')
+    fill_slot_keys(CompanyDataSubmission)
+
+    duplicated = CompanyDataSubmission.objects.values('slot_key').annotate(rows=Count('id')).filter(rows__gt=1)
+    keys = list(duplicated.values_list('slot_key', flat=True))
+    merged = 0
+    companies = set()
+    for start in range(0, len(keys), 500):
+        groups = defaultdict(list)
+        for row in CompanyDataSubmission.objects.filter(slot_key__in=keys[start:start + 500]):
+            groups[row.slot_key].append(row)
+        for rows in groups.values():
+            merged += merge_slot(apps, rows)
+            companies.add(rows[0].company_id)
+
+    # Cached reports were computed over the duplicates
+    Company.objects.filter(pk__in=companies).update(data_version=F('data_version') + 1)
+    print(f"Merged {merged} duplicate submissions into {len(keys)} slots across {len(companies)} companies")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='companydatasubmission',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='slot_key',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(merge_duplicate_slots, migrations.RunPython.noop),
+    ]
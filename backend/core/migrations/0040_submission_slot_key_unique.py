@@ -0,0 +1,19 @@
+# Separate from 0039 so that on PostgreSQL the constraint isn't added in the transaction that deleted
+# the duplicates (ALTER TABLE fails while their deferred foreign key checks are pending)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_submission_slot_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='companydatasubmission',
+            name='slot_key',
+            field=models.CharField(editable=False, help_text='company|site|element|framework element|meter|year|period, 0/- for missing parts', max_length=255, unique=True),
+        ),
+    ]
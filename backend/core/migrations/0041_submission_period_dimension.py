@@ -0,0 +1,90 @@
+# Normalized reporting period: granularity, index and start date, backfilled from reporting_year/reporting_period
+
+import re
+from datetime import date
+
+from django.db import migrations, models
+
+PERIOD_FIELDS = ['period_granularity', 'period_index', 'period_start']
+
+# Frozen copy of core.models.reporting_period_parts as it was when this migration was written
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+
+def reporting_period_parts(year, period):
+    if period in MONTHS:
+        return 'month', MONTHS[period], date(year, MONTHS[period], 1)
+    match = re.fullmatch(r'Q([1-4])', str(period or ''))
+    if match:
+        quarter = int(match.group(1))
+        return 'quarter', quarter, date(year, (quarter - 1) * 3 + 1, 1)
+    return 'year', 1, date(year, 1, 1)
+
+
+def backfill_periods(apps, schema_editor, batch_size=2000):
+    CompanyDataSubmission = apps.get_model('core', 'CompanyDataSubmission')
+    last_pk = filled = 0
+    while True:
+        batch = list(CompanyDataSubmission.objects.filter(pk__gt=last_pk).order_by('pk').only(
+            'pk', 'reporting_year', 'reporting_period'
+        )[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for submission in batch:
+            submission.period_granularity, submission.period_index, submission.period_start = reporting_period_parts(
+                submission.reporting_year, submission.reporting_period
+            )
+        CompanyDataSubmission.objects.bulk_update(batch, PERIOD_FIELDS)
+        filled += len(batch)
+    print(f"Filled the reporting period of {filled} submissions")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_submission_slot_key_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='period_granularity',
+            field=models.CharField(choices=[('month', 'Month'), ('quarter', 'Quarter'), ('year', 'Year')], editable=False, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='period_index',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='companydatasubmission',
+            name='period_start',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_periods, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='companydatasubmission',
+            name='period_granularity',
+            field=models.CharField(choices=[('month', 'Month'), ('quarter', 'Quarter'), ('year', 'Year')], editable=False, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='companydatasubmission',
+            name='period_index',
+            field=models.PositiveSmallIntegerField(editable=False, help_text='Month 1-12, quarter 1-4, or 1 for a year'),
+        ),
+        migrations.AlterField(
+            model_name='companydatasubmission',
+            name='period_start',
+            field=models.DateField(editable=False, help_text='First day of the reporting period'),
+        ),
+        migrations.AddIndex(
+            model_name='companydatasubmission',
+            index=models.Index(fields=['company', 'period_start', 'period_granularity'], name='submission_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companydatasubmission',
+            index=models.Index(fields=['company', 'site', 'period_start', 'period_granularity'], name='submission_site_period_idx'),
+        ),
+    ]
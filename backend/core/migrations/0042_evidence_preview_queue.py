@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_submission_period_dimension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evidenceblob',
+            name='preview_started_at',
+            field=models.DateTimeField(blank=True, help_text='When a preview worker claimed the blob', null=True),
+        ),
+        migrations.AlterField(
+            model_name='evidenceblob',
+            name='preview_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='evidenceblob',
+            index=models.Index(fields=['preview_status', 'created_at'], name='evidence_preview_queue_idx'),
+        ),
+    ]
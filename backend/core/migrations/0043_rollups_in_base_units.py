@@ -0,0 +1,93 @@
+# Consumption rollups total value_normalized (base units) instead of value_numeric: rebuild them
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+# Frozen copies of the period helpers as they were when this migration was written
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+
+def period_quarter(period):
+    month = MONTHS.get(period)
+    if month:
+        return (month - 1) // 3 + 1
+    match = re.fullmatch(r'Q([1-4])', str(period or ''))
+    return int(match.group(1)) if match else None
+
+
+def rebuild_rollups(apps, value_field):
+    CompanyDataSubmission = apps.get_model('core', 'CompanyDataSubmission')
+    MeterMonthlyRollup = apps.get_model('core', 'MeterMonthlyRollup')
+    SiteQuarterlyRollup = apps.get_model('core', 'SiteQuarterlyRollup')
+    CompanyYearlyRollup = apps.get_model('core', 'CompanyYearlyRollup')
+    Company = apps.get_model('core', 'Company')
+
+    slot = ['company_id', 'site_id', 'meter_id', 'framework_element_id', 'reporting_year', 'reporting_period']
+    grouped = CompanyDataSubmission.objects.filter(
+        **{f'{value_field}__isnull': False}, meter__isnull=False, framework_element__isnull=False
+    ).values(*slot).annotate(total=Sum(value_field), readings=Count('id')).order_by()
+
+    months, quarters, years = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+    for row in grouped.iterator(chunk_size=2000):
+        company, site, meter, element, year, period = (row[field] for field in slot)
+        targets = [years[(company, element, year)]]
+        if period_quarter(period):
+            targets.append(quarters[(company, site, element, year, period_quarter(period))])
+        if period in MONTHS:
+            targets.append(months[(company, site, meter, element, year, MONTHS[period])])
+        for target in targets:
+            target[0] += row['total']
+            target[1] += row['readings']
+
+    for model in (MeterMonthlyRollup, SiteQuarterlyRollup, CompanyYearlyRollup):
+        model.objects.all().delete()
+    MeterMonthlyRollup.objects.bulk_create([
+        MeterMonthlyRollup(company_id=company, site_id=site, meter_id=meter, framework_element_id=element,
+                           year=year, month=month, total=total, readings=readings)
+        for (company, site, meter, element, year, month), (total, readings) in months.items()
+    ], batch_size=1000)
+    SiteQuarterlyRollup.objects.bulk_create([
+        SiteQuarterlyRollup(company_id=company, site_id=site, framework_element_id=element,
+                            year=year, quarter=quarter, total=total, readings=readings)
+        for (company, site, element, year, quarter), (total, readings) in quarters.items()
+    ], batch_size=1000)
+    CompanyYearlyRollup.objects.bulk_create([
+        CompanyYearlyRollup(company_id=company, framework_element_id=element, year=year, total=total, readings=readings)
+        for (company, element, year), (total, readings) in years.items()
+    ], batch_size=1000)
+
+    # Cached reports were computed from the old totals
+    Company.objects.update(data_version=F('data_version') + 1)
+    print(f"Rebuilt {len(months)} meter-month, {len(quarters)} site-quarter and {len(years)} company-year rollups "
+          f"from {value_field}")
+
+
+def rollups_from_normalized(apps, schema_editor):
+    rebuild_rollups(apps, 'value_normalized')
+
+
+def rollups_from_numeric(apps, schema_editor):
+    rebuild_rollups(apps, 'value_numeric')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_evidence_preview_queue'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='companydatasubmission',
+            name='submission_numeric_idx',
+        ),
+        migrations.AddIndex(
+            model_name='companydatasubmission',
+            index=models.Index(fields=['company', 'framework_element', 'reporting_year', 'reporting_period', 'value_normalized'], name='submission_numeric_idx'),
+        ),
+        migrations.RunPython(rollups_from_normalized, rollups_from_numeric),
+    ]
@@ -1,9 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+import os
 import secrets
-from datetime import timedelta
+import re
+import uuid
+from datetime import date, timedelta
 from django.utils import timezone
+from .units import normalize, parse_numeric
 
 # Add company field to User model dynamically
 User.add_to_class('company', models.ForeignKey('core.Company', on_delete=models.CASCADE, null=True, blank=True, related_name='members'))
@@ -85,6 +90,7 @@ class Company(models.Model):
     company_code = models.CharField(max_length=10, unique=True, help_text="Unique company identifier code (e.g., DXB001)")
     emirate = models.CharField(max_length=100, choices=EMIRATE_CHOICES)
     sector = models.CharField(max_length=100, choices=SECTOR_CHOICES)
+    data_version = models.PositiveIntegerField(default=0, help_text="Bumped whenever the company's submissions or checklist change; keys report caches")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -363,15 +369,88 @@ class Meter(models.Model):
     is_auto_created = models.BooleanField(default=False)  # Track if meter was auto-generated
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Active meters of a type at a site, as matched to metered elements
+            models.Index(fields=['company', 'site', 'type', 'status'], name='meter_lookup_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.company.name} - {self.type} - {self.name} (User: {self.user.username})"
     
+    @staticmethod
+    def data_filter():
+        """Submissions that hold actual data or evidence"""
+        return (models.Q(value__isnull=False, value__gt='') |
+                models.Q(evidence_file__isnull=False, evidence_file__gt=''))
+
     def has_data(self):
         """Check if meter has any data submissions with actual data or evidence"""
-        return self.companydatasubmission_set.filter(
-            models.Q(value__isnull=False, value__gt='') | 
-            models.Q(evidence_file__isnull=False, evidence_file__gt='')
-        ).exists()
+        return self.companydatasubmission_set.filter(Meter.data_filter()).exists()
+
+
+def evidence_blob_path(instance, filename):
+    """Content-addressed path: evidence/blobs/ab/cd/<sha256><ext>"""
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f"evidence/blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}{extension}"
+
+
+class EvidenceBlob(models.Model):
+    """Evidence file stored once per unique content and shared by every submission that uploads it"""
+    PREVIEW_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('unsupported', 'Unsupported'),
+        ('failed', 'Failed'),
+    ]
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to=evidence_blob_path)
+    size = models.BigIntegerField(help_text="File size in bytes")
+    ref_count = models.PositiveIntegerField(default=0, help_text="Number of submissions pointing at this blob")
+    preview = models.FileField(blank=True, help_text="Downscaled JPEG stored next to the original")
+    preview_status = models.CharField(max_length=20, choices=PREVIEW_STATUS_CHOICES, default='pending')
+    preview_started_at = models.DateTimeField(null=True, blank=True, help_text="When a preview worker claimed the blob")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['preview_status', 'created_at'], name='evidence_preview_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.size} bytes, {self.ref_count} refs)"
+
+
+MONTH_ORDER = {date(2000, month, 1).strftime('%b'): month for month in range(1, 13)}
+
+
+def reporting_period_parts(year, period):
+    """
+    (granularity, index, start) of a reporting period: 'Jan'..'Dec' are
+    months 1-12, 'Q1'..'Q4' quarters 1-4, anything else is the whole year.
+    """
+    if period in MONTH_ORDER:
+        month = MONTH_ORDER[period]
+        return 'month', month, date(year, month, 1)
+    match = re.fullmatch(r'Q([1-4])', str(period or ''))
+    if match:
+        quarter = int(match.group(1))
+        return 'quarter', quarter, date(year, (quarter - 1) * 3 + 1, 1)
+    return 'year', 1, date(year, 1, 1)
+
+
+def submission_slot_key(company_id, site_id, data_element_id, framework_element_id, meter_id, year, period):
+    """
+    The canonical identity of a submission slot. Missing dimensions get a
+    sentinel (0, or '-' for the framework element), so unlike a unique
+    constraint over the nullable columns, two slots that differ only in
+    which columns are NULL still collide.
+    """
+    return '|'.join(str(part) for part in (
+        company_id, site_id or 0, data_element_id or 0, framework_element_id or '-', meter_id or 0, year, period,
+    ))
 
 
 class CompanyDataSubmission(models.Model):
@@ -381,6 +460,11 @@ class CompanyDataSubmission(models.Model):
         ('partial', 'Partial'),
         ('complete', 'Complete'),
     ]
+    GRANULARITY_CHOICES = [
+        ('month', 'Month'),
+        ('quarter', 'Quarter'),
+        ('year', 'Year'),
+    ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -390,8 +474,19 @@ class CompanyDataSubmission(models.Model):
     meter = models.ForeignKey(Meter, on_delete=models.CASCADE, null=True, blank=True)
     reporting_year = models.PositiveIntegerField()
     reporting_period = models.CharField(max_length=50)  # e.g., 'Jan', 'Q1', '2025'
+    # reporting_year/reporting_period normalized, so period ranges are index range scans
+    period_granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES, editable=False)
+    period_index = models.PositiveSmallIntegerField(editable=False, help_text="Month 1-12, quarter 1-4, or 1 for a year")
+    period_start = models.DateField(editable=False, help_text="First day of the reporting period")
+    slot_key = models.CharField(max_length=255, unique=True, editable=False,
+                                help_text="company|site|element|framework element|meter|year|period, 0/- for missing parts")
     value = models.TextField(blank=True)
+    value_numeric = models.DecimalField(max_digits=24, decimal_places=6, null=True, blank=True, editable=False,
+                                        help_text="value parsed as a number; null when blank, inactive or not numeric")
+    value_normalized = models.DecimalField(max_digits=24, decimal_places=6, null=True, blank=True, editable=False,
+                                           help_text="value_numeric in the base unit of the element's unit (kWh, m³, kg)")
     evidence_file = models.FileField(upload_to='evidence/%Y/%m/%d/', blank=True)
+    evidence_blob = models.ForeignKey(EvidenceBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='submissions')
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_tasks')
     assigned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tasks_assigned')
     assigned_at = models.DateTimeField(null=True, blank=True)
@@ -399,7 +494,79 @@ class CompanyDataSubmission(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        unique_together = ('user', 'company', 'site', 'element', 'framework_element', 'meter', 'reporting_year', 'reporting_period')
+        indexes = [
+            # The slot lookup of the tasks and dashboard views
+            models.Index(fields=['company', 'site', 'framework_element', 'meter', 'reporting_year', 'reporting_period'],
+                         name='submission_slot_idx'),
+            # Covers SUM/AVG of value_normalized per company, element and period without touching the table
+            models.Index(fields=['company', 'framework_element', 'reporting_year', 'reporting_period', 'value_normalized'],
+                         name='submission_numeric_idx'),
+            # Period ranges ("Q2 to Q4", "the last 12 months") for the company, or one of its sites
+            models.Index(fields=['company', 'period_start', 'period_granularity'], name='submission_period_idx'),
+            models.Index(fields=['company', 'site', 'period_start', 'period_granularity'],
+                         name='submission_site_period_idx'),
+        ]
+    
+    NUMERIC_FIELDS = ['value_numeric', 'value_normalized']
+    SLOT_FIELDS = ['company', 'site', 'element', 'framework_element', 'meter', 'reporting_year', 'reporting_period']
+    PERIOD_FIELDS = ['period_granularity', 'period_index', 'period_start']
+    
+    def refresh_numeric_value(self):
+        """Re-derive value_numeric and value_normalized from value"""
+        element = self.element_instance
+        self.value_numeric = parse_numeric(self.value)
+        self.value_normalized = normalize(self.value_numeric, element.unit if element else '')
+    
+    def refresh_slot_key(self):
+        self.slot_key = submission_slot_key(
+            self.company_id, self.site_id, self.element_id, self.framework_element_id, self.meter_id,
+            self.reporting_year, self.reporting_period,
+        )
+    
+    def refresh_period(self):
+        self.period_granularity, self.period_index, self.period_start = reporting_period_parts(
+            self.reporting_year, self.reporting_period
+        )
+    
+    @staticmethod
+    def period_filter(start, end, granularity='month'):
+        """Submissions of `granularity` whose period starts in [start, end] - a range scan on the period indexes"""
+        # The year bounds are redundant but let PostgreSQL skip year partitions outside the range
+        return models.Q(period_start__gte=start, period_start__lte=end, period_granularity=granularity,
+                        reporting_year__gte=start.year, reporting_year__lte=end.year)
+    
+    def save(self, *args, **kwargs):
+        self.refresh_numeric_value()
+        self.refresh_slot_key()
+        self.refresh_period()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'value' in update_fields:
+                update_fields |= set(self.NUMERIC_FIELDS)
+            if update_fields & set(self.SLOT_FIELDS):
+                update_fields.add('slot_key')
+            if update_fields & {'reporting_year', 'reporting_period'}:
+                update_fields |= set(self.PERIOD_FIELDS)
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The row as loaded, so a save can tell which rollup cells it leaves without reading the row again
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None:
+            self._loaded_values = {
+                field.attname: self.__dict__[field.attname]
+                for field in self._meta.concrete_fields if field.attname in self.__dict__
+            }
+        else:
+            self.__dict__.pop('_loaded_values', None)  # Partly refreshed, so the next save reads the row
     
     @property
     def element_instance(self):
@@ -436,6 +603,223 @@ class CompanyDataSubmission(models.Model):
         return f"{self.company.name} - {self.element_name} - {self.reporting_period}/{self.reporting_year}"
 
 
+class EvidenceUpload(models.Model):
+    """Resumable chunked upload session for a submission's evidence file"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='evidence_uploads')
+    submission = models.ForeignKey(CompanyDataSubmission, on_delete=models.CASCADE, related_name='evidence_uploads')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField(help_text="Expected file size in bytes")
+    received_bytes = models.BigIntegerField(default=0, help_text="Contiguous bytes written so far")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Content hash, set on finalize")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.total_size
+
+
+class StorageUsage(models.Model):
+    """Running evidence storage totals per company and site, kept in step as evidence changes"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='storage_usage')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, null=True, blank=True, related_name='storage_usage',
+                             help_text="Null for evidence on submissions without a site")
+    bytes_used = models.BigIntegerField(default=0)
+    file_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'site'], name='unique_storage_usage_site'),
+            models.UniqueConstraint(fields=['company'], condition=models.Q(site__isnull=True),
+                                    name='unique_storage_usage_no_site'),
+        ]
+
+    def __str__(self):
+        return f"{self.company.name} / {self.site.name if self.site else 'No site'}: {self.file_count} files, {self.bytes_used} bytes"
+
+
+class ReportJob(models.Model):
+    """A report pack rendered off the request path; the artifact is reused while the company's data is unchanged"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='report_jobs')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, null=True, blank=True, related_name='report_jobs')
+    framework_id = models.CharField(max_length=100, blank=True)
+    year = models.PositiveIntegerField()
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    data_version = models.PositiveIntegerField(help_text="Company data version the report was requested at")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0)
+    stage = models.CharField(max_length=100, blank=True)
+    artifact = models.FileField(upload_to='reports/', blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the artifact")
+    size = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'year', 'data_version', 'status'], name='report_job_lookup_idx'),
+            models.Index(fields=['status', 'created_at'], name='report_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.company.name} {self.year} report ({self.status}, {self.progress}%)"
+
+
+class QualityFlag(models.Model):
+    """A data-quality check that a submission failed, from the element's quality_checks"""
+    RULE_CHOICES = [
+        ('non_negative', 'Negative value'),
+        ('range', 'Out of range'),
+        ('mom_jump', 'Month-over-month jump'),
+        ('evidence_required', 'Evidence missing'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='quality_flags')
+    submission = models.ForeignKey(CompanyDataSubmission, on_delete=models.CASCADE, related_name='quality_flags')
+    rule = models.CharField(max_length=50, choices=RULE_CHOICES)
+    message = models.CharField(max_length=255)
+    detected_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['submission', 'rule'], name='unique_quality_flag'),
+        ]
+        indexes = [models.Index(fields=['company', 'rule'], name='quality_flag_company_idx')]
+
+    def __str__(self):
+        return f"{self.submission_id} {self.rule}: {self.message}"
+
+
+class MeterMonthlyRollup(models.Model):
+    """Summed value_normalized of one meter's submissions for an element and month"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='meter_rollups')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, null=True, blank=True, related_name='meter_rollups')
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='monthly_rollups')
+    framework_element = models.ForeignKey(FrameworkElement, on_delete=models.CASCADE, related_name='meter_rollups')
+    year = models.PositiveIntegerField()
+    month = models.PositiveSmallIntegerField()
+    total = models.DecimalField(max_digits=28, decimal_places=6, default=0)
+    readings = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['meter', 'framework_element', 'year', 'month'], name='unique_meter_month_rollup'),
+        ]
+        indexes = [models.Index(fields=['company', 'year', 'month'], name='meter_rollup_company_idx')]
+
+    def __str__(self):
+        return f"{self.meter} {self.year}-{self.month:02d}: {self.total}"
+
+
+class SiteQuarterlyRollup(models.Model):
+    """Summed value_normalized of a site's metered submissions for an element and quarter"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='site_rollups')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, null=True, blank=True, related_name='quarterly_rollups',
+                             help_text="Null for meters without a site")
+    framework_element = models.ForeignKey(FrameworkElement, on_delete=models.CASCADE, related_name='site_rollups')
+    year = models.PositiveIntegerField()
+    quarter = models.PositiveSmallIntegerField()
+    total = models.DecimalField(max_digits=28, decimal_places=6, default=0)
+    readings = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'site', 'framework_element', 'year', 'quarter'],
+                                    name='unique_site_quarter_rollup'),
+            models.UniqueConstraint(fields=['company', 'framework_element', 'year', 'quarter'],
+                                    condition=models.Q(site__isnull=True), name='unique_site_quarter_rollup_no_site'),
+        ]
+
+    def __str__(self):
+        return f"{self.site.name if self.site else 'No site'} {self.year} Q{self.quarter}: {self.total}"
+
+
+class CompanyYearlyRollup(models.Model):
+    """Summed value_normalized of a company's metered submissions for an element and year"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='yearly_rollups')
+    framework_element = models.ForeignKey(FrameworkElement, on_delete=models.CASCADE, related_name='company_rollups')
+    year = models.PositiveIntegerField()
+    total = models.DecimalField(max_digits=28, decimal_places=6, default=0)
+    readings = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'framework_element', 'year'], name='unique_company_year_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.company.name} {self.year}: {self.total}"
+
+
+class EmissionFactor(models.Model):
+    """Emission factor for one source and emirate over a validity period"""
+    SCOPE_CHOICES = [
+        ('scope_1', 'Scope 1'),
+        ('scope_2', 'Scope 2'),
+        ('scope_3', 'Scope 3'),
+    ]
+
+    source = models.CharField(max_length=100, help_text="Element meter type (e.g. electricity) or a framework element_id")
+    emirate = models.CharField(max_length=100, choices=Company.EMIRATE_CHOICES, blank=True,
+                               help_text="Blank applies to every emirate without its own factor")
+    valid_from = models.DateField()
+    valid_to = models.DateField(null=True, blank=True, help_text="Inclusive; blank while the factor is current")
+    factor = models.DecimalField(max_digits=18, decimal_places=8, help_text="Emissions per unit of activity")
+    unit = models.CharField(max_length=50, default='kg CO2e', help_text="Output unit of the factor (kg or t CO2e)")
+    activity_unit = models.CharField(max_length=50, blank=True, help_text="e.g. kWh, m3, L")
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    reference = models.CharField(max_length=255, blank=True, help_text="Publisher and document the factor comes from")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['source', 'emirate', 'valid_from']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'emirate', 'valid_from'], name='unique_emission_factor_start'),
+        ]
+
+    def clean(self):
+        if self.valid_to and self.valid_to < self.valid_from:
+            raise ValidationError({'valid_to': 'valid_to must not be before valid_from'})
+        overlapping = EmissionFactor.objects.filter(
+            source=self.source, emirate=self.emirate
+        ).filter(
+            models.Q(valid_to__isnull=True) | models.Q(valid_to__gte=self.valid_from)
+        ).exclude(pk=self.pk)
+        if self.valid_to:
+            overlapping = overlapping.filter(valid_from__lte=self.valid_to)
+        if overlapping.exists():
+            raise ValidationError('This period overlaps another factor for the same source and emirate')
+
+    def __str__(self):
+        return f"{self.source} / {self.emirate or 'all emirates'} from {self.valid_from}: {self.factor} {self.unit}"
+
+
 class CompanyChecklist(models.Model):
     """Stores the personalized checklist for each company"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
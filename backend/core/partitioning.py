@@ -0,0 +1,243 @@
+"""
+Year partitions of the submissions table - opt-in declarative partitioning on PostgreSQL
+"""
+import logging
+import re
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import CompanyDataSubmission
+
+logger = logging.getLogger(__name__)
+
+TABLE = CompanyDataSubmission._meta.db_table
+PARTITION_KEY = 'reporting_year'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def partition_name(year):
+    return f'{TABLE}_y{year}'
+
+
+class SubmissionPartitions:
+    """
+    Range-partition CompanyDataSubmission by reporting_year on PostgreSQL.
+
+    Applied by `manage.py partition_submissions --convert`, never by migrate.
+    convert() rebuilds the table as a partitioned one and moves the existing
+    rows in. There is one
+    partition per year, plus a default partition that catches years nobody
+    created a partition for. ensure() adds partitions ahead of time, and
+    moves any rows of those years out of the default partition.
+
+    PostgreSQL requires every unique constraint of a partitioned table to
+    include the partition key. The primary key therefore becomes
+    (id, reporting_year) and the slot_key constraint (slot_key,
+    reporting_year). slot_key already contains the year, so slots stay just as
+    unique. Foreign keys can't point at id alone any more, so those from
+    evidence uploads and quality flags exist in Django only. Django still
+    cascades deletes to them. revert() turns the table back into a plain one.
+
+    None of this is in Django's migration state, which still describes a
+    plain table with an id primary key, a unique slot_key and the foreign
+    keys above. A later migration that alters CompanyDataSubmission or a
+    foreign key to it can fail or undo part of the conversion on a
+    partitioned table. Run `partition_submissions --revert` before applying
+    such a migration and `--convert` afterwards, or write its SQL by hand
+    for the partitioned layout behind SeparateDatabaseAndState.
+
+    On any other database every method is a no-op.
+    """
+
+    @staticmethod
+    def supported(connection):
+        return connection.vendor == 'postgresql'
+
+    @staticmethod
+    def is_partitioned(connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+            row = cursor.fetchone()
+        return bool(row) and row[0] == 'p'
+
+    @staticmethod
+    def partitions(connection):
+        """[(name, bounds, rows)] of the attached partitions"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples::bigint
+                FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = to_regclass(%s)
+                ORDER BY child.relname
+                """,
+                [TABLE],
+            )
+            return cursor.fetchall()
+
+    @staticmethod
+    def default_rows(connection):
+        """Rows in the default partition - years that have no partition of their own"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {DEFAULT_PARTITION}')
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def wanted_years(cls, connection, ahead=None):
+        """Years that get a partition: every year with data, and this year up to `ahead` years on"""
+        ahead = getattr(settings, 'SUBMISSION_PARTITIONS_AHEAD', 2) if ahead is None else ahead
+        current = date.today().year
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT DISTINCT {PARTITION_KEY} FROM {TABLE}')
+            years = {row[0] for row in cursor.fetchall()}
+        return sorted(years | set(range(current, current + ahead + 1)))
+
+    @classmethod
+    def ensure(cls, connection, years):
+        """Create the partitions of `years` that don't exist yet; returns the names created"""
+        if not cls.supported(connection) or not cls.is_partitioned(connection):
+            return []
+        existing = {name for name, _, _ in cls.partitions(connection)}
+        created = []
+        for year in years:
+            name = partition_name(year)
+            if name in existing:
+                continue
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                # Built detached and attached afterwards, so rows of the year that landed in the
+                # default partition can be moved over first (attaching would fail while they're there)
+                cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+                cursor.execute(
+                    f'ALTER TABLE {name} ADD CONSTRAINT {name}_bounds '
+                    f'CHECK ({PARTITION_KEY} IS NOT NULL AND {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s)',
+                    [year, year + 1],
+                )
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {PARTITION_KEY} = %s RETURNING *) '
+                    f'INSERT INTO {name} SELECT * FROM moved',
+                    [year],
+                )
+                moved = cursor.rowcount
+                cursor.execute(
+                    f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [year, year + 1]
+                )
+                # The check only served to skip the validation scan of ATTACH
+                cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT {name}_bounds')
+            logger.info(f"[PARTITION] Created {name} ({moved} rows moved from the default partition)")
+            created.append(name)
+        return created
+
+    @staticmethod
+    def _definitions(cursor):
+        """Indexes, constraints and incoming foreign keys of the table, as SQL to recreate them"""
+        cursor.execute(
+            """
+            SELECT pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = to_regclass(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = pg_index.indexrelid)
+            """,
+            [TABLE],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f')",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE],
+        )
+        incoming = cursor.fetchall()
+        return indexes, constraints, incoming
+
+    @staticmethod
+    def _key_columns(definition, partitioned):
+        """The column list of a PRIMARY KEY/UNIQUE definition with the partition key added or removed"""
+        columns = [column.strip() for column in re.search(r'\((.*)\)', definition).group(1).split(',')]
+        columns = [column for column in columns if column != PARTITION_KEY]
+        if partitioned:
+            columns.append(PARTITION_KEY)
+        return ', '.join(columns)
+
+    @classmethod
+    def _rebuild(cls, connection, partitioned, years=()):
+        """Recreate the table partitioned (or plain again), copying rows, indexes and constraints across"""
+        old = f'{TABLE}_old'
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+            indexes, constraints, incoming = cls._definitions(cursor)
+
+            for table, name, _ in incoming:
+                cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+            cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+            partition_clause = f' PARTITION BY RANGE ({PARTITION_KEY})' if partitioned else ''
+            cursor.execute(
+                f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_clause}'
+            )
+            # A copied nextval() default would tie the new table to the old table's sequence
+            cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+            if partitioned:
+                cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+                for year in years:
+                    cursor.execute(
+                        f'CREATE TABLE {partition_name(year)} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                        [year, year + 1],
+                    )
+            cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+            copied = cursor.rowcount
+            # Frees the index, constraint and sequence names for the new table (and drops old partitions)
+            cursor.execute(f'DROP TABLE {old}')
+
+            for name, kind, definition in constraints:
+                if kind == 'p':
+                    definition = f'PRIMARY KEY ({cls._key_columns(definition, partitioned)})'
+                elif kind == 'u':
+                    definition = f'UNIQUE ({cls._key_columns(definition, partitioned)})'
+                cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+            for definition in indexes:
+                cursor.execute(definition)
+
+            # Identity columns can't be declared on partitioned tables, so ids come from an owned sequence
+            if partitioned:
+                cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq AS bigint OWNED BY {TABLE}.id')
+                cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+            else:
+                cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+            )
+
+            if not partitioned:
+                # The foreign keys the partitioned table couldn't have, as Django would create them
+                with connection.schema_editor(atomic=False) as schema_editor:
+                    for relation in CompanyDataSubmission._meta.related_objects:
+                        if relation.many_to_one and relation.field.db_constraint:
+                            schema_editor.execute(schema_editor._create_fk_sql(
+                                relation.related_model, relation.field, '_fk_%(to_table)s_%(to_column)s'
+                            ))
+        return copied, [name for _, name, _ in incoming]
+
+    @classmethod
+    def convert(cls, connection, ahead=None):
+        """Partition the table by reporting_year, moving every row into its year's partition"""
+        if not cls.supported(connection) or cls.is_partitioned(connection):
+            return None
+        years = cls.wanted_years(connection, ahead)
+        copied, dropped = cls._rebuild(connection, partitioned=True, years=years)
+        logger.info(f"[PARTITION] Partitioned {TABLE}: {copied} rows across {len(years)} years; "
+                    f"foreign keys now enforced by Django only: {', '.join(dropped) or 'none'}")
+        return {'rows': copied, 'years': years, 'dropped_foreign_keys': dropped}
+
+    @classmethod
+    def revert(cls, connection):
+        """Turn the partitioned table back into a plain one"""
+        if not cls.supported(connection) or not cls.is_partitioned(connection):
+            return None
+        copied, _ = cls._rebuild(connection, partitioned=False)
+        logger.info(f"[PARTITION] Merged the partitions of {TABLE} back into one table ({copied} rows)")
+        return {'rows': copied}
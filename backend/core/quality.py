@@ -0,0 +1,276 @@
+"""
+Data-quality checks - FrameworkElement.quality_checks compiled and run across a company-year in one pass
+"""
+import logging
+import math
+import operator
+import re
+from collections import Counter, defaultdict
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import MONTH_ORDER, CompanyDataSubmission, FrameworkElement, QualityFlag
+from .units import INACTIVE_PERIOD
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional - the same checks run as plain Python loops
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CHANGE_PCT = 50.0
+
+# Free-text checks from the framework files that can be executed; everything else stays a manual check
+TEXT_RULES = [
+    (re.compile(r'spike|surge|month-over-month|anomal', re.I), {'type': 'mom_jump'}),
+    (re.compile(r'non-negative|negative value', re.I), {'type': 'non_negative'}),
+    (re.compile(r'evidence (is )?required|supporting document', re.I), {'type': 'evidence_required'}),
+]
+
+RULE_ALIASES = {
+    'min_max': 'range',
+    'nonnegative': 'non_negative',
+    'positive': 'non_negative',
+    'month_over_month': 'mom_jump',
+    'spike': 'mom_jump',
+    'evidence': 'evidence_required',
+}
+
+
+class QualityCheckEngine:
+    """
+    Executes the machine-checkable part of each element's quality_checks.
+
+    Checks are compiled per element into four rule kinds - non_negative,
+    range (min/max), mom_jump (change against the same meter's previous month
+    above max_change_pct) and evidence_required. Structured entries
+    ({"type": "range", "min": 0, "max": 5000}) are used as given; free-text
+    entries are matched against TEXT_RULES.
+
+    A run loads the company-year's submissions with one values_list() query
+    into arrays and evaluates each rule as a mask over all rows at once:
+    per-element bounds are gathered by element index, and month-over-month
+    changes compare each row with its predecessor after sorting by
+    (site, meter, element, month). Flags for the scope are then replaced in
+    one transaction.
+    """
+
+    @staticmethod
+    def compile(quality_checks):
+        """Normalise an element's quality_checks into executable rules, one per rule type"""
+        rules = {}
+        for check in quality_checks or []:
+            if isinstance(check, dict):
+                rule_type = str(check.get('type') or check.get('check') or '').lower()
+                rule_type = RULE_ALIASES.get(rule_type, rule_type)
+                rule = {**check, 'type': rule_type}
+            else:
+                rule = next((dict(rule) for pattern, rule in TEXT_RULES if pattern.search(str(check))), None)
+                if rule is None:
+                    continue
+            if rule['type'] in dict(QualityFlag.RULE_CHOICES):
+                rules[rule['type']] = rule
+        return rules
+
+    @staticmethod
+    def _bound(rule, key):
+        try:
+            return float(rule[key]) if rule.get(key) is not None else math.nan
+        except (TypeError, ValueError):
+            return math.nan
+
+    @classmethod
+    def rows(cls, company, year, site_id=None, series=None):
+        """Submissions to check; series limits them to (site_id, meter_id, framework_element_id) triples"""
+        submissions = CompanyDataSubmission.objects.filter(
+            company=company, reporting_year=year, framework_element__isnull=False
+        ).exclude(value=INACTIVE_PERIOD)
+        if site_id:
+            submissions = submissions.filter(site_id=site_id)
+        if series is not None:
+            submissions = submissions.filter(reduce(operator.or_, (
+                Q(site_id=site, meter_id=meter, framework_element_id=element) for site, meter, element in series
+            ), Q(pk__in=[])))
+        return submissions.values_list(
+            'id', 'site_id', 'meter_id', 'framework_element_id', 'reporting_period', 'value', 'value_numeric', 'evidence_file'
+        )
+
+    @classmethod
+    def evaluate(cls, company, year, site_id=None, rows=None):
+        """[(submission_id, rule, message)] for every failed check in the scope, or in the given rows"""
+        rows = list(cls.rows(company, year, site_id=site_id) if rows is None else rows)
+        rules_by_element = {
+            element_id: cls.compile(checks)
+            for element_id, checks in FrameworkElement.objects.filter(
+                element_id__in={row[3] for row in rows}
+            ).values_list('element_id', 'quality_checks')
+        }
+        rows = [row for row in rows if rules_by_element.get(row[3])]
+        if not rows:
+            return []
+
+        elements = {element_id: index for index, element_id in enumerate(sorted({row[3] for row in rows}))}
+        series = {}
+        columns = {
+            'ids': [row[0] for row in rows],
+            'values': [float(row[6]) if row[6] is not None else math.nan for row in rows],
+            'has_value': [bool(row[5] and row[5].strip()) for row in rows],
+            'has_evidence': [bool(row[7]) for row in rows],
+            'element': [elements[row[3]] for row in rows],
+            'series': [series.setdefault((row[1], row[2], row[3]), len(series)) for row in rows],
+            'month': [MONTH_ORDER.get(row[4], 0) for row in rows],
+        }
+
+        # Per-element rule parameters, indexed by element position; nan / False where the rule is absent
+        parameters = {'non_negative': [], 'evidence_required': [], 'min': [], 'max': [], 'max_change': []}
+        for element_id in elements:
+            rules = rules_by_element[element_id]
+            parameters['non_negative'].append('non_negative' in rules)
+            parameters['evidence_required'].append('evidence_required' in rules)
+            parameters['min'].append(cls._bound(rules.get('range', {}), 'min'))
+            parameters['max'].append(cls._bound(rules.get('range', {}), 'max'))
+            change = cls._bound(rules['mom_jump'], 'max_change_pct') if 'mom_jump' in rules else math.nan
+            parameters['max_change'].append(
+                DEFAULT_MAX_CHANGE_PCT if 'mom_jump' in rules and math.isnan(change) else change
+            )
+
+        evaluate = cls._evaluate_arrays if np is not None else cls._evaluate_lists
+        return evaluate(columns, parameters)
+
+    @staticmethod
+    def _evaluate_arrays(columns, parameters):
+        ids = np.asarray(columns['ids'])
+        values = np.asarray(columns['values'], dtype=np.float64)
+        element = np.asarray(columns['element'], dtype=np.intp)
+        has_value = np.asarray(columns['has_value'], dtype=bool)
+        has_evidence = np.asarray(columns['has_evidence'], dtype=bool)
+
+        minimum = np.asarray(parameters['min'], dtype=np.float64)[element]
+        maximum = np.asarray(parameters['max'], dtype=np.float64)[element]
+        with np.errstate(invalid='ignore'):
+            masks = {
+                'non_negative': np.asarray(parameters['non_negative'], dtype=bool)[element] & (values < 0),
+                'range': (values < minimum) | (values > maximum),
+                'evidence_required': np.asarray(parameters['evidence_required'], dtype=bool)[element]
+                                     & has_value & ~has_evidence,
+            }
+
+            # Previous reading of the same series: sort by (series, month), compare each row with the one before
+            month = np.asarray(columns['month'], dtype=np.intp)
+            order = np.lexsort((month, np.asarray(columns['series'], dtype=np.intp)))
+            sorted_series = np.asarray(columns['series'], dtype=np.intp)[order]
+            sorted_values = values[order]
+            consecutive = np.zeros(len(order), dtype=bool)
+            consecutive[1:] = (sorted_series[1:] == sorted_series[:-1]) & (month[order][1:] == month[order][:-1] + 1) \
+                & (month[order][:-1] > 0)
+            previous = np.full(len(order), np.nan)
+            previous[1:] = sorted_values[:-1]
+            change = np.abs(sorted_values - previous) / np.abs(previous) * 100
+            limit = np.asarray(parameters['max_change'], dtype=np.float64)[element][order]
+            jump = np.zeros(len(order), dtype=bool)
+            jump[order] = consecutive & (previous != 0) & (change > limit)
+            masks['mom_jump'] = jump
+
+        flags = []
+        for rule, mask in masks.items():
+            for index in np.flatnonzero(mask):
+                flags.append((int(ids[index]), rule, QualityCheckEngine._message(rule, columns, parameters, index)))
+        return flags
+
+    @staticmethod
+    def _evaluate_lists(columns, parameters):
+        flags = []
+        values = columns['values']
+        latest = {}  # series -> (month, value) of the previous row in month order
+        order = sorted(range(len(values)), key=lambda i: (columns['series'][i], columns['month'][i]))
+        for index in order:
+            element = columns['element'][index]
+            value = values[index]
+            previous = latest.get(columns['series'][index])
+            latest[columns['series'][index]] = (columns['month'][index], value)
+
+            failed = []
+            if parameters['non_negative'][element] and value < 0:
+                failed.append('non_negative')
+            if value < parameters['min'][element] or value > parameters['max'][element]:
+                failed.append('range')
+            if parameters['evidence_required'][element] and columns['has_value'][index] and not columns['has_evidence'][index]:
+                failed.append('evidence_required')
+            if previous and previous[0] > 0 and columns['month'][index] == previous[0] + 1 and previous[1]:
+                change = abs(value - previous[1]) / abs(previous[1]) * 100
+                if change > parameters['max_change'][element]:
+                    failed.append('mom_jump')
+            flags.extend((columns['ids'][index], rule, QualityCheckEngine._message(rule, columns, parameters, index))
+                         for rule in failed)
+        return flags
+
+    @staticmethod
+    def _message(rule, columns, parameters, index):
+        value = columns['values'][index]
+        element = columns['element'][index]
+        if rule == 'non_negative':
+            return f'Value {value:g} is negative'
+        if rule == 'range':
+            bounds = [f'{bound:g}' if not math.isnan(bound) else '-' for bound in (parameters['min'][element], parameters['max'][element])]
+            return f'Value {value:g} is outside {bounds[0]}..{bounds[1]}'
+        if rule == 'evidence_required':
+            return 'Value entered without supporting evidence'
+        return f"Changed more than {parameters['max_change'][element]:g}% from the previous month"
+
+    @classmethod
+    def run(cls, company, year, site_id=None):
+        """Evaluate the scope and replace its stored flags; returns a summary"""
+        flags = cls.evaluate(company, year, site_id=site_id)
+        with transaction.atomic():
+            existing = QualityFlag.objects.filter(company=company, submission__reporting_year=year)
+            if site_id:
+                existing = existing.filter(submission__site_id=site_id)
+            existing.delete()
+            QualityFlag.objects.bulk_create([
+                QualityFlag(company=company, submission_id=submission_id, rule=rule, message=message[:255])
+                for submission_id, rule, message in flags
+            ], batch_size=1000)
+
+        counts = Counter(rule for _, rule, _ in flags)
+        logger.info(f"[QUALITY] {company.company_code} {year}: {len(flags)} flags {dict(counts)}")
+        return {
+            'company_id': company.id,
+            'year': year,
+            'site_id': site_id,
+            'flags': len(flags),
+            'by_rule': dict(counts),
+        }
+
+    @classmethod
+    def recheck(cls, company, submissions):
+        """
+        Re-check only the series of the given submissions, replacing their flags (used after bulk saves).
+
+        A row's flags depend on its own value and evidence, and for mom_jump on
+        the previous month of its (site, meter, element) series, so checking
+        the whole series of each changed row gives the same flags as a full run.
+        """
+        series_by_year = defaultdict(set)
+        for submission in submissions:
+            series_by_year[submission.reporting_year].add(
+                (submission.site_id, submission.meter_id, submission.framework_element_id)
+            )
+
+        flags = []
+        scope = {submission.id for submission in submissions}  # Rows now inactive lose their flags too
+        for year, series in series_by_year.items():
+            rows = list(cls.rows(company, year, series=series))
+            scope.update(row[0] for row in rows)
+            flags.extend(cls.evaluate(company, year, rows=rows))
+
+        with transaction.atomic():
+            QualityFlag.objects.filter(company=company, submission_id__in=scope).delete()
+            QualityFlag.objects.bulk_create([
+                QualityFlag(company=company, submission_id=submission_id, rule=rule, message=message[:255])
+                for submission_id, rule, message in flags
+            ], batch_size=1000)
+        return len(flags)
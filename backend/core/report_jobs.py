@@ -0,0 +1,257 @@
+"""
+Report packs - rendered by a background worker, stored content-addressed, reused per company data version
+"""
+import csv
+import hashlib
+import io
+import logging
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .db_router import read_from_replica
+from .emissions import CarbonAggregator
+from .evidence_service import STREAM_BLOCK_SIZE
+from .exports import SubmissionExporter, _safe_name
+from .models import QualityFlag, ReportJob
+from .reports import ConsumptionReport, CoverageReport, DataVersion, YearComparisonReport
+
+try:
+    from weasyprint import HTML
+except ImportError:
+    # WeasyPrint is optional - report packs then contain the HTML report only
+    HTML = None
+
+logger = logging.getLogger(__name__)
+
+
+class ReportPackRenderer:
+    """
+    Builds the report pack ZIP: report.html (and report.pdf when WeasyPrint
+    is installed) plus a data appendix of CSVs. The archive is written to a
+    temporary file, never held in memory.
+    """
+
+    def __init__(self, job, progress):
+        self.job = job
+        self.progress = progress
+
+    @read_from_replica
+    def sections(self):
+        job, company = self.job, self.job.company
+        site_id = job.site_id
+        self.progress(10, 'Coverage')
+        coverage = CoverageReport.get(company, job.year, site_id=site_id, framework_id=job.framework_id or None)
+        self.progress(25, 'Emissions')
+        emissions = CarbonAggregator.get(company, job.year, site_id=site_id)
+        self.progress(40, 'Consumption')
+        consumption = ConsumptionReport.get(company, job.year, site_id=site_id)
+        self.progress(50, 'Year-over-year')
+        comparison = YearComparisonReport.get(
+            company, job.year, job.year - 1, site_id=site_id, framework_id=job.framework_id or None
+        )
+        self.progress(60, 'Quality flags')
+        flags = QualityFlag.objects.filter(company=company, submission__reporting_year=job.year)
+        if site_id:
+            flags = flags.filter(submission__site_id=site_id)
+        quality = dict(flags.values_list('rule').annotate(count=Count('id')).order_by())
+        return {
+            'coverage': coverage,
+            'emissions': emissions,
+            'consumption': consumption,
+            'comparison': comparison,
+            'quality': quality,
+        }
+
+    def render(self, output):
+        """Write the pack into the binary file object `output`"""
+        job = self.job
+        context = {
+            'job': job,
+            'company': job.company,
+            'site': job.site,
+            'generated_at': timezone.now(),
+            **self.sections(),
+        }
+
+        with zipfile.ZipFile(output, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            self.progress(70, 'Data appendix')
+            submissions = SubmissionExporter.submissions(
+                job.company, year=job.year, site_id=job.site_id, framework_id=job.framework_id or None
+            )
+            with archive.open('appendix/submissions.csv', mode='w', force_zip64=True) as member:
+                for chunk in SubmissionExporter.stream_csv(submissions):
+                    member.write(chunk)
+
+            coverage_csv = io.StringIO()
+            writer = csv.writer(coverage_csv)
+            writer.writerow(CoverageReport.TABLE_COLUMNS)
+            writer.writerows(CoverageReport.table(context['coverage']))
+            archive.writestr('appendix/coverage.csv', coverage_csv.getvalue().encode('utf-8-sig'))
+
+            self.progress(85, 'Rendering report')
+            html = render_to_string('reports/report_pack.html', context)
+            archive.writestr('report.html', html.encode('utf-8'))
+            if HTML is not None:
+                self.progress(92, 'Rendering PDF')
+                archive.writestr('report.pdf', HTML(string=html).write_pdf(), compress_type=zipfile.ZIP_STORED)
+
+
+class ReportJobService:
+    """
+    Queue, run and reuse report jobs.
+
+    request() returns an existing job when one for the same company, year,
+    site and framework was made at the current data version (complete, or
+    still queued/running), so unchanged data is never rendered twice.
+
+    New jobs stay queued for the run_report_worker command, which claims them
+    from any number of worker processes with a conditional UPDATE. For
+    development, REPORT_JOB_WORKER='thread' runs them in a thread pool of the
+    web process instead; it is ignored unless DEBUG is on.
+
+    A failed job keeps a generic error for the API; the traceback goes to the
+    log.
+    """
+
+    FAILURE_MESSAGE = 'The report could not be generated. Please try again later.'
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def matching(company, year, site_id=None, framework_id=''):
+        return ReportJob.objects.filter(
+            company=company, year=year, site_id=site_id, framework_id=framework_id or '',
+        )
+
+    @classmethod
+    def request(cls, company, year, site_id=None, framework_id='', user=None):
+        """(job, reused) for the current data version"""
+        version = DataVersion.current(company.id)
+        existing = cls.matching(company, year, site_id, framework_id).filter(
+            data_version=version, status__in=['queued', 'running', 'complete']
+        ).order_by('-created_at').first()
+        if existing and (existing.status != 'complete' or existing.artifact.storage.exists(existing.artifact.name)):
+            return existing, True
+
+        job = ReportJob.objects.create(
+            company=company, year=year, site_id=site_id, framework_id=framework_id or '',
+            requested_by=user, data_version=version,
+        )
+        if cls.runs_in_web_process():
+            transaction.on_commit(lambda: cls.executor().submit(cls._run_in_thread, job.pk))
+        return job, False
+
+    @staticmethod
+    def runs_in_web_process():
+        if getattr(settings, 'REPORT_JOB_WORKER', 'process') != 'thread':
+            return False
+        if not settings.DEBUG:
+            logger.warning("[REPORT_JOB] REPORT_JOB_WORKER=thread is for development only; "
+                           "leaving the job for run_report_worker")
+            return False
+        return True
+
+    @classmethod
+    def executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'REPORT_JOB_WORKERS', 1),
+                    thread_name_prefix='report-job',
+                )
+            return cls._executor
+
+    @classmethod
+    def _run_in_thread(cls, job_id):
+        try:
+            if cls.claim(job_id):
+                cls.run(job_id)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def claim(job_id):
+        """Move a queued job to running; False if another worker got it first"""
+        return bool(ReportJob.objects.filter(pk=job_id, status='queued').update(
+            status='running', started_at=timezone.now(), stage='Starting'
+        ))
+
+    @classmethod
+    def claim_next(cls):
+        for job_id in ReportJob.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True)[:10]:
+            if cls.claim(job_id):
+                return job_id
+        return None
+
+    @staticmethod
+    def requeue_stale(max_age):
+        """Put running jobs whose worker died (started more than max_age ago) back in the queue"""
+        return ReportJob.objects.filter(
+            status='running', started_at__lt=timezone.now() - max_age
+        ).update(status='queued', progress=0, stage='Requeued')
+
+    @classmethod
+    def run(cls, job_id):
+        """Render a claimed job and store its artifact"""
+        job = ReportJob.objects.select_related('company', 'site').get(pk=job_id)
+
+        def progress(percent, stage):
+            ReportJob.objects.filter(pk=job_id).update(progress=percent, stage=stage)
+
+        try:
+            with tempfile.TemporaryFile() as output:
+                ReportPackRenderer(job, progress).render(output)
+
+                progress(96, 'Storing')
+                digest = hashlib.sha256()
+                output.seek(0)
+                for block in iter(lambda: output.read(STREAM_BLOCK_SIZE), b''):
+                    digest.update(block)
+                size = output.tell()
+                content_hash = digest.hexdigest()
+
+                output.seek(0)
+                name = f'reports/{_safe_name(job.company.company_code)}/{content_hash}.zip'
+                storage = job.artifact.storage
+                if not storage.exists(name):
+                    name = storage.save(name, File(output))
+
+            ReportJob.objects.filter(pk=job_id).update(
+                status='complete', progress=100, stage='Complete', artifact=name,
+                content_hash=content_hash, size=size, finished_at=timezone.now(),
+            )
+            logger.info(f"[REPORT_JOB] {job_id} complete: {name} ({size} bytes)")
+        except Exception:
+            logger.exception(f"[REPORT_JOB] {job_id} failed")
+            ReportJob.objects.filter(pk=job_id).update(
+                status='failed', stage='Failed', error=cls.FAILURE_MESSAGE, finished_at=timezone.now()
+            )
+
+    @staticmethod
+    def download_name(job):
+        parts = [job.company.company_code, str(job.year)]
+        if job.site_id:
+            parts.append(_safe_name(job.site.name))
+        return f"{'_'.join(parts)}_report.zip"
+
+    @staticmethod
+    def cleanup(older_than=timedelta(days=30)):
+        """Delete finished jobs older than `older_than` and artifacts no remaining job points to"""
+        old = ReportJob.objects.filter(finished_at__lt=timezone.now() - older_than)
+        names = set(old.exclude(artifact='').values_list('artifact', flat=True))
+        deleted, _ = old.delete()
+        still_used = set(ReportJob.objects.filter(artifact__in=names).values_list('artifact', flat=True))
+        for name in names - still_used:
+            ReportJob._meta.get_field('artifact').storage.delete(name)
+        return deleted
@@ -0,0 +1,325 @@
+"""
+Reporting API views
+"""
+import csv
+import logging
+
+from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.http import FileResponse, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, quote_etag
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .authentication import CsrfExemptSessionAuthentication
+from .db_router import ReplicaReadMixin
+from .emissions import CarbonAggregator
+from .evidence_service import STREAM_BLOCK_SIZE
+from .models import QualityFlag, ReportJob
+from .quality import QualityCheckEngine
+from .report_jobs import ReportJobService
+from .reports import ConsumptionReport, CoverageReport, YearComparisonReport
+from .views import editable_site_ids, get_user_company
+
+logger = logging.getLogger(__name__)
+
+
+def _report_params(request):
+    """Validate the shared company_id/year/site_id query parameters"""
+    company_id = request.query_params.get('company_id')
+    year = request.query_params.get('year')
+    site_id = request.query_params.get('site_id')
+    if not company_id or not year or not year.isdigit() or (site_id and not site_id.isdigit()):
+        return None, Response(
+            {'error': 'company_id and a numeric year are required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        company = get_user_company(request.user, company_id)
+    except PermissionDenied as e:
+        return None, Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+    return (company, int(year), int(site_id) if site_id else None), None
+
+
+class CoverageReportView(ReplicaReadMixin, APIView):
+    """
+    Framework coverage report.
+
+    GET /api/reports/coverage/?company_id=1&year=2025[&site_id=2][&framework_id=...][&file_type=csv]
+
+    JSON nests framework -> category -> site -> period with coverage at each
+    level; file_type=csv returns the flat per-period table instead.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+        framework_id = request.query_params.get('framework_id')
+
+        report = CoverageReport.get(company, year, site_id=site_id, framework_id=framework_id)
+
+        if request.query_params.get('file_type') == 'csv':
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = content_disposition_header(
+                True, f'{company.company_code}_{year}_coverage.csv'
+            )
+            writer = csv.writer(response)
+            writer.writerow(CoverageReport.TABLE_COLUMNS)
+            writer.writerows(CoverageReport.table(report))
+            return response
+
+        return Response(report)
+
+
+class EmissionsReportView(ReplicaReadMixin, APIView):
+    """
+    Carbon emissions totals.
+
+    GET /api/reports/emissions/?company_id=1&year=2025[&site_id=2]
+
+    Totals in kg CO2e by scope, site, month and source for the company's
+    numeric metered submissions.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+        return Response(CarbonAggregator.get(company, year, site_id=site_id))
+
+
+class ConsumptionReportView(ReplicaReadMixin, APIView):
+    """
+    Metered consumption from the rollup tables.
+
+    GET /api/reports/consumption/?company_id=1&year=2025[&site_id=2]
+
+    Element totals for the year plus the site x quarter and meter x month
+    breakdowns, each in the element's unit.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+        return Response(ConsumptionReport.get(company, year, site_id=site_id))
+
+
+class QualityCheckView(ReplicaReadMixin, APIView):
+    """
+    Data-quality flags from the elements' quality_checks.
+
+    GET  /api/reports/quality/?company_id=1&year=2025[&site_id=2][&rule=mom_jump]
+         Stored flags with their submissions.
+    POST /api/reports/quality/?company_id=1&year=2025[&site_id=2]
+         Re-run the checks for the scope and replace its flags.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+
+        flags = QualityFlag.objects.filter(company=company, submission__reporting_year=year)
+        if site_id:
+            flags = flags.filter(submission__site_id=site_id)
+        rule = request.query_params.get('rule')
+        if rule:
+            flags = flags.filter(rule=rule)
+
+        return Response({
+            'company_id': company.id,
+            'year': year,
+            'flags': list(flags.order_by('submission__site__name', 'submission__framework_element_id', 'submission_id').values(
+                'id', 'rule', 'message', 'detected_at', 'submission_id',
+                site_name=F('submission__site__name'),
+                element_id=F('submission__framework_element_id'),
+                meter_name=F('submission__meter__name'),
+                reporting_period=F('submission__reporting_period'),
+                value=F('submission__value'),
+            )),
+        })
+
+    def post(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+
+        # Replacing flags is a write: viewers can't, site-scoped roles only for their own sites
+        sites = editable_site_ids(request.user, company)
+        if sites is not None and site_id not in sites:
+            return Response(
+                {'error': "You don't have permission to run quality checks for this scope"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(QualityCheckEngine.run(company, year, site_id=site_id))
+
+
+class YearComparisonView(ReplicaReadMixin, APIView):
+    """
+    Year-over-year comparison.
+
+    GET /api/reports/year-comparison/?company_id=1&year=2025[&base_year=2024][&site_id=2][&framework_id=...]
+
+    Per-element totals for both years with delta and change_pct, broken
+    down by site. base_year defaults to the year before.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+
+        base_year = request.query_params.get('base_year')
+        if base_year and not base_year.isdigit():
+            return Response({'error': 'base_year must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        base_year = int(base_year) if base_year else year - 1
+
+        return Response(YearComparisonReport.get(
+            company, year, base_year, site_id=site_id, framework_id=request.query_params.get('framework_id')
+        ))
+
+
+def _job_payload(request, job):
+    payload = {
+        'id': str(job.id),
+        'company_id': job.company_id,
+        'year': job.year,
+        'site_id': job.site_id,
+        'framework_id': job.framework_id or None,
+        'data_version': job.data_version,
+        'status': job.status,
+        'progress': job.progress,
+        'stage': job.stage,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+        'status_url': request.build_absolute_uri(reverse('report-job', args=[job.id])),
+    }
+    if job.status == 'complete':
+        payload['content_hash'] = job.content_hash
+        payload['size'] = job.size
+        payload['download_url'] = request.build_absolute_uri(reverse('report-job-download', args=[job.id]))
+    elif job.status == 'failed':
+        # Details are in the worker's log, not in the API
+        payload['error'] = ReportJobService.FAILURE_MESSAGE
+    return payload
+
+
+class ReportJobListView(APIView):
+    """
+    Report packs rendered in the background.
+
+    POST /api/reports/jobs/?company_id=1&year=2025[&site_id=2][&framework_id=...]
+         Queue a report pack (202). If one was already made or is being made
+         from the company's current data, that job is returned instead (200).
+    GET  /api/reports/jobs/?company_id=1&year=2025[&site_id=2]
+         Recent jobs for the scope, newest first.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+        jobs = ReportJob.objects.filter(company=company, year=year).order_by('-created_at')
+        if site_id:
+            jobs = jobs.filter(site_id=site_id)
+        return Response({'jobs': [_job_payload(request, job) for job in jobs[:20]]})
+
+    def post(self, request):
+        params, error = _report_params(request)
+        if error:
+            return error
+        company, year, site_id = params
+        if site_id and not company.sites.filter(pk=site_id).exists():
+            return Response({'error': 'Site not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        job, reused = ReportJobService.request(
+            company, year, site_id=site_id, framework_id=request.query_params.get('framework_id', ''),
+            user=request.user,
+        )
+        return Response(
+            {**_job_payload(request, job), 'reused': reused},
+            status=status.HTTP_200_OK if reused else status.HTTP_202_ACCEPTED,
+        )
+
+
+class ReportJobView(APIView):
+    """
+    Poll a report job.
+
+    GET /api/reports/jobs/{job_id}/
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, pk=job_id)
+        try:
+            get_user_company(request.user, job.company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        return Response(_job_payload(request, job))
+
+
+class ReportJobDownloadView(APIView):
+    """
+    Download a finished report pack (ZIP).
+
+    GET /api/reports/jobs/{job_id}/download/
+
+    The artifact is stored under its SHA-256, which doubles as a strong ETag.
+    """
+    authentication_classes = [CsrfExemptSessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob.objects.select_related('company', 'site'), pk=job_id)
+        try:
+            get_user_company(request.user, job.company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        if job.status != 'complete' or not job.artifact:
+            return Response({'error': f'Report is {job.status}'}, status=status.HTTP_409_CONFLICT)
+
+        etag = quote_etag(job.content_hash)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                handle = job.artifact.storage.open(job.artifact.name, 'rb')
+            except OSError:
+                logger.warning(f"[REPORT_JOB] Artifact {job.artifact.name} for job {job.id} is missing from storage")
+                return Response({'error': 'Report file is missing'}, status=status.HTTP_404_NOT_FOUND)
+            response = FileResponse(
+                handle, as_attachment=True, filename=ReportJobService.download_name(job),
+                content_type='application/zip',
+            )
+            response.block_size = STREAM_BLOCK_SIZE
+
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, max_age=0)
+        return response
@@ -0,0 +1,408 @@
+"""
+Reporting engines - grouped SQL aggregates and rollups, cached per company data version
+"""
+import logging
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Trim
+from django.utils import timezone
+
+from .db_router import read_from_replica
+from .models import (
+    MONTH_ORDER, Company, CompanyChecklist, CompanyDataSubmission, Framework, FrameworkElement, SiteQuarterlyRollup
+)
+from .rollups import ConsumptionRollups
+from .units import base_unit
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_TIMEOUT = 24 * 60 * 60  # Entries are keyed by data version, so they never go stale
+
+CATEGORY_NAMES = {'E': 'Environmental', 'S': 'Social', 'G': 'Governance'}
+
+# Companies whose data version bump_on_commit has yet to apply
+_pending_bumps = ContextVar('pending_data_versions', default=None)
+
+
+class DataVersion:
+    """
+    Per-company counter bumped whenever submissions or checklist rows change.
+
+    Report caches include the version in their keys, so a change anywhere in
+    a company's data makes every cached report for it unreachable at once.
+    Stored on Company so all workers agree on it. Always read from the
+    primary: a lagging replica would return the previous version and serve
+    the report cached before the latest change.
+    """
+
+    @staticmethod
+    def current(company_id):
+        return Company.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk=company_id
+        ).values_list('data_version', flat=True).first() or 0
+
+    @staticmethod
+    def bump(company_id):
+        Company.objects.filter(pk=company_id).update(data_version=F('data_version') + 1)
+
+    @staticmethod
+    def bump_on_commit(company_id):
+        """
+        Bump once the current transaction commits, however many of the company's rows it changed.
+
+        Every change registers its own on_commit callback, so a rolled-back
+        savepoint only discards its own. The first callback to run bumps every
+        company still pending and the rest find nothing left to do. Companies
+        left pending by a rollback get one extra bump at the next commit, which
+        only costs a cache miss.
+        """
+        pending = _pending_bumps.get()
+        if pending is None:
+            pending = set()
+            _pending_bumps.set(pending)
+        pending.add(company_id)
+        # Outside a transaction on_commit runs the callback at once
+        transaction.on_commit(DataVersion._bump_pending)
+
+    @staticmethod
+    def _bump_pending():
+        pending = _pending_bumps.get()
+        while pending:
+            DataVersion.bump(pending.pop())
+
+    @staticmethod
+    def cached(prefix, company_id, params, compute):
+        """Return compute() from the cache entry for this company's current data version"""
+        version = DataVersion.current(company_id)
+        key = ':'.join([prefix, str(company_id), str(version)] + [f'{k}={params[k]}' for k in sorted(params)])
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            result['data_version'] = version
+            cache.set(key, result, REPORT_CACHE_TIMEOUT)
+        return result
+
+
+class CoverageReport:
+    """
+    Framework coverage: how much of each framework's data and evidence is in,
+    per framework x category x site x period.
+
+    Counts come from one grouped query over submissions. Each submission is
+    attributed to the framework of its checklist item (site-specific first,
+    then company-wide), falling back to the element's own framework. Coverage
+    follows calculate_progress: inactive-period placeholders are counted
+    separately and excluded from the denominators.
+    """
+
+    TABLE_COLUMNS = [
+        'framework_id', 'framework_name', 'category', 'site_id', 'site_name', 'period',
+        'submissions', 'with_value', 'with_evidence', 'complete', 'inactive',
+        'data_coverage', 'evidence_coverage',
+    ]
+
+    @staticmethod
+    def _checklist_framework(site_specific):
+        checklist = CompanyChecklist.objects.filter(
+            company_id=OuterRef('company_id'), element_id=OuterRef('framework_element_id')
+        )
+        if site_specific:
+            checklist = checklist.filter(site_id=OuterRef('site_id'))
+        else:
+            checklist = checklist.filter(site__isnull=True)
+        return Subquery(checklist.order_by('id').values('framework_id')[:1])
+
+    @classmethod
+    def rows(cls, company, year, site_id=None, framework_id=None):
+        """Grouped counts, one dict per framework/category/site/period"""
+        submissions = CompanyDataSubmission.objects.filter(
+            company=company, reporting_year=year, framework_element__isnull=False
+        )
+        if site_id:
+            submissions = submissions.filter(site_id=site_id)
+
+        inactive = Q(value='INACTIVE_PERIOD')
+        # Whitespace-only values count as missing, as in CompanyDataSubmission.status
+        has_value = ~Q(trimmed_value='') & ~inactive
+        has_evidence = ~Q(evidence_file='') & ~inactive
+
+        grouped = submissions.alias(trimmed_value=Trim('value')).annotate(
+            framework=Coalesce(
+                cls._checklist_framework(site_specific=True),
+                cls._checklist_framework(site_specific=False),
+                F('framework_element__framework_id'),
+            ),
+            category=F('framework_element__category'),
+            site_name=F('site__name'),
+            period=F('reporting_period'),
+        ).values('framework', 'category', 'site_id', 'site_name', 'period').annotate(
+            total=Count('id'),
+            inactive=Count('id', filter=inactive),
+            with_value=Count('id', filter=has_value),
+            with_evidence=Count('id', filter=has_evidence),
+            complete=Count('id', filter=has_value & has_evidence),
+        ).order_by('framework', 'category', 'site_name', 'period')
+
+        if framework_id:
+            grouped = grouped.filter(framework=framework_id)
+        return list(grouped)
+
+    @staticmethod
+    def _summary(counts):
+        active = counts['total'] - counts['inactive']
+        return {
+            'submissions': active,
+            'with_value': counts['with_value'],
+            'with_evidence': counts['with_evidence'],
+            'complete': counts['complete'],
+            'inactive': counts['inactive'],
+            'data_coverage': round(counts['with_value'] / active * 100, 1) if active else 0,
+            'evidence_coverage': round(counts['with_evidence'] / active * 100, 1) if active else 0,
+        }
+
+    @staticmethod
+    def _add(target, row):
+        for field in ('total', 'inactive', 'with_value', 'with_evidence', 'complete'):
+            target[field] = target.get(field, 0) + row[field]
+
+    @classmethod
+    def build(cls, company, year, site_id=None, framework_id=None):
+        """Nest the grouped rows into framework -> category -> site -> period with roll-ups at each level"""
+        rows = cls.rows(company, year, site_id=site_id, framework_id=framework_id)
+        names = dict(Framework.objects.filter(
+            framework_id__in={row['framework'] for row in rows}
+        ).values_list('framework_id', 'name'))
+
+        frameworks = {}
+        for row in rows:
+            framework = frameworks.setdefault(row['framework'], {'counts': {}, 'categories': {}})
+            category = framework['categories'].setdefault(row['category'], {'counts': {}, 'sites': {}})
+            site = category['sites'].setdefault(row['site_id'], {'name': row['site_name'], 'counts': {}, 'periods': []})
+            for level in (framework, category, site):
+                cls._add(level['counts'], row)
+            site['periods'].append({'period': row['period'], **cls._summary(row)})
+
+        # Calendar order for months; quarters and years sort after them by name
+        for framework in frameworks.values():
+            for category in framework['categories'].values():
+                for site in category['sites'].values():
+                    site['periods'].sort(key=lambda entry: (MONTH_ORDER.get(entry['period'], 13), entry['period']))
+
+        return {
+            'company_id': company.id,
+            'year': year,
+            'generated_at': timezone.now().isoformat(),
+            'frameworks': [
+                {
+                    'framework_id': key,
+                    'framework_name': names.get(key, key),
+                    **cls._summary(framework['counts']),
+                    'categories': [
+                        {
+                            'category': code,
+                            'category_name': CATEGORY_NAMES.get(code, code),
+                            **cls._summary(category['counts']),
+                            'sites': [
+                                {
+                                    'site_id': site_key,
+                                    'site_name': site['name'],
+                                    **cls._summary(site['counts']),
+                                    'periods': site['periods'],
+                                }
+                                for site_key, site in category['sites'].items()
+                            ],
+                        }
+                        for code, category in framework['categories'].items()
+                    ],
+                }
+                for key, framework in frameworks.items()
+            ],
+        }
+
+    @classmethod
+    @read_from_replica
+    def get(cls, company, year, site_id=None, framework_id=None):
+        params = {'year': year, 'site': site_id or '', 'framework': framework_id or ''}
+        return DataVersion.cached(
+            'coverage', company.id, params,
+            lambda: cls.build(company, year, site_id=site_id, framework_id=framework_id)
+        )
+
+    @classmethod
+    def table(cls, report):
+        """Flatten a built report into TABLE_COLUMNS rows, one per period"""
+        for framework in report['frameworks']:
+            for category in framework['categories']:
+                for site in category['sites']:
+                    for period in site['periods']:
+                        yield [
+                            framework['framework_id'], framework['framework_name'], category['category'],
+                            site['site_id'], site['site_name'], period['period'],
+                        ] + [period[column] for column in cls.TABLE_COLUMNS[6:]]
+
+
+class ConsumptionReport:
+    """
+    Metered consumption for a company-year at three grains, read straight
+    from the rollup tables: element totals for the year, site x quarter and
+    meter x month. Totals are in the base unit of each element's unit
+    (kWh, m³, kg; units without a conversion as entered), which is the unit
+    reported.
+    """
+
+    @staticmethod
+    def build(company, year, site_id=None):
+        monthly = ConsumptionRollups.meter_months(company, year, site_id=site_id).values(
+            'meter_id', 'meter__name', 'meter__type', 'site_id', 'site__name', 'framework_element_id', 'month',
+            'total', 'readings',
+        ).order_by('site__name', 'meter__name', 'framework_element_id', 'month')
+        quarterly = ConsumptionRollups.site_quarters(company, year, site_id=site_id).values(
+            'site_id', 'site__name', 'framework_element_id', 'quarter', 'total', 'readings',
+        ).order_by('site__name', 'framework_element_id', 'quarter')
+
+        if site_id:
+            # The company-year cells span every site, so the site's year comes from its quarters
+            annual = quarterly.order_by().values('framework_element_id').annotate(total=Sum('total'), readings=Sum('readings'))
+        else:
+            annual = ConsumptionRollups.company_years(company, [year]).values('framework_element_id', 'total', 'readings')
+
+        elements = {}
+        for element_id, name, unit in FrameworkElement.objects.filter(
+            element_id__in={row['framework_element_id'] for row in annual}
+        ).values_list('element_id', 'name_plain', 'unit'):
+            elements[element_id] = {'element_name': name, 'unit': base_unit(unit)[0]}
+
+        return {
+            'company_id': company.id,
+            'year': year,
+            'generated_at': timezone.now().isoformat(),
+            'annual': sorted(
+                [
+                    {'element_id': row['framework_element_id'], **elements.get(row['framework_element_id'], {}),
+                     'total': float(row['total']), 'readings': row['readings']}
+                    for row in annual
+                ],
+                key=lambda entry: entry['element_id'],
+            ),
+            'quarterly': [
+                {'site_id': row['site_id'], 'site_name': row['site__name'], 'element_id': row['framework_element_id'],
+                 'quarter': row['quarter'], 'total': float(row['total']), 'readings': row['readings']}
+                for row in quarterly
+            ],
+            'monthly': [
+                {'meter_id': row['meter_id'], 'meter_name': row['meter__name'], 'meter_type': row['meter__type'],
+                 'site_id': row['site_id'], 'site_name': row['site__name'], 'element_id': row['framework_element_id'],
+                 'month': row['month'], 'total': float(row['total']), 'readings': row['readings']}
+                for row in monthly
+            ],
+        }
+
+    @classmethod
+    @read_from_replica
+    def get(cls, company, year, site_id=None):
+        return DataVersion.cached(
+            'consumption', company.id, {'year': year, 'site': site_id or ''},
+            lambda: cls.build(company, year, site_id=site_id)
+        )
+
+
+class YearComparisonReport:
+    """
+    Two reporting years side by side, per element and site.
+
+    Metered elements come from the site x quarter rollups; other numeric
+    elements from one grouped SUM(value_normalized) over their submissions.
+    Both are a single grouped read for the two years together. Totals are in
+    the base unit of each element's unit, as in ConsumptionReport;
+    change_pct is null when the base year is zero or missing.
+    """
+
+    @staticmethod
+    def _change(base, compare):
+        delta = (compare or 0) - (base or 0)
+        return {
+            'base': base,
+            'compare': compare,
+            'delta': round(delta, 6),
+            'change_pct': round(delta / abs(base) * 100, 2) if base else None,
+        }
+
+    @staticmethod
+    def totals(company, years, site_id=None, framework_id=None):
+        """{(element_id, site_id): {year: total}} plus {site_id: site_name}"""
+        metered = SiteQuarterlyRollup.objects.filter(company=company, year__in=years, readings__gt=0)
+        unmetered = CompanyDataSubmission.objects.filter(
+            company=company, reporting_year__in=years, meter__isnull=True,
+            framework_element__isnull=False, value_normalized__isnull=False,
+        )
+        if site_id:
+            metered = metered.filter(site_id=site_id)
+            unmetered = unmetered.filter(site_id=site_id)
+        if framework_id:
+            metered = metered.filter(framework_element__framework_id=framework_id)
+            unmetered = unmetered.filter(framework_element__framework_id=framework_id)
+
+        totals, site_names = {}, {}
+        grouped = [
+            metered.values('framework_element_id', 'site_id', 'site__name', 'year').annotate(sum=Sum('total')),
+            unmetered.values('framework_element_id', 'site_id', 'site__name', year=F('reporting_year')).annotate(
+                sum=Sum('value_normalized')
+            ),
+        ]
+        for rows in grouped:
+            for row in rows.order_by():
+                key = (row['framework_element_id'], row['site_id'])
+                cell = totals.setdefault(key, {})
+                cell[row['year']] = cell.get(row['year'], 0) + float(row['sum'])
+                site_names[row['site_id']] = row['site__name']
+        return totals, site_names
+
+    @classmethod
+    def build(cls, company, year, base_year, site_id=None, framework_id=None):
+        totals, site_names = cls.totals(company, [base_year, year], site_id=site_id, framework_id=framework_id)
+        elements = {
+            element_id: {'element_name': name, 'unit': base_unit(unit)[0], 'category': category}
+            for element_id, name, unit, category in FrameworkElement.objects.filter(
+                element_id__in={element_id for element_id, _ in totals}
+            ).values_list('element_id', 'name_plain', 'unit', 'category')
+        }
+
+        by_element = {}
+        for (element_id, site), cell in totals.items():
+            entry = by_element.setdefault(element_id, {'base': None, 'compare': None, 'sites': []})
+            for key, cell_year in (('base', base_year), ('compare', year)):
+                if cell_year in cell:
+                    entry[key] = (entry[key] or 0) + cell[cell_year]
+            entry['sites'].append({
+                'site_id': site,
+                'site_name': site_names.get(site) or 'Company-wide',
+                **cls._change(cell.get(base_year), cell.get(year)),
+            })
+
+        return {
+            'company_id': company.id,
+            'year': year,
+            'base_year': base_year,
+            'generated_at': timezone.now().isoformat(),
+            'elements': [
+                {
+                    'element_id': element_id,
+                    **elements.get(element_id, {}),
+                    **cls._change(entry['base'], entry['compare']),
+                    'sites': sorted(entry['sites'], key=lambda site: site['site_name']),
+                }
+                for element_id, entry in sorted(by_element.items())
+            ],
+        }
+
+    @classmethod
+    @read_from_replica
+    def get(cls, company, year, base_year, site_id=None, framework_id=None):
+        params = {'year': year, 'base': base_year, 'site': site_id or '', 'framework': framework_id or ''}
+        return DataVersion.cached(
+            'yoy', company.id, params,
+            lambda: cls.build(company, year, base_year, site_id=site_id, framework_id=framework_id)
+        )
@@ -0,0 +1,229 @@
+"""
+Metered consumption rollups - meter x month, site x quarter and company x year totals kept in step with submissions
+"""
+import logging
+import re
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import DEFERRED, Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import MONTH_ORDER, CompanyDataSubmission, CompanyYearlyRollup, MeterMonthlyRollup, SiteQuarterlyRollup
+
+logger = logging.getLogger(__name__)
+
+# Cells of one grain adjusted per UPDATE statement by a bulk change
+ADJUST_BATCH_SIZE = 200
+
+# The submission fields a rollup cell depends on, in snapshot order
+SNAPSHOT_FIELDS = [
+    'company_id', 'site_id', 'meter_id', 'framework_element_id', 'reporting_year', 'reporting_period', 'value_normalized',
+]
+
+
+def period_month(period):
+    return MONTH_ORDER.get(period)
+
+
+def period_quarter(period):
+    month = MONTH_ORDER.get(period)
+    if month:
+        return (month - 1) // 3 + 1
+    match = re.fullmatch(r'Q([1-4])', str(period or ''))
+    return int(match.group(1)) if match else None
+
+
+class ConsumptionRollups:
+    """
+    Running totals of metered value_normalized at three grains, so every
+    cell is in the base unit of its element's unit (kWh, m³, kg).
+
+    A submission contributes to its meter's month (monthly periods only), its
+    site's quarter (months and Q1-Q4) and its company's year (any period).
+    Changes are applied as deltas: the submission's contribution before the
+    change is subtracted and the new one added, so only the affected cells
+    are written. The "before" comes from the row as the instance loaded it.
+    Bulk and cascading deletes rebuild the company's rollups once instead of
+    applying a delta per row. rebuild_rollups recomputes everything from
+    submissions.
+    """
+
+    @staticmethod
+    def snapshot(submission):
+        """The fields of a submission that decide which cells it adds to, and by how much"""
+        return tuple(getattr(submission, field) for field in SNAPSHOT_FIELDS)
+
+    @staticmethod
+    def stored_snapshot(submission):
+        """The snapshot of the row as it was loaded; read again only when the instance didn't load those fields"""
+        loaded = getattr(submission, '_loaded_values', None) or {}
+        if all(loaded.get(field, DEFERRED) is not DEFERRED for field in SNAPSHOT_FIELDS):
+            return tuple(loaded[field] for field in SNAPSHOT_FIELDS)
+        row = CompanyDataSubmission.objects.filter(pk=submission.pk).values_list(*SNAPSHOT_FIELDS).first()
+        return tuple(row) if row else None
+
+    @staticmethod
+    def remember_snapshot(submission, snapshot):
+        """Record a saved snapshot as the stored one, for the next save of the same instance"""
+        submission._loaded_values = {**(getattr(submission, '_loaded_values', None) or {}),
+                                     **dict(zip(SNAPSHOT_FIELDS, snapshot))}
+
+    @staticmethod
+    def cells(snapshot):
+        """(model, key) for every rollup cell the snapshot counts towards"""
+        if snapshot is None:
+            return []
+        company_id, site_id, meter_id, element_id, year, period, numeric = snapshot
+        if numeric is None or meter_id is None or element_id is None:
+            return []
+
+        cells = [(CompanyYearlyRollup, (('company_id', company_id), ('framework_element_id', element_id), ('year', year)))]
+        quarter = period_quarter(period)
+        if quarter:
+            cells.append((SiteQuarterlyRollup, (
+                ('company_id', company_id), ('site_id', site_id), ('framework_element_id', element_id),
+                ('year', year), ('quarter', quarter),
+            )))
+        month = period_month(period)
+        if month:
+            cells.append((MeterMonthlyRollup, (
+                ('company_id', company_id), ('site_id', site_id), ('meter_id', meter_id),
+                ('framework_element_id', element_id), ('year', year), ('month', month),
+            )))
+        return cells
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """
+        Apply (before, after) snapshot pairs, merging the deltas per cell first.
+        A grain with one changed cell (a single save) gets one UPDATE; many
+        cells of a grain (bulk edits) are written together, so the statements
+        don't grow with the number of rows changed.
+        """
+        deltas = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        for before, after in changes:
+            if before == after:
+                continue
+            for sign, snapshot in ((-1, before), (1, after)):
+                for model, key in cls.cells(snapshot):
+                    deltas[model][key][0] += sign * snapshot[-1]
+                    deltas[model][key][1] += sign
+        for model, cells in deltas.items():
+            cells = {key: delta for key, delta in cells.items() if delta[0] or delta[1]}
+            if len(cells) == 1:
+                (key, (total_delta, count_delta)), = cells.items()
+                cls._adjust(model, dict(key), total_delta, count_delta)
+            elif cells:
+                keys = list(cells)
+                for start in range(0, len(keys), ADJUST_BATCH_SIZE):
+                    cls._adjust_many(model, {key: cells[key] for key in keys[start:start + ADJUST_BATCH_SIZE]})
+
+    @staticmethod
+    def _adjust(model, key, total_delta, count_delta):
+        """Apply a delta to one cell; only increments create a missing row"""
+        cell = model.objects.filter(**key)
+        changes = {
+            'total': F('total') + total_delta,
+            'readings': F('readings') + count_delta,
+            'updated_at': timezone.now(),
+        }
+        if cell.update(**changes) or count_delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(total=total_delta, readings=count_delta, **key)
+        except IntegrityError:
+            cell.update(**changes)  # Created concurrently
+
+    @staticmethod
+    def _adjust_many(model, cells):
+        """
+        Apply {key: (total delta, count delta)} to cells of one grain with a
+        single UPDATE. Cells an increment needs are first inserted empty,
+        ignoring ones that exist, so the deltas still land through F()
+        whatever other writers do meanwhile.
+        """
+        missing = [model(total=0, readings=0, **dict(key)) for key, (_, count_delta) in cells.items() if count_delta > 0]
+        if missing:
+            model.objects.bulk_create(missing, ignore_conflicts=True)
+
+        conditions = {key: Q(**dict(key)) for key in cells}
+        total_field, readings_field = model._meta.get_field('total'), model._meta.get_field('readings')
+        model.objects.filter(reduce(or_, conditions.values())).update(
+            total=F('total') + Case(
+                *[When(conditions[key], then=Value(total_delta)) for key, (total_delta, _) in cells.items()],
+                default=Value(0), output_field=total_field,
+            ),
+            readings=F('readings') + Case(
+                *[When(conditions[key], then=Value(count_delta)) for key, (_, count_delta) in cells.items()],
+                default=Value(0), output_field=readings_field,
+            ),
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def rebuild(company_id=None):
+        """Recompute every rollup from submissions; returns the number of cells at each grain"""
+        submissions = CompanyDataSubmission.objects.filter(
+            value_normalized__isnull=False, meter__isnull=False, framework_element__isnull=False
+        )
+        if company_id:
+            submissions = submissions.filter(company_id=company_id)
+
+        months, quarters, years = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+        grouped = submissions.values(*SNAPSHOT_FIELDS[:-1]).annotate(total=Sum('value_normalized'), readings=Count('id'))
+        for row in grouped.iterator(chunk_size=2000):
+            company, site, meter, element, year, period = (row[field] for field in SNAPSHOT_FIELDS[:-1])
+            targets = [years[(company, element, year)]]
+            if period_quarter(period):
+                targets.append(quarters[(company, site, element, year, period_quarter(period))])
+            if period_month(period):
+                targets.append(months[(company, site, meter, element, year, period_month(period))])
+            for target in targets:
+                target[0] += row['total']
+                target[1] += row['readings']
+
+        with transaction.atomic():
+            for model in (MeterMonthlyRollup, SiteQuarterlyRollup, CompanyYearlyRollup):
+                existing = model.objects.all()
+                if company_id:
+                    existing = existing.filter(company_id=company_id)
+                existing.delete()
+            MeterMonthlyRollup.objects.bulk_create([
+                MeterMonthlyRollup(company_id=company, site_id=site, meter_id=meter, framework_element_id=element,
+                                   year=year, month=month, total=total, readings=readings)
+                for (company, site, meter, element, year, month), (total, readings) in months.items()
+            ], batch_size=1000)
+            SiteQuarterlyRollup.objects.bulk_create([
+                SiteQuarterlyRollup(company_id=company, site_id=site, framework_element_id=element,
+                                    year=year, quarter=quarter, total=total, readings=readings)
+                for (company, site, element, year, quarter), (total, readings) in quarters.items()
+            ], batch_size=1000)
+            CompanyYearlyRollup.objects.bulk_create([
+                CompanyYearlyRollup(company_id=company, framework_element_id=element, year=year,
+                                    total=total, readings=readings)
+                for (company, element, year), (total, readings) in years.items()
+            ], batch_size=1000)
+
+        return {'meter_months': len(months), 'site_quarters': len(quarters), 'company_years': len(years)}
+
+    @staticmethod
+    def meter_months(company, year, site_id=None):
+        rollups = MeterMonthlyRollup.objects.filter(company=company, year=year, readings__gt=0)
+        if site_id:
+            rollups = rollups.filter(site_id=site_id)
+        return rollups
+
+    @staticmethod
+    def site_quarters(company, year, site_id=None):
+        rollups = SiteQuarterlyRollup.objects.filter(company=company, year=year, readings__gt=0)
+        if site_id:
+            rollups = rollups.filter(site_id=site_id)
+        return rollups
+
+    @staticmethod
+    def company_years(company, years):
+        return CompanyYearlyRollup.objects.filter(company=company, year__in=years, readings__gt=0)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.urls import reverse
 from .models import (
     Company, Site, Activity, CompanyActivity, Framework, CompanyFramework,
     DataElement, FrameworkElement, DataElementFrameworkMapping, ProfilingQuestion,
@@ -88,6 +89,9 @@ class SiteSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'location', 'address', 'is_active', 'meter_count', 'created_at', 'updated_at']
     
     def get_meter_count(self, obj):
+        # Annotated by SiteViewSet so a list doesn't count per site
+        if hasattr(obj, 'meter_total'):
+            return obj.meter_total
         return obj.meters.count()
 
 
@@ -106,12 +110,18 @@ class CompanyProfileAnswerSerializer(serializers.ModelSerializer):
 
 
 class MeterSerializer(serializers.ModelSerializer):
-    has_data = serializers.BooleanField(read_only=True)
+    has_data = serializers.SerializerMethodField()
     site_name = serializers.CharField(source='site.name', read_only=True, allow_null=True)
     
     class Meta:
         model = Meter
         fields = ['id', 'type', 'name', 'account_number', 'location_description', 'status', 'has_data', 'created_at', 'site_name']
+    
+    def get_has_data(self, obj):
+        # Annotated by MeterViewSet so a list doesn't query per meter
+        if hasattr(obj, 'data_present'):
+            return obj.data_present
+        return obj.has_data()
 
 
 class CompanyDataSubmissionSerializer(serializers.ModelSerializer):
@@ -120,6 +130,9 @@ class CompanyDataSubmissionSerializer(serializers.ModelSerializer):
     status = serializers.CharField(read_only=True)
     assigned_to = serializers.SerializerMethodField()
     assigned_by_name = serializers.CharField(source='assigned_by.username', read_only=True, allow_null=True)
+    evidence_file = serializers.SerializerMethodField()
+    evidence_url = serializers.SerializerMethodField()
+    evidence_preview = serializers.SerializerMethodField()
     
     def get_assigned_to(self, obj):
         """Return assigned user details"""
@@ -133,11 +146,33 @@ class CompanyDataSubmissionSerializer(serializers.ModelSerializer):
             }
         return None
     
+    def _evidence_download_url(self, obj, query=''):
+        url = reverse('evidence-download', args=[obj.id]) + query
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+    
+    def get_evidence_url(self, obj):
+        """Authenticated, range-capable download URL for the evidence file"""
+        return self._evidence_download_url(obj) if obj.evidence_file else None
+    
+    def get_evidence_file(self, obj):
+        """Same as evidence_url - the storage path under /media/ is never exposed or served"""
+        return self.get_evidence_url(obj)
+    
+    def get_evidence_preview(self, obj):
+        """URL of the downscaled evidence preview, once the background worker has made one"""
+        if not obj.evidence_blob_id:
+            return None
+        blob = obj.evidence_blob
+        if blob.preview_status != 'ready' or not blob.preview:
+            return None
+        return self._evidence_download_url(obj, '?preview=1')
+    
     class Meta:
         model = CompanyDataSubmission
         fields = [
             'id', 'element_name', 'meter', 'meter_name',
-            'reporting_year', 'reporting_period', 'value', 'evidence_file',
+            'reporting_year', 'reporting_period', 'value', 'evidence_file', 'evidence_url', 'evidence_preview',
             'status', 'assigned_to', 'assigned_by_name', 'assigned_at',
             'created_at', 'updated_at'
         ]
@@ -202,6 +237,12 @@ class DashboardStatsSerializer(serializers.Serializer):
         child=serializers.DictField(),
         allow_empty=True
     )
+    
+    # Evidence storage used, from the running counters
+    storage = serializers.DictField(required=False)
+
+    # Scope 1/2/3 emissions for the current year
+    emissions = serializers.DictField(required=False)
 
 
 class ElementAssignmentSerializer(serializers.ModelSerializer):
@@ -2,15 +2,20 @@
 Business logic services for ESG application
 """
 from django.db import transaction
-from django.db.models import Count, Q
-from datetime import datetime
+from django.db.models import Count, Exists, OuterRef, Q
+from datetime import date, datetime
 from collections import defaultdict
+from .db_router import read_from_replica
+from .emissions import REPORT_UNIT, CarbonAggregator
+from .evidence_service import StorageAccounting
 from .models import (
-    Company, Framework, CompanyFramework, DataElement, 
+    Company, Site, Framework, CompanyFramework, DataElement, FrameworkElement,
     DataElementFrameworkMapping, ProfilingQuestion, 
     CompanyProfileAnswer, Meter, CompanyChecklist,
-    ChecklistFrameworkMapping, CompanyDataSubmission
+    ChecklistFrameworkMapping, CompanyDataSubmission, MONTH_ORDER
 )
+from .reports import DataVersion
+from .units import base_unit
 
 
 class FrameworkService:
@@ -293,41 +298,75 @@ class DataCollectionService:
     @staticmethod
     def get_data_collection_tasks(company, year, month, user=None, site=None):
         """Get all data collection tasks for a specific month - shared data visibility"""
-        month_name = datetime(year, month, 1).strftime('%b')
-        
+        sites = [site] if site else list(company.sites.all())
+        tasks = DataCollectionService.build_tasks(company, year, [month], user, sites)
+
         if site:
-            # For specific site, get site-specific checklist items
-            checklist_items = CompanyChecklist.objects.filter(company=company, site=site)
-            # print(f"🏢 Specific site {site.name}: Found {checklist_items.count()} checklist items")
-            return DataCollectionService._process_site_tasks(company, year, month_name, user, site, checklist_items)
-        else:
-            # For "All Locations", group tasks by site
-            sites = company.sites.all()
-            # print(f"🌐 All Locations: Found {sites.count()} sites")
-            grouped_tasks = []
-            
-            for current_site in sites:
-                site_checklist = CompanyChecklist.objects.filter(company=company, site=current_site)
-                # print(f"🏢 Site {current_site.name}: Found {site_checklist.count()} checklist items")
-                site_tasks = DataCollectionService._process_site_tasks(company, year, month_name, user, current_site, site_checklist)
-                # print(f"🏢 Site {current_site.name}: Generated {len(site_tasks)} tasks")
-                
-                if site_tasks:  # Only include sites with tasks
-                    grouped_tasks.append({
-                        'site': {
-                            'id': current_site.id,
-                            'name': current_site.name
-                        },
-                        'tasks': site_tasks
-                    })
-            
-            # print(f"🌐 Total grouped tasks: {len(grouped_tasks)} site groups")
-            return grouped_tasks
-    
+            return tasks[site.id, month]
+
+        # For "All Locations", group tasks by site
+        grouped_tasks = []
+        for current_site in sites:
+            site_tasks = tasks[current_site.id, month]
+            if site_tasks:  # Only include sites with tasks
+                grouped_tasks.append({
+                    'site': {
+                        'id': current_site.id,
+                        'name': current_site.name
+                    },
+                    'tasks': site_tasks
+                })
+        return grouped_tasks
+
     @staticmethod
-    def _process_site_tasks(company, year, month_name, user, site, checklist_items):
-        
-        """Process tasks for a specific site"""
+    def build_tasks(company, year, months, user, sites):
+        """
+        Tasks of each site and month, as {(site id, month): tasks}. Checklist
+        items, active meters and existing submissions are read once for all
+        sites and months, and missing slots are inserted with one statement,
+        so the cost does not grow with the number of sites or months.
+        """
+        site_ids = [site.id for site in sites]
+        checklists, site_meters, existing = defaultdict(list), defaultdict(list), defaultdict(dict)
+        for item in CompanyChecklist.objects.filter(company=company, site_id__in=site_ids).select_related('element'):
+            checklists[item.site_id].append(item)
+        for meter in Meter.objects.filter(company=company, site_id__in=site_ids, status='active').order_by('id'):
+            site_meters[meter.site_id].append(meter)
+        for submission in CompanyDataSubmission.objects.select_related('evidence_blob').filter(
+            company=company, site_id__in=site_ids, framework_element__isnull=False, reporting_year=year,
+            period_granularity='month', period_start__in=[date(year, month, 1) for month in months]
+        ).order_by('pk'):
+            existing[submission.site_id, submission.period_start.month].setdefault(
+                (submission.framework_element_id, submission.meter_id), submission
+            )
+
+        tasks = {}
+        new_slots = []
+        for site in sites:
+            for month in months:
+                tasks[site.id, month] = DataCollectionService._process_site_tasks(
+                    company, year, datetime(year, month, 1).strftime('%b'), user, site,
+                    checklists[site.id], site_meters[site.id], existing[site.id, month], new_slots
+                )
+
+        if new_slots:
+            stored = DataCollectionService.create_slots(new_slots)
+            for site_tasks in tasks.values():
+                for task in site_tasks:
+                    if task['submission'].pk is None:
+                        submission = stored[task['submission'].slot_key]
+                        submission.framework_element, submission.meter = task['element'], task['meter']
+                        task['submission'] = submission
+        return tasks
+
+    @staticmethod
+    def _process_site_tasks(company, year, month_name, user, site, checklist_items, site_meters,
+                            existing_submissions, new_slots):
+        """
+        Process tasks for a specific site from its preloaded checklist items,
+        active meters and the month's submissions; slots that do not exist yet
+        are added to new_slots unsaved, for build_tasks to insert.
+        """
         tasks = []
         for item in checklist_items:
             element = item.element
@@ -370,13 +409,7 @@ class DataCollectionService:
                             meter_types_to_find.append('Water Consumption')
 
                     for meter_type in meter_types_to_find:
-                        type_meters = Meter.objects.filter(
-                            company=company,
-                            type=meter_type,
-                            status='active',
-                            site=site
-                        )
-                        meters.extend(type_meters)
+                        meters.extend(meter for meter in site_meters if meter.type == meter_type)
 
                 # Fallback to element name pattern matching if no carbon_specifications
                 if not meters:
@@ -400,25 +433,14 @@ class DataCollectionService:
 
                     if meter_type:
                         # Try exact match first
-                        exact_meters = Meter.objects.filter(
-                            company=company,
-                            type=meter_type,
-                            status='active',
-                            site=site
-                        )
+                        exact_meters = [meter for meter in site_meters if meter.type == meter_type]
 
-                        if exact_meters.exists():
+                        if exact_meters:
                             meters.extend(exact_meters)
                         else:
                             # If no exact match, try flexible matching
                             short_type = meter_type.replace(' Consumption', '').replace(' Usage', '').replace('Waste to Landfill', 'Waste')
-                            flexible_meters = Meter.objects.filter(
-                                company=company,
-                                type__icontains=short_type,
-                                status='active',
-                                site=site
-                            )
-                            meters.extend(flexible_meters)
+                            meters.extend(meter for meter in site_meters if short_type.lower() in meter.type.lower())
 
                 # If still no meters found and element is metered, skip this element (don't create tasks for ALL meters)
                 if not meters and element.metered:
@@ -426,18 +448,11 @@ class DataCollectionService:
                     continue
                 for meter in meters:
                     # Find existing submission from ANY user, or create new one for current user
-                    submission = CompanyDataSubmission.objects.filter(
-                        company=company,
-                        site=site,
-                        framework_element=item.element,
-                        meter=meter,
-                        reporting_year=year,
-                        reporting_period=month_name
-                    ).first()
+                    submission = existing_submissions.get((item.element_id, meter.id))
 
                     if not submission:
-                        # Create new submission record with current user
-                        submission = CompanyDataSubmission.objects.create(
+                        # New submission slot for the current user, inserted with the rest below
+                        submission = CompanyDataSubmission(
                             user=user,
                             company=company,
                             site=site,
@@ -446,6 +461,9 @@ class DataCollectionService:
                             reporting_year=year,
                             reporting_period=month_name
                         )
+                        existing_submissions[(item.element_id, meter.id)] = submission
+                        new_slots.append(submission)
+                    submission.framework_element, submission.meter = item.element, meter  # Already loaded
                     
                     tasks.append({
                         'type': 'metered',
@@ -456,18 +474,11 @@ class DataCollectionService:
                     })
             else:
                 # For non-metered elements, find existing submission from ANY user or create new
-                submission = CompanyDataSubmission.objects.filter(
-                    company=company,
-                    site=site,
-                    framework_element=item.element,
-                    meter=None,
-                    reporting_year=year,
-                    reporting_period=month_name
-                ).first()
+                submission = existing_submissions.get((item.element_id, None))
 
                 if not submission:
-                    # Create new submission record with current user
-                    submission = CompanyDataSubmission.objects.create(
+                    # New submission slot for the current user, inserted with the rest below
+                    submission = CompanyDataSubmission(
                         user=user,
                         company=company,
                         site=site,
@@ -476,6 +487,9 @@ class DataCollectionService:
                         reporting_year=year,
                         reporting_period=month_name
                     )
+                    existing_submissions[(item.element_id, None)] = submission
+                    new_slots.append(submission)
+                submission.framework_element = item.element  # Already loaded
                 
                 tasks.append({
                     'type': 'non_metered',
@@ -517,19 +531,40 @@ class DataCollectionService:
 
         return deduplicated_tasks
     
+    @staticmethod
+    def create_slots(slots):
+        """
+        Insert unsaved submission slots with one INSERT ... ON CONFLICT DO NOTHING
+        on slot_key, so slots another request created meanwhile are kept rather
+        than duplicated, and return the stored rows by slot key.
+        """
+        if not slots:
+            return {}
+        for slot in slots:
+            slot.refresh_slot_key()  # bulk_create() skips save()
+            slot.refresh_period()
+        CompanyDataSubmission.objects.bulk_create(slots, batch_size=500, ignore_conflicts=True)
+        # bulk_create skips post_save; the new empty slots still change coverage and progress
+        DataVersion.bump(slots[0].company_id)
+        return {
+            submission.slot_key: submission
+            for submission in CompanyDataSubmission.objects.select_related('evidence_blob').filter(
+                slot_key__in=[slot.slot_key for slot in slots]
+            )
+        }
+    
     @staticmethod
     def calculate_progress(company, year, month=None, user=None, site=None):
         """Calculate data collection progress - counts data and evidence as separate tasks"""
-        filters = {'company': company, 'reporting_year': year}
+        filters = {'company': company, 'reporting_year': year}  # The year also prunes year partitions
 
         if month:
-            month_name = datetime(year, month, 1).strftime('%b')
-            filters['reporting_period'] = month_name
+            filters.update(period_granularity='month', period_start=date(year, month, 1))
         else:
             # For yearly progress, ensure all tasks are created for all 12 months
-            # Create submissions for the FULL year (Jan-Dec)
-            for month_num in range(1, 13):
-                tasks = DataCollectionService.get_data_collection_tasks(company, year, month_num, user=user, site=site)
+            # Create submissions for the FULL year (Jan-Dec), for every site at once
+            sites = [site] if site else list(company.sites.all())
+            DataCollectionService.build_tasks(company, year, range(1, 13), user, sites)
 
         # Remove user filtering to allow shared data visibility
         # All users can see data entered by any user for the same company
@@ -546,12 +581,17 @@ class DataCollectionService:
             Q(meter__isnull=True) | Q(meter__status='active')
         )
         
-        # Separate active period submissions from inactive period submissions
-        active_period_submissions = active_submissions.exclude(value='INACTIVE_PERIOD')
-        inactive_period_submissions = active_submissions.filter(value='INACTIVE_PERIOD')
-        
-        total_active_submissions = active_period_submissions.count()
-        total_inactive_submissions = inactive_period_submissions.count()
+        # Separate active period submissions from inactive period submissions, and count completed
+        # data entries and evidence files (only from active period) - all in one query
+        active_period = ~Q(value='INACTIVE_PERIOD')
+        counts = active_submissions.aggregate(
+            total_active_submissions=Count('id', filter=active_period),
+            total_inactive_submissions=Count('id', filter=Q(value='INACTIVE_PERIOD')),
+            data_complete=Count('id', filter=active_period & ~Q(value='')),
+            evidence_complete=Count('id', filter=active_period & ~Q(evidence_file='')),
+        )
+        total_active_submissions = counts['total_active_submissions']
+        total_inactive_submissions = counts['total_inactive_submissions']
         
         if total_active_submissions == 0 and total_inactive_submissions == 0:
             return {
@@ -563,9 +603,8 @@ class DataCollectionService:
                 'inactive_period_points': 0
             }
         
-        # Count completed data entries and evidence files separately (only from active period)
-        data_complete = active_period_submissions.exclude(value='').count()
-        evidence_complete = active_period_submissions.exclude(evidence_file='').count()
+        data_complete = counts['data_complete']
+        evidence_complete = counts['evidence_complete']
         
         # Total tasks = active submissions × 2 (data + evidence for each submission)
         total_active_tasks = total_active_submissions * 2
@@ -599,10 +638,73 @@ class DataCollectionService:
         }
 
 
+    @staticmethod
+    def monthly_progress(company, year, site=None):
+        """calculate_progress's data/evidence percentages for each month, from one grouped query"""
+        submissions = CompanyDataSubmission.objects.filter(
+            Q(meter__isnull=True) | Q(meter__status='active'),
+            CompanyDataSubmission.period_filter(date(year, 1, 1), date(year, 12, 1)),
+            company=company,
+        ).exclude(value='INACTIVE_PERIOD')
+        if site:
+            submissions = submissions.filter(site=site)
+        counts = {
+            row['period_index']: row
+            for row in submissions.values('period_index').annotate(
+                total=Count('id'),
+                data_complete=Count('id', filter=~Q(value='')),
+                evidence_complete=Count('id', filter=~Q(evidence_file='')),
+            ).order_by()
+        }
+
+        monthly = []
+        for month_name, month in MONTH_ORDER.items():
+            row = counts.get(month)
+            monthly.append({
+                'month': month_name,
+                'data_progress': row['data_complete'] / row['total'] * 100 if row else 0,
+                'evidence_progress': row['evidence_complete'] / row['total'] * 100 if row else 0,
+            })
+        return monthly
+
+    @staticmethod
+    def orphaned_submissions(company_id=None):
+        """Submissions whose meter, site or element no longer exists, found with one anti-join query"""
+        queryset = CompanyDataSubmission.objects.alias(
+            meter_exists=Exists(Meter.objects.filter(pk=OuterRef('meter_id'))),
+            site_exists=Exists(Site.objects.filter(pk=OuterRef('site_id'))),
+            framework_element_exists=Exists(FrameworkElement.objects.filter(pk=OuterRef('framework_element_id'))),
+            element_exists=Exists(DataElement.objects.filter(pk=OuterRef('element_id'))),
+        ).filter(
+            Q(meter_id__isnull=False, meter_exists=False)
+            | Q(site_id__isnull=False, site_exists=False)
+            | Q(framework_element_id__isnull=False, framework_element_exists=False)
+            | Q(element_id__isnull=False, element_exists=False)
+        )
+        if company_id:
+            queryset = queryset.filter(company_id=company_id)
+        return queryset
+
+    @staticmethod
+    def delete_in_batches(queryset, batch_size=500):
+        """Delete the rows of a queryset a batch at a time, so no single transaction holds every lock"""
+        deleted = 0
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                count, _ = CompanyDataSubmission.objects.filter(id__in=ids).delete()
+            if not count:
+                return deleted
+            deleted += len(ids)
+
+
 class DashboardService:
     """Service for dashboard statistics and data visualization"""
     
     @staticmethod
+    @read_from_replica
     def get_dashboard_stats(company, user=None, site=None):
         """Get comprehensive dashboard statistics"""
         # Basic counts
@@ -612,27 +714,20 @@ class DashboardService:
         if site:
             print(f"🏢 Dashboard filtered for site: {site.name}")
             total_data_elements = CompanyChecklist.objects.filter(company=company, site=site).count()
-            total_meters = Meter.objects.filter(company=company, site=site).count()
-            active_meters = Meter.objects.filter(company=company, site=site, status='active').count()
+            meters = Meter.objects.filter(company=company, site=site)
         else:
             print(f"🌐 Dashboard showing aggregated stats for all locations")
             total_data_elements = CompanyChecklist.objects.filter(company=company).count()
-            total_meters = Meter.objects.filter(company=company).count()
-            active_meters = Meter.objects.filter(company=company, status='active').count()
+            meters = Meter.objects.filter(company=company)
+        meter_counts = meters.aggregate(total=Count('id'), active=Count('id', filter=Q(status='active')))
+        total_meters, active_meters = meter_counts['total'], meter_counts['active']
         
         # Data completeness (for current year)
         current_year = datetime.now().year
         year_progress = DataCollectionService.calculate_progress(company, current_year, user=user, site=site)
         
         # Monthly data for charts
-        monthly_data = []
-        for month in range(1, 13):
-            month_progress = DataCollectionService.calculate_progress(company, current_year, month, user=user, site=site)
-            monthly_data.append({
-                'month': datetime(current_year, month, 1).strftime('%b'),
-                'data_progress': month_progress['data_progress'],
-                'evidence_progress': month_progress['evidence_progress']
-            })
+        monthly_data = DataCollectionService.monthly_progress(company, current_year, site=site)
         
         return {
             'total_frameworks': total_frameworks,
@@ -641,7 +736,9 @@ class DashboardService:
             'active_meters': active_meters,
             'data_completeness_percentage': year_progress['data_progress'],
             'evidence_completeness_percentage': year_progress['evidence_progress'],
-            'monthly_data': monthly_data
+            'monthly_data': monthly_data,
+            'storage': StorageAccounting.usage(company, site=site),
+            'emissions': CarbonAggregator.get(company, current_year, site_id=site.id if site else None)
         }
 
 
@@ -837,36 +934,35 @@ class FrameworkProcessor:
 
         return applicable
 
-    def calculate_carbon_emissions(self, element, value, period='monthly'):
-        """Calculate carbon emissions using framework specifications"""
-        if not element.carbon_specifications:
-            return {'error': 'No carbon specifications available'}
-
-        try:
-            carbon_specs = element.carbon_specifications
-            emission_factor = carbon_specs.get('emission_factor', 0)
-            unit = carbon_specs.get('unit', 'kg CO2e')
-            scope = carbon_specs.get('scope', 'unknown')
-
-            # Basic calculation: value * emission_factor
-            carbon_emissions = value * emission_factor
-
-            # Adjust for reporting period
-            if period == 'monthly' and 'annual' in carbon_specs.get('calculation_notes', ''):
-                carbon_emissions *= 12
-            elif period == 'quarterly':
-                carbon_emissions *= 4
-
-            return {
-                'carbon_emissions': carbon_emissions,
-                'unit': unit,
-                'scope': scope,
-                'emission_factor': emission_factor,
-                'calculation_method': carbon_specs.get('calculation_method', 'direct_multiplication')
-            }
-
-        except Exception as e:
-            return {'error': f'Carbon calculation failed: {str(e)}'}
+    def calculate_carbon_emissions(self, element, value, year=None, reporting_period=None):
+        """
+        Emissions of one value of an element, entered in the element's unit, for a
+        reporting period (the current month by default). The factor is resolved
+        the same way as for the emissions report, so the figure is the one the
+        report adds up for that value.
+        """
+        if year is None:
+            today = date.today()
+            year, reporting_period = today.year, today.strftime('%b')
+        resolve = CarbonAggregator.factor_resolver([element.element_id], self.company.emirate, year)
+        factor, scope, entry = resolve(element.element_id, reporting_period)
+        if factor is None:
+            if scope == 'unit_mismatch':
+                return {'error': f"The emission factor's activity unit does not convert to {element.unit}"}
+            return {'error': 'No emission factor available'}
+
+        unit, multiplier = base_unit(element.unit)
+        result = {
+            'carbon_emissions': value * float(multiplier) * factor,
+            'unit': REPORT_UNIT,
+            'scope': scope,
+            'emission_factor': factor,
+            'emission_factor_unit': f'{REPORT_UNIT} per {unit}' if unit else REPORT_UNIT,
+            'calculation_method': 'emission_factor_table' if entry else 'element_specifications',
+        }
+        if entry:
+            result.update({'emission_factor_id': entry['id'], 'reference': entry['reference']})
+        return result
 
     def get_evidence_requirements(self, element):
         """Get evidence requirements for an element"""
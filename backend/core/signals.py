@@ -1,12 +1,14 @@
 """
 Django signals for handling user creation and email events
 """
-from django.db.models.signals import post_save
+from collections import Counter
+
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.db import transaction
 from .email_service import send_email_verification, send_password_reset_email, send_invitation_email
-from .models import EmailVerificationToken
+from .models import EmailVerificationToken, CompanyDataSubmission, CompanyChecklist
 import logging
 
 logger = logging.getLogger(__name__)
@@ -219,4 +221,93 @@ def send_email_after_token_creation(sender, instance, created, **kwargs):
         # Send emails for all token types: email_verification, password_reset, invitation
         if instance.token_type in ['email_verification', 'password_reset', 'invitation']:
             transaction.on_commit(send_token_email)
-            print(f"⏳ {instance.token_type} email scheduled for after transaction commit")
\ No newline at end of file
+            print(f"⏳ {instance.token_type} email scheduled for after transaction commit")
+
+
+def _first_in_deletion(origin, key):
+    """
+    True the first time key comes up in the deletion started by origin.
+
+    Django sends post_delete per row, but only after it deleted every row of
+    the model, so the first signal of a bulk or cascading delete can already
+    account for all of them.
+    """
+    handled = origin.__dict__.setdefault('_submission_deletion_handled', set())
+    if key in handled:
+        return False
+    handled.add(key)
+    return True
+
+
+def _release_on_commit(origin, blob_id):
+    """Collect the deletion's blob references and release them per blob once it commits"""
+    releases = origin.__dict__.get('_submission_blob_releases')
+    if releases is None:
+        from .evidence_service import EvidenceStore
+        releases = origin._submission_blob_releases = Counter()
+        transaction.on_commit(lambda: [EvidenceStore.release(blob, count=count) for blob, count in releases.items()])
+    releases[blob_id] += 1
+
+
+@receiver(post_delete, sender=CompanyDataSubmission)
+def release_evidence_blob(sender, instance, origin=None, **kwargs):
+    """Drop the deleted submission's reference to its shared evidence blob and its storage usage"""
+    if not instance.evidence_file:
+        return
+    from .evidence_service import EvidenceStore, StorageAccounting
+    if origin is None or origin is instance:
+        StorageAccounting.adjust(instance.company_id, instance.site_id, -StorageAccounting.evidence_size(instance), -1)
+        if instance.evidence_blob_id:
+            EvidenceStore.release(instance.evidence_blob_id)
+        return
+
+    # Part of a bulk or cascading delete
+    if _first_in_deletion(origin, ('storage', instance.company_id)):
+        StorageAccounting.rebuild(company_id=instance.company_id)
+    if instance.evidence_blob_id:
+        _release_on_commit(origin, instance.evidence_blob_id)
+
+
+@receiver(post_save, sender=CompanyDataSubmission)
+@receiver(post_delete, sender=CompanyDataSubmission)
+@receiver(post_save, sender=CompanyChecklist)
+@receiver(post_delete, sender=CompanyChecklist)
+def bump_company_data_version(sender, instance, **kwargs):
+    """Invalidate cached reports for the company whose data changed, once per transaction"""
+    from .reports import DataVersion
+    DataVersion.bump_on_commit(instance.company_id)
+
+
+ROLLUP_FIELDS = {'company', 'site', 'meter', 'framework_element', 'reporting_year', 'reporting_period',
+                 'value', 'value_numeric', 'value_normalized'}
+
+
+@receiver(pre_save, sender=CompanyDataSubmission)
+def capture_rollup_contribution(sender, instance, update_fields=None, **kwargs):
+    """Remember what the stored row contributed to the consumption rollups before this save"""
+    instance._rollup_before = None
+    instance._rollup_skip = update_fields is not None and not ROLLUP_FIELDS.intersection(update_fields)
+    if instance.pk and not instance._state.adding and not instance._rollup_skip:
+        from .rollups import ConsumptionRollups
+        instance._rollup_before = ConsumptionRollups.stored_snapshot(instance)
+
+
+@receiver(post_save, sender=CompanyDataSubmission)
+def update_consumption_rollups(sender, instance, **kwargs):
+    """Move the submission's contribution between rollup cells"""
+    if getattr(instance, '_rollup_skip', False):
+        return
+    from .rollups import ConsumptionRollups
+    after = ConsumptionRollups.snapshot(instance)
+    ConsumptionRollups.apply_changes([(getattr(instance, '_rollup_before', None), after)])
+    ConsumptionRollups.remember_snapshot(instance, after)
+
+
+@receiver(post_delete, sender=CompanyDataSubmission)
+def remove_from_consumption_rollups(sender, instance, origin=None, **kwargs):
+    from .rollups import ConsumptionRollups
+    snapshot = ConsumptionRollups.snapshot(instance)
+    if origin is None or origin is instance:
+        ConsumptionRollups.apply_changes([(snapshot, None)])
+    elif ConsumptionRollups.cells(snapshot) and _first_in_deletion(origin, ('rollups', instance.company_id)):
+        ConsumptionRollups.rebuild(company_id=instance.company_id)
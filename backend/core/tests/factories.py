@@ -0,0 +1,73 @@
+"""
+Test data builders shared by the core test modules
+"""
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from ..models import (
+    Company, CompanyChecklist, CompanyDataSubmission, FrameworkElement, Meter, Site, UserProfile, UserSiteAssignment
+)
+
+
+def make_company(code='DXB001', sector='hospitality', sites=('Marina', 'Downtown'), role='admin'):
+    """A company with an admin user and the given sites; returns (user, company, [sites])"""
+    user = User.objects.create_user(f'{code.lower()}-{role}', f'{code.lower()}@example.com', 'pw')
+    company = Company.objects.create(
+        name=f'Company {code}', company_code=code, emirate='dubai', sector=sector, user=user
+    )
+    user.company = company
+    user.save()
+    UserProfile.objects.create(user=user, role=role, email=user.email, company=company)
+    return user, company, [Site.objects.create(company=company, name=name) for name in sites]
+
+
+def make_user(company, username, role, sites=()):
+    """Another member of a company, assigned to `sites`"""
+    user = User.objects.create_user(username, f'{username}@example.com', 'pw')
+    user.company = company
+    user.save()
+    UserProfile.objects.create(user=user, role=role, email=user.email, company=company)
+    for site in sites:
+        UserSiteAssignment.objects.create(user=user, site=site)
+    return user
+
+
+def make_element(element_id='ELEC', metered=True, unit='kWh', cadence='monthly', **fields):
+    defaults = {
+        'framework_id': 'UAE-CLIMATE-LAW-2024',
+        'sector': 'hospitality',
+        'official_code': element_id,
+        'name_plain': f'{element_id} element',
+        'description': f'{element_id} description',
+        'unit': unit,
+        'cadence': cadence,
+        'type': 'must-have',
+        'category': 'E',
+        'prompt': f'Enter {element_id}',
+        'metered': metered,
+    }
+    defaults.update(fields)
+    return FrameworkElement.objects.create(element_id=element_id, **defaults)
+
+
+def add_to_checklist(company, site, element, meter_type=None):
+    """Put an element on a site's checklist, with a meter for metered elements"""
+    CompanyChecklist.objects.create(
+        company=company, site=site, element=element, cadence=element.cadence, framework_id=element.framework_id
+    )
+    if element.metered:
+        return Meter.objects.create(company=company, site=site, type=meter_type or element.name_plain, name='Main')
+    return None
+
+
+def make_submission(company, element, year=2025, period='Jan', site=None, meter=None, value='', **fields):
+    return CompanyDataSubmission.objects.create(
+        company=company, site=site, framework_element=element, meter=meter,
+        reporting_year=year, reporting_period=period, value=value, **fields
+    )
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
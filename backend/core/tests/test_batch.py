@@ -0,0 +1,112 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.http import HttpResponseBase
+from django.test import TestCase, override_settings
+
+from .. import batch_views
+from ..db_router import current_request_state
+from ..middleware import ReplicaStickinessMiddleware
+from ..views import SiteViewSet
+from .factories import api_client, make_company, make_element, make_submission
+
+seen_paths = []
+
+
+class RecordingMiddleware:
+    """Records the path of every request that passes through the middleware stack"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        seen_paths.append(request.path)
+        return self.get_response(request)
+
+
+class BatchViewTests(TestCase):
+    def setUp(self):
+        self.user, self.company, (self.site, _) = make_company('DXB001')
+        self.element = make_element('ELEC')
+        self.submission = make_submission(self.company, self.element, site=self.site, value='10')
+        self.client = api_client(self.user)
+        seen_paths.clear()
+
+    def batch(self, *requests, client=None):
+        return (client or self.client).post('/api/batch/', {'requests': list(requests)}, format='json')
+
+    def test_results_in_request_order(self):
+        response = self.batch(
+            {'method': 'GET', 'path': '/api/sites/', 'query': {'company_id': self.company.id}},
+            {'method': 'GET', 'path': '/api/nothing-here/'},
+            {'method': 'TRACE', 'path': '/api/sites/'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, [200, 404, 405])
+        self.assertIn('Marina', str(response.data['results'][0]['body']))
+
+    @override_settings(MIDDLEWARE=settings.MIDDLEWARE + ['core.tests.test_batch.RecordingMiddleware'])
+    def test_sub_requests_run_through_middleware(self):
+        self.batch(
+            {'method': 'GET', 'path': '/api/sites/', 'query': {'company_id': self.company.id}},
+            {'method': 'GET', 'path': f'/api/data-collection/{self.submission.id}/'},
+        )
+
+        self.assertEqual(seen_paths, ['/api/batch/', '/api/sites/', f'/api/data-collection/{self.submission.id}/'])
+
+    def test_failures_return_a_generic_error(self):
+        client = api_client(self.user)
+        client.raise_request_exception = False
+        with mock.patch.object(SiteViewSet, 'list', side_effect=RuntimeError('connection string postgres://secret')), \
+                self.assertLogs('django.request', 'ERROR'):
+            response = self.batch({'method': 'GET', 'path': '/api/sites/'}, client=client)
+
+        result = response.data['results'][0]
+        self.assertEqual(result['status'], 500)
+        self.assertEqual(result['body'], {'error': 'Internal server error'})
+        self.assertNotIn('secret', response.content.decode())
+
+    @mock.patch('core.middleware.replica_configured', return_value=True)
+    def test_write_in_a_sub_request_pins_the_client_to_the_primary(self, _):
+        response = self.batch(
+            {'method': 'PATCH', 'path': f'/api/data-collection/{self.submission.id}/', 'body': {'value': '12'}},
+        )
+
+        self.assertEqual(response.data['results'][0]['status'], 200)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.value, '12')
+        self.assertIn(ReplicaStickinessMiddleware.COOKIE_NAME, response.cookies)
+        self.assertIsNone(current_request_state())
+
+    @mock.patch('core.middleware.replica_configured', return_value=True)
+    def test_reads_only_batch_does_not_pin(self, _):
+        response = self.batch({'method': 'GET', 'path': '/api/sites/', 'query': {'company_id': self.company.id}})
+
+        self.assertNotIn(ReplicaStickinessMiddleware.COOKIE_NAME, response.cookies)
+
+    def test_streamed_responses_are_refused_and_closed(self):
+        with mock.patch.object(HttpResponseBase, 'close', autospec=True, side_effect=HttpResponseBase.close) as close:
+            response = self.batch(
+                {'method': 'GET', 'path': '/api/data-collection/export/', 'query': {'company_id': self.company.id}},
+                {'method': 'GET', 'path': '/api/sites/', 'query': {'company_id': self.company.id}},
+            )
+
+        self.assertEqual([result['status'] for result in response.data['results']], [400, 200])
+        self.assertIn('cannot be batched', response.data['results'][0]['body']['error'])
+        closed = [call.args[0] for call in close.call_args_list]
+        self.assertTrue(closed[0].streaming)
+        self.assertFalse(closed[1].streaming)
+
+    def test_middleware_chain_is_built_once(self):
+        with mock.patch.object(batch_views, '_handler', None), \
+                mock.patch.object(BaseHandler, 'load_middleware', autospec=True,
+                                  side_effect=BaseHandler.load_middleware) as load_middleware:
+            for _ in range(2):
+                self.batch({'method': 'GET', 'path': '/api/sites/', 'query': {'company_id': self.company.id}})
+
+        # The test client builds its own handler too
+        built = [call.args[0] for call in load_middleware.call_args_list if type(call.args[0]) is BaseHandler]
+        self.assertEqual(len(built), 1)
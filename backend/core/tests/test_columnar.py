@@ -0,0 +1,85 @@
+from django.test import TestCase
+
+from .factories import add_to_checklist, api_client, make_company, make_element, make_submission, make_user
+
+
+class ColumnarFormatTests(TestCase):
+    """?format=columnar carries the same rows as the default JSON, with shared details sent once"""
+
+    def setUp(self):
+        self.user, self.company, (self.marina, self.downtown) = make_company('DXB001')
+        self.assignee = make_user(self.company, 'collector', 'data_collector')
+        self.client = api_client(self.user)
+        self.elements = [
+            make_element('ELEC', name_plain='Electricity Consumption'),
+            make_element('STAFF', metered=False, unit='count', name_plain='Staff headcount'),
+        ]
+        for site in (self.marina, self.downtown):
+            for element in self.elements:
+                meter = add_to_checklist(self.company, site, element)
+                make_submission(
+                    self.company, element, site=site, meter=meter, value='100', assigned_to=self.assignee
+                )
+
+    def get(self, path, **params):
+        response = self.client.get(path, {'company_id': self.company.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_submissions(self):
+        rows = self.get('/api/data-collection/', year=2025)['results']
+        columnar = self.get('/api/data-collection/', year=2025, format='columnar')['results']
+        columns = columnar['columns']
+
+        self.assertEqual(columnar['count'], len(rows))
+        self.assertEqual(columns['submission'], [row['id'] for row in rows])
+        self.assertEqual(columns['value'], [row['value'] for row in rows])
+        self.assertEqual(columns['meter'], [row['meter'] for row in rows])
+        self.assertEqual(set(columnar['elements']), {'ELEC', 'STAFF'})
+        self.assertEqual(len(columnar['meters']), 2)  # One per site, sent once however many rows use it
+        self.assertEqual(columnar['users'], {str(self.assignee.id): {
+            'username': 'collector', 'first_name': '', 'last_name': '', 'email': 'collector@example.com',
+        }})
+
+    def test_tasks(self):
+        params = {'year': 2025, 'month': 1}
+        groups = self.get('/api/data-collection/tasks/', **params)
+        columnar = self.get('/api/data-collection/tasks/', format='columnar', **params)
+        columns = columnar['columns']
+
+        tasks = [(group['site']['id'], task) for group in groups for task in group['tasks']]
+        self.assertEqual((columnar['reporting_year'], columnar['reporting_period']), (2025, 'Jan'))
+        self.assertEqual(columnar['count'], len(tasks))
+        self.assertEqual(columns['submission'], [task['submission']['id'] for _, task in tasks])
+        self.assertEqual(columns['site'], [site_id for site_id, _ in tasks])
+        self.assertEqual(columns['type'], [task['type'] for _, task in tasks])
+        self.assertEqual(columns['meter'], [task['meter'] and task['meter']['id'] for _, task in tasks])
+        self.assertEqual(
+            [columnar['elements'][element]['name'] for element in columns['element']],
+            [task['element_name'] for _, task in tasks],
+        )
+        self.assertEqual(columnar['sites'], {
+            str(self.marina.id): {'name': 'Marina'}, str(self.downtown.id): {'name': 'Downtown'},
+        })
+
+    def test_site_tasks(self):
+        params = {'year': 2025, 'month': 1, 'site_id': self.marina.id}
+        tasks = self.get('/api/data-collection/tasks/', **params)
+        columnar = self.get('/api/data-collection/tasks/', format='columnar', **params)
+
+        self.assertEqual(columnar['columns']['submission'], [task['submission']['id'] for task in tasks])
+        self.assertEqual(set(columnar['columns']['site']), {self.marina.id})
+
+    def test_aggregated_checklist(self):
+        columnar = self.get('/api/checklist/', format='columnar')
+        columns = columnar['columns']
+
+        self.assertEqual(columnar['count'], 2)
+        self.assertEqual(sorted(columns['element']), ['ELEC', 'STAFF'])
+        self.assertEqual([sorted(sites) for sites in columns['sites']], [sorted([self.marina.id, self.downtown.id])] * 2)
+
+    def test_site_checklist(self):
+        columns = self.get('/api/checklist/', format='columnar', site_id=self.downtown.id)['results']['columns']
+
+        self.assertEqual(sorted(columns['element']), ['ELEC', 'STAFF'])
+        self.assertEqual(set(columns['site']), {self.downtown.id})
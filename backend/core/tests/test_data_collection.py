@@ -0,0 +1,111 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from ..models import CompanyDataSubmission, CompanyYearlyRollup, QualityFlag
+from ..quality import QualityCheckEngine
+from .factories import add_to_checklist, api_client, make_company, make_element, make_submission, make_user
+
+
+class SubmissionEditTests(TestCase):
+    def setUp(self):
+        self.admin, self.company, (self.marina, self.downtown) = make_company('DXB001')
+        self.element = make_element(
+            'ELEC', name_plain='Electricity Consumption', quality_checks=[{'type': 'range', 'min': 0, 'max': 1000}]
+        )
+        self.submissions = {}
+        for site in (self.marina, self.downtown):
+            meter = add_to_checklist(self.company, site, self.element)
+            for period in ('Jan', 'Feb'):
+                self.submissions[site.name, period] = make_submission(
+                    self.company, self.element, site=site, meter=meter, period=period, value='100'
+                )
+
+    def bulk(self, user, changes):
+        return api_client(user).patch('/api/data-collection/bulk/', {
+            'company_id': self.company.id,
+            'changes': [{'id': submission.id, 'value': value} for submission, value in changes],
+        }, format='json')
+
+    def patch(self, user, submission, value):
+        return api_client(user).patch(f'/api/data-collection/{submission.id}/', {'value': value}, format='json')
+
+    def test_bulk_update(self):
+        response = self.bulk(self.admin, [(self.submissions['Marina', 'Jan'], '250'), (self.submissions['Downtown', 'Feb'], '50')])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(row['value'] for row in response.data['updated']), ['250', '50'])
+        self.assertEqual(CompanyYearlyRollup.objects.get(company=self.company).total, Decimal('500'))
+
+    def test_viewers_cannot_edit(self):
+        viewer = make_user(self.company, 'viewer', 'viewer')
+        submission = self.submissions['Marina', 'Jan']
+
+        self.assertEqual(self.bulk(viewer, [(submission, '1')]).status_code, 403)
+        self.assertEqual(self.patch(viewer, submission, '1').status_code, 403)
+        submission.refresh_from_db()
+        self.assertEqual(submission.value, '100')
+
+    def test_site_roles_only_edit_their_sites(self):
+        manager = make_user(self.company, 'marina-manager', 'site_manager', sites=[self.marina])
+        marina, downtown = self.submissions['Marina', 'Jan'], self.submissions['Downtown', 'Jan']
+
+        response = self.bulk(manager, [(marina, '1'), (downtown, '2')])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['ids'], [downtown.id])
+        self.assertEqual(CompanyDataSubmission.objects.get(pk=marina.pk).value, '100')  # Nothing applied
+
+        self.assertEqual(self.bulk(manager, [(marina, '1')]).status_code, 200)
+        self.assertEqual(self.patch(manager, downtown, '2').status_code, 403)
+        self.assertEqual(self.patch(manager, marina, '3').status_code, 200)
+
+    def test_other_companies_cannot_edit(self):
+        outsider, _, _ = make_company('AUH001')
+        self.assertEqual(self.patch(outsider, self.submissions['Marina', 'Jan'], '1').status_code, 403)
+        self.assertEqual(self.bulk(outsider, [(self.submissions['Marina', 'Jan'], '1')]).status_code, 403)
+
+    def test_only_editors_rerun_quality_checks(self):
+        viewer = make_user(self.company, 'viewer', 'viewer')
+        manager = make_user(self.company, 'marina-manager', 'site_manager', sites=[self.marina])
+        QualityFlag.objects.create(company=self.company, submission=self.submissions['Downtown', 'Jan'],
+                                   rule='range', message='kept')
+
+        def rerun(user, **params):
+            return api_client(user).post(
+                f"/api/reports/quality/?{'&'.join(f'{key}={value}' for key, value in params.items())}"
+            ).status_code
+
+        self.assertEqual(rerun(viewer, company_id=self.company.id, year=2025), 403)
+        self.assertEqual(rerun(viewer, company_id=self.company.id, year=2025, site_id=self.marina.id), 403)
+        self.assertEqual(rerun(manager, company_id=self.company.id, year=2025), 403)
+        self.assertEqual(rerun(manager, company_id=self.company.id, year=2025, site_id=self.downtown.id), 403)
+        self.assertTrue(QualityFlag.objects.filter(message='kept').exists())
+
+        self.assertEqual(rerun(manager, company_id=self.company.id, year=2025, site_id=self.marina.id), 200)
+        self.assertEqual(rerun(self.admin, company_id=self.company.id, year=2025), 200)
+        self.assertFalse(QualityFlag.objects.filter(message='kept').exists())
+
+    def test_bulk_update_rechecks_only_the_changed_series(self):
+        untouched = self.submissions['Downtown', 'Jan']
+        QualityFlag.objects.create(company=self.company, submission=untouched, rule='range', message='stale')
+
+        with mock.patch.object(QualityCheckEngine, 'run') as full_run:
+            response = self.bulk(self.admin, [(self.submissions['Marina', 'Jan'], '5000')])
+
+        self.assertEqual(response.status_code, 200)
+        full_run.assert_not_called()
+        flags = set(QualityFlag.objects.values_list('submission_id', 'rule'))
+        self.assertEqual(flags, {(self.submissions['Marina', 'Jan'].id, 'range'), (untouched.id, 'range')})
+
+    def test_recheck_matches_a_full_run(self):
+        self.bulk(self.admin, [(self.submissions['Marina', 'Jan'], '5000'), (self.submissions['Marina', 'Feb'], '-3')])
+        rechecked = set(QualityFlag.objects.values_list('submission_id', 'rule', 'message'))
+
+        QualityCheckEngine.run(self.company, 2025)
+        self.assertEqual(rechecked, set(QualityFlag.objects.values_list('submission_id', 'rule', 'message')))
+
+        self.bulk(self.admin, [(self.submissions['Marina', 'Jan'], '100')])
+        rechecked = set(QualityFlag.objects.values_list('submission_id', 'rule', 'message'))
+        QualityCheckEngine.run(self.company, 2025)
+        self.assertEqual(rechecked, set(QualityFlag.objects.values_list('submission_id', 'rule', 'message')))
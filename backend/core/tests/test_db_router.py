@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils.connection import ConnectionDoesNotExist
+
+from ..db_router import (
+    REPLICA_ALIAS, ReadReplicaRouter, begin_request, current_request_state, end_request, read_from_replica,
+    replica_reads
+)
+from ..models import Company
+from ..reports import DataVersion
+
+
+@mock.patch('core.db_router.replica_configured', return_value=True)
+class ReadReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+        self.addCleanup(end_request)
+
+    def test_reads_go_to_the_replica_only_inside_replica_reads(self, _):
+        self.assertEqual(self.router.db_for_read(Company), DEFAULT_DB_ALIAS)
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Company), REPLICA_ALIAS)
+        self.assertEqual(self.router.db_for_read(Company), DEFAULT_DB_ALIAS)
+
+    def test_writes_always_go_to_the_primary(self, _):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Company), DEFAULT_DB_ALIAS)
+
+    def test_write_pins_the_rest_of_the_request(self, _):
+        state = begin_request()
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Company), REPLICA_ALIAS)
+            self.router.db_for_write(Company)
+            self.assertEqual(self.router.db_for_read(Company), DEFAULT_DB_ALIAS)
+        self.assertTrue(state.wrote)
+
+    def test_sticky_request_reads_from_the_primary(self, _):
+        begin_request(pinned=True)
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Company), DEFAULT_DB_ALIAS)
+
+    def test_sub_request_hands_writes_to_its_parent(self, _):
+        outer = begin_request()
+        inner = begin_request(parent=outer)
+        self.router.db_for_write(Company)
+        end_request(inner)
+
+        self.assertIs(current_request_state(), outer)
+        self.assertTrue(outer.wrote)
+        self.assertTrue(outer.pinned)
+        self.assertTrue(begin_request(parent=outer).pinned)
+
+    def test_generators_read_from_the_replica_while_consumed(self, _):
+        @read_from_replica
+        def rows():
+            for _ in range(2):
+                yield self.router.db_for_read(Company)
+
+        iterator = rows()
+        self.assertEqual(self.router.db_for_read(Company), DEFAULT_DB_ALIAS)
+        self.assertEqual(list(iterator), [REPLICA_ALIAS, REPLICA_ALIAS])
+
+    def test_replica_never_migrates(self, _):
+        self.assertFalse(self.router.allow_migrate(REPLICA_ALIAS, 'core'))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'core'))
+
+
+@mock.patch('core.db_router.replica_configured', return_value=True)
+class ReplicaQueryTests(TransactionTestCase):
+    """No replica alias is configured in tests, so a query routed to it fails loudly"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Hotel Co', company_code='DXB001', emirate='dubai', sector='hospitality')
+
+    def test_analytic_reads_are_routed_to_the_replica(self, _):
+        with replica_reads(), self.assertRaises(ConnectionDoesNotExist):
+            Company.objects.count()
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self, _):
+        with replica_reads(), transaction.atomic():
+            self.assertEqual(Company.objects.count(), 1)
+
+    def test_data_version_is_read_from_the_primary(self, _):
+        DataVersion.bump(self.company.id)
+        with replica_reads():
+            self.assertEqual(DataVersion.current(self.company.id), 1)
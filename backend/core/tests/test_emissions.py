@@ -0,0 +1,132 @@
+from datetime import date
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import emissions
+from ..emissions import CarbonAggregator
+from ..models import EmissionFactor
+from ..services import FrameworkProcessor
+from .factories import add_to_checklist, api_client, make_company, make_element, make_submission
+
+
+class CarbonAggregatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_data()
+
+    def create_data(self):
+        self.user, self.company, (self.marina, self.downtown) = make_company('DXB001')
+        self.electricity = make_element(
+            'ELEC', name_plain='Electricity Consumption',
+            carbon_specifications={'emission_factor': 0.4, 'scope': 'scope_2', 'unit': 'kg CO2e'},
+        )
+        self.training = make_element('STAFF', metered=False, unit='hours')
+        for site, readings in [(self.marina, {'Jan': '100', 'Feb': '200'}), (self.downtown, {'Jan': '50'})]:
+            meter = add_to_checklist(self.company, site, self.electricity)
+            for period, value in readings.items():
+                make_submission(self.company, self.electricity, site=site, meter=meter, period=period, value=value)
+        make_submission(self.company, self.training, site=self.marina, value='30')
+
+    def test_totals_by_scope_site_and_month(self):
+        report = CarbonAggregator.build(self.company, 2025)
+
+        self.assertAlmostEqual(report['total'], 140.0)
+        self.assertAlmostEqual(report['by_scope']['scope_2'], 140.0)
+        self.assertEqual(
+            [(entry['site_name'], entry['emissions']) for entry in report['by_site']],
+            [('Marina', 120.0), ('Downtown', 20.0)],
+        )
+        self.assertEqual(report['by_month'][0], {'month': 'Jan', 'emissions': 60.0})
+        self.assertEqual(report['by_month'][1], {'month': 'Feb', 'emissions': 80.0})
+        self.assertEqual(report['submissions'], 3)
+
+    def test_factor_table_overrides_element_factor_for_its_interval(self):
+        EmissionFactor.objects.create(
+            source='ELEC', emirate='dubai', valid_from=date(2025, 2, 1), factor=1, unit='kg CO2e', scope='scope_2'
+        )
+
+        report = CarbonAggregator.build(self.company, 2025)
+
+        # January keeps the element's 0.4, February onwards uses the table's 1.0
+        self.assertEqual(report['by_month'][0]['emissions'], 60.0)
+        self.assertEqual(report['by_month'][1]['emissions'], 200.0)
+
+    def test_element_factors_apply_to_base_units(self):
+        element = make_element(
+            'DIESEL', unit='L', name_plain='Diesel',
+            carbon_specifications={'emission_factor': 2.7, 'scope': 'scope_1', 'unit': 'kg CO2e'},
+        )
+        meter = add_to_checklist(self.company, self.marina, element)
+        make_submission(self.company, element, site=self.marina, meter=meter, value='1,000')
+
+        # Rolled up as 1 m³; the element's factor is per litre
+        report = CarbonAggregator.build(self.company, 2025)
+        self.assertAlmostEqual(report['by_scope']['scope_1'], 2700.0)
+
+    def test_table_factors_apply_per_activity_unit(self):
+        EmissionFactor.objects.create(
+            source='ELEC', emirate='dubai', valid_from=date(2025, 1, 1), factor=400, unit='kg CO2e',
+            activity_unit='MWh', scope='scope_2',
+        )
+
+        report = CarbonAggregator.build(self.company, 2025)
+        self.assertAlmostEqual(report['total'], 140.0)  # 350 kWh at 400 kg/MWh
+
+    def test_factors_in_other_units_are_skipped(self):
+        EmissionFactor.objects.create(
+            source='ELEC', emirate='dubai', valid_from=date(2025, 2, 1), factor=1, unit='kg CO2e',
+            activity_unit='m3', scope='scope_2',
+        )
+
+        report = CarbonAggregator.build(self.company, 2025)
+        self.assertAlmostEqual(report['total'], 60.0)  # January only
+        self.assertEqual(report['skipped'], {'no_factor': 0, 'unit_mismatch': 1})
+
+    def test_element_calculator_agrees_with_the_report(self):
+        processor = FrameworkProcessor(self.company)
+        EmissionFactor.objects.create(
+            source='ELEC', emirate='dubai', valid_from=date(2025, 2, 1), factor=1, unit='t CO2e',
+            activity_unit='MWh', scope='scope_2',
+        )
+
+        january = processor.calculate_carbon_emissions(self.electricity, 150, 2025, 'Jan')
+        february = processor.calculate_carbon_emissions(self.electricity, 200, 2025, 'Feb')
+        self.assertAlmostEqual(january['carbon_emissions'], 60.0)
+        self.assertEqual(january['calculation_method'], 'element_specifications')
+        self.assertAlmostEqual(february['carbon_emissions'], 200.0)
+        self.assertEqual((february['unit'], february['emission_factor_unit']), ('kg CO2e', 'kg CO2e per kWh'))
+
+        by_month = CarbonAggregator.build(self.company, 2025)['by_month']
+        self.assertAlmostEqual(by_month[0]['emissions'], january['carbon_emissions'])
+        self.assertAlmostEqual(by_month[1]['emissions'], february['carbon_emissions'])
+
+    def test_calculator_rejects_bad_years(self):
+        client = api_client(self.user)
+        for year in ('abc', '0'):
+            with self.subTest(year):
+                response = client.post('/api/framework-elements/ELEC/calculate_carbon/', {
+                    'value': 10, 'company_id': self.company.id, 'year': year, 'reporting_period': 'Jan',
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('year', response.data['error'])
+
+    def test_python_fallback_matches(self):
+        with_numpy = CarbonAggregator.build(self.company, 2025)
+        with mock.patch.object(emissions, 'np', None):
+            without_numpy = CarbonAggregator.build(self.company, 2025)
+
+        for key in ('total', 'by_scope', 'by_site', 'by_month', 'by_source'):
+            self.assertEqual(with_numpy[key], without_numpy[key])
+
+    def test_edits_change_the_cached_report(self):
+        self.assertAlmostEqual(CarbonAggregator.get(self.company, 2025)['total'], 140.0)
+
+        submission = self.electricity.companydatasubmission_set.get(site=self.downtown, reporting_period='Jan')
+        submission.value = '150'
+        with self.captureOnCommitCallbacks(execute=True):
+            submission.save()
+
+        self.assertAlmostEqual(CarbonAggregator.get(self.company, 2025)['total'], 180.0)
@@ -0,0 +1,504 @@
+import csv
+import hashlib
+import importlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..evidence_service import ChunkedUploadService, EvidenceGarbageCollector, EvidenceStore, StorageAccounting
+from ..models import CompanyDataSubmission, EvidenceBlob, EvidenceUpload
+from .factories import add_to_checklist, api_client, make_company, make_element, make_submission, make_user
+
+CONTENT = b'%PDF-1.4 utility bill ' * 200
+CONTENT_SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class EvidenceTestCase(TestCase):
+    """Runs against a throwaway MEDIA_ROOT"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.element = make_element('ELEC')
+        self.user, self.company, (self.site, _) = make_company('DXB001')
+        self.submission = make_submission(self.company, self.element, site=self.site, value='100')
+
+    def store(self, submission, content=CONTENT):
+        blob, _ = EvidenceStore.store_upload(SimpleUploadedFile('bill.pdf', content))
+        return EvidenceStore.attach(submission, blob)
+
+    def start_upload(self, user, submission, content=CONTENT, **extra):
+        return api_client(user).post('/api/evidence-uploads/', {
+            'submission_id': submission.id, 'filename': 'bill.pdf', 'size': len(content), **extra
+        }, format='json')
+
+
+class EvidenceDedupTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store(self.submission)
+        self.other_user, self.other_company, (other_site, _) = make_company('AUH001')
+        self.other_submission = make_submission(self.other_company, self.element, site=other_site, value='5')
+
+    def test_client_hash_dedupes_content_the_company_holds(self):
+        submission = make_submission(self.company, self.element, site=self.site, period='Feb')
+
+        response = self.start_upload(self.user, submission, sha256=CONTENT_SHA256)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['deduplicated'])
+        submission.refresh_from_db()
+        self.assertEqual(submission.evidence_blob_id, CONTENT_SHA256)
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 2)
+
+    def test_client_hash_cannot_claim_another_companys_file(self):
+        response = self.start_upload(self.other_user, self.other_submission, sha256=CONTENT_SHA256)
+
+        # Same answer as for content nobody has: upload the bytes
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('deduplicated', response.data)
+        self.assertEqual(response.data['offset'], 0)
+        self.other_submission.refresh_from_db()
+        self.assertIsNone(self.other_submission.evidence_blob_id)
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 1)
+
+    def test_uploaded_bytes_share_storage_without_revealing_it(self):
+        client = api_client(self.other_user)
+        upload_id = self.start_upload(self.other_user, self.other_submission, sha256=CONTENT_SHA256).data['id']
+
+        response = client.put(
+            f'/api/evidence-uploads/{upload_id}/', CONTENT, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{len(CONTENT) - 1}/{len(CONTENT)}'
+        )
+        self.assertEqual(response.data['offset'], len(CONTENT))
+        response = client.post(f'/api/evidence-uploads/{upload_id}/finalize/', {'sha256': CONTENT_SHA256}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['deduplicated'])
+        self.other_submission.refresh_from_db()
+        self.assertEqual(self.other_submission.evidence_blob_id, CONTENT_SHA256)
+        blob = EvidenceBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(EvidenceUpload.objects.get(pk=upload_id).status, 'complete')
+
+    def test_find_scoped_to_company(self):
+        self.assertIsNotNone(EvidenceStore.find(CONTENT_SHA256, len(CONTENT), company_id=self.company.id))
+        self.assertIsNone(EvidenceStore.find(CONTENT_SHA256, len(CONTENT), company_id=self.other_company.id))
+        self.assertIsNone(EvidenceStore.find(CONTENT_SHA256, len(CONTENT) + 1, company_id=self.company.id))
+
+
+class ChunkedUploadTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(self.user)
+        self.upload_id = self.start_upload(self.user, self.submission).data['id']
+        self.addCleanup(ChunkedUploadService._running_hashes.clear)
+
+    def put(self, start, end, total=len(CONTENT)):
+        return self.client.put(
+            f'/api/evidence-uploads/{self.upload_id}/', CONTENT[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{total}'
+        )
+
+    def finalize(self):
+        return self.client.post(f'/api/evidence-uploads/{self.upload_id}/finalize/', {'sha256': CONTENT_SHA256}, format='json')
+
+    def test_chunks_received_by_another_worker(self):
+        self.assertEqual(self.put(0, 999).data['offset'], 1000)
+        ChunkedUploadService._running_hashes.clear()  # The next chunk lands on a worker that saw none of this
+
+        self.assertEqual(self.put(1000, len(CONTENT) - 1).data['offset'], len(CONTENT))
+        offset, hasher, _ = ChunkedUploadService._running_hashes[EvidenceUpload.objects.get().pk]
+        self.assertEqual((offset, hasher.hexdigest()), (len(CONTENT), CONTENT_SHA256))
+        self.assertEqual(self.finalize().status_code, 200)
+
+    def test_retried_chunk_is_not_written_twice(self):
+        self.put(0, 999)
+        self.assertEqual(self.put(0, 1999).data['offset'], 2000)
+        self.assertEqual(self.put(0, 999).data['offset'], 2000)
+        self.put(2000, len(CONTENT) - 1)
+
+        self.assertEqual(self.finalize().status_code, 200)
+
+    def test_total_must_match_the_upload(self):
+        response = self.put(0, 999, total=len(CONTENT) + 1)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(EvidenceUpload.objects.get().received_bytes, 0)
+
+    def test_gaps_are_rejected(self):
+        response = self.put(1000, 1999)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 0))
+
+    def test_idle_running_hashes_expire(self):
+        with mock.patch.object(ChunkedUploadService, 'RUNNING_HASH_LIMIT', 1):
+            self.put(0, 999)
+            other = self.start_upload(self.user, make_submission(self.company, self.element, site=self.site, period='Feb'))
+            self.client.put(
+                f"/api/evidence-uploads/{other.data['id']}/", CONTENT[:10], content_type='application/octet-stream',
+                HTTP_CONTENT_RANGE=f'bytes 0-9/{len(CONTENT)}'
+            )
+
+        self.assertEqual(list(ChunkedUploadService._running_hashes), [uuid.UUID(other.data['id'])])
+        # The evicted upload carries on from its part file
+        self.put(1000, len(CONTENT) - 1)
+        self.assertEqual(self.finalize().status_code, 200)
+
+    def test_finalizing_twice_attaches_once(self):
+        self.put(0, len(CONTENT) - 1)
+        self.assertEqual(self.finalize().status_code, 200)
+
+        response = self.finalize()
+        self.assertEqual((response.status_code, response.data['upload']['status']), (200, 'complete'))
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 1)
+
+    def test_only_editors_can_upload(self):
+        other_site = self.company.sites.exclude(pk=self.site.pk).get()
+        viewer = make_user(self.company, 'viewer', 'viewer')
+        outsider = make_user(self.company, 'other-site-manager', 'site_manager', sites=[other_site])
+        self.store(make_submission(self.company, self.element, site=self.site, period='Feb'))
+
+        for user in (viewer, outsider):
+            with self.subTest(user.username):
+                client = api_client(user)
+                # Not even with the hash of a file the company holds, which would attach it straight away
+                self.assertEqual(self.start_upload(user, self.submission, sha256=CONTENT_SHA256).status_code, 403)
+                response = client.put(
+                    f'/api/evidence-uploads/{self.upload_id}/', CONTENT, content_type='application/octet-stream',
+                    HTTP_CONTENT_RANGE=f'bytes 0-{len(CONTENT) - 1}/{len(CONTENT)}'
+                )
+                self.assertEqual(response.status_code, 403)
+                self.assertEqual(client.post(f'/api/evidence-uploads/{self.upload_id}/finalize/').status_code, 403)
+
+        self.submission.refresh_from_db()
+        self.assertIsNone(self.submission.evidence_blob_id)
+        self.assertEqual(EvidenceUpload.objects.get(pk=self.upload_id).received_bytes, 0)
+
+
+class EvidenceDownloadTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store(self.submission)
+        self.client = api_client(self.user)
+        self.url = f'/api/evidence/{self.submission.id}/'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_download(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, CONTENT)
+        self.assertEqual(response['ETag'], f'"{CONTENT_SHA256}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_byte_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, CONTENT[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(CONTENT)}')
+
+        response, body = self.get(HTTP_RANGE='bytes=-50')
+        self.assertEqual(body, CONTENT[-50:])
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(HTTP_RANGE=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=f'"{CONTENT_SHA256}"')
+        self.assertEqual((response.status_code, body), (206, CONTENT[:10]))
+
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"something-else"')
+        self.assertEqual((response.status_code, body), (200, CONTENT))
+
+    def test_not_modified(self):
+        response, _ = self.get(HTTP_IF_NONE_MATCH=f'"{CONTENT_SHA256}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_companies_are_refused(self):
+        other_user, _, _ = make_company('AUH001')
+        self.assertEqual(api_client(other_user).get(self.url).status_code, 403)
+
+
+class EvidenceUrlTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store(self.submission)
+        self.download_url = f'/api/evidence/{self.submission.id}/'
+
+    def test_submissions_only_link_the_download_view(self):
+        data = api_client(self.user).get(f'/api/data-collection/{self.submission.id}/').data
+
+        self.assertTrue(data['evidence_file'].endswith(self.download_url))
+        self.assertEqual(data['evidence_file'], data['evidence_url'])
+
+    def test_columnar_rows_only_link_the_download_view(self):
+        response = api_client(self.user).get(f'/api/data-collection/?company_id={self.company.id}&format=columnar')
+        self.assertEqual(response.json()['results']['columns']['evidence_file'], [self.download_url])
+
+    def test_media_is_not_served_even_in_debug(self):
+        from esg_backend import urls
+
+        with override_settings(DEBUG=True):
+            patterns = importlib.reload(urls).urlpatterns
+        self.addCleanup(importlib.reload, urls)
+
+        prefixes = [str(pattern.pattern) for pattern in patterns]
+        self.assertFalse([prefix for prefix in prefixes if 'media' in prefix])
+        response = self.client.get(f'/media/{self.submission.evidence_file.name}')
+        self.assertNotIn(CONTENT, b''.join(response.streaming_content) if response.streaming else response.content)
+
+
+class StorageAccountingTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_site = self.company.sites.exclude(pk=self.site.pk).get()
+        self.submissions = [self.submission] + [
+            make_submission(self.company, self.element, site=site, period=period, value='1')
+            for site, period in [(self.site, 'Feb'), (self.other_site, 'Jan'), (self.other_site, 'Feb')]
+        ]
+        for submission in self.submissions:
+            self.store(submission)
+
+    def usage(self):
+        return {(entry['site_id'], entry['bytes_used'], entry['file_count'])
+                for entry in StorageAccounting.usage(self.company)['sites'] if entry['file_count']}
+
+    def assertMatchesRebuild(self):
+        maintained = self.usage()
+        StorageAccounting.rebuild(self.company.id)
+        self.assertEqual(maintained, self.usage())
+
+    def test_single_delete(self):
+        self.submissions[0].delete()
+
+        self.assertEqual(self.usage(), {(self.site.id, len(CONTENT), 1), (self.other_site.id, 2 * len(CONTENT), 2)})
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 3)
+        self.assertMatchesRebuild()
+
+    def test_bulk_delete_releases_each_blob_once(self):
+        with mock.patch.object(EvidenceStore, 'release', wraps=EvidenceStore.release) as release, \
+                self.captureOnCommitCallbacks(execute=True):
+            CompanyDataSubmission.objects.filter(reporting_period='Feb').delete()
+
+        release.assert_called_once_with(CONTENT_SHA256, count=2)
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 2)
+        self.assertEqual(self.usage(), {(self.site.id, len(CONTENT), 1), (self.other_site.id, len(CONTENT), 1)})
+        self.assertMatchesRebuild()
+
+    def test_cascading_delete_frees_the_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.delete()
+            self.other_site.delete()
+
+        self.assertEqual(self.usage(), set())
+        self.assertFalse(EvidenceBlob.objects.exists())
+
+
+class EvidenceReplaceTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store(self.submission)
+
+    def upload(self, content, **data):
+        return api_client(self.user).put(f'/api/data-collection/{self.submission.id}/', {
+            'evidence_file': SimpleUploadedFile('new.pdf', content), **data
+        }, format='multipart')
+
+    def test_rejected_update_keeps_the_evidence(self):
+        response = self.upload(b'second bill', reporting_year='later')
+
+        self.assertEqual(response.status_code, 400)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.evidence_blob_id, CONTENT_SHA256)
+        self.assertEqual(list(EvidenceBlob.objects.values_list('sha256', 'ref_count')), [(CONTENT_SHA256, 1)])
+
+    def test_accepted_update_swaps_the_evidence(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(b'second bill', value='200')
+
+        self.assertEqual(response.status_code, 200)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.value, '200')
+        self.assertEqual(self.submission.evidence_blob_id, hashlib.sha256(b'second bill').hexdigest())
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 1)
+
+    def test_stale_copy_releases_what_the_row_holds(self):
+        stale = CompanyDataSubmission.objects.get(pk=self.submission.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store(self.submission, b'second bill')
+            self.store(stale, b'third bill')
+
+        # The second bill is released rather than the first one twice
+        self.assertEqual(
+            list(EvidenceBlob.objects.values_list('sha256', 'ref_count')),
+            [(hashlib.sha256(b'third bill').hexdigest(), 1)],
+        )
+        usage = StorageAccounting.usage(self.company)['sites']
+        StorageAccounting.rebuild(self.company.id)
+        self.assertEqual(usage, StorageAccounting.usage(self.company)['sites'])
+
+
+class EvidenceExportTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_site = self.company.sites.exclude(pk=self.site.pk).get()
+        meter = add_to_checklist(self.company, self.other_site, self.element)
+        self.store(self.submission)
+        self.shared = self.store(make_submission(self.company, self.element, site=self.site, period='Feb', value='1'))
+        self.metered = self.store(
+            make_submission(self.company, self.element, site=self.other_site, meter=meter, value='2'), b'other bill'
+        )
+        make_submission(self.company, self.element, site=self.other_site, period='Feb', value='3')  # No evidence
+        self.store(make_submission(self.company, self.element, year=2024, site=self.site, value='4'), b'last year')
+
+    def export(self, user=None, **params):
+        response = api_client(user or self.user).get(
+            '/api/evidence/export/', {'company_id': self.company.id, 'year': 2025, **params}
+        )
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) if response.streaming else None
+        return response, archive
+
+    def manifest(self, archive):
+        rows = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode('utf-8-sig'))))
+        return {int(row['submission_id']): row for row in rows}
+
+    def test_archive_and_manifest(self):
+        response, archive = self.export()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('DXB001_2025_evidence.zip', response['Content-Disposition'])
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+        manifest = self.manifest(archive)
+        self.assertEqual(set(manifest), {self.submission.id, self.shared.id, self.metered.id})
+        first, shared, metered = manifest[self.submission.id], manifest[self.shared.id], manifest[self.metered.id]
+
+        # Content shared by two submissions is archived once and referenced by both
+        self.assertEqual((shared['file'], shared['status']), (first['file'], 'included (shared)'))
+        self.assertEqual(first['sha256'], CONTENT_SHA256)
+        self.assertEqual(archive.read(first['file']), CONTENT)
+        self.assertTrue(first['file'].startswith('Marina/01-Jan/ELEC_'))
+
+        self.assertTrue(metered['file'].startswith('Downtown/01-Jan/ELEC_Main_'))
+        self.assertEqual(archive.read(metered['file']), b'other bill')
+        self.assertEqual(sorted(archive.namelist()), sorted([first['file'], metered['file'], 'manifest.csv']))
+
+    def test_site_filter(self):
+        response, archive = self.export(site_id=self.other_site.id)
+
+        self.assertIn('DXB001_2025_Downtown_evidence.zip', response['Content-Disposition'])
+        self.assertEqual(set(self.manifest(archive)), {self.metered.id})
+
+    def test_missing_files_are_listed_not_fatal(self):
+        default_storage.delete(self.metered.evidence_file.name)
+
+        _, archive = self.export()
+        row = self.manifest(archive)[self.metered.id]
+        self.assertEqual((row['file'], row['status']), ('', 'missing'))
+        self.assertEqual(len(archive.namelist()), 2)
+
+    def test_other_companies_are_refused(self):
+        outsider, _, _ = make_company('AUH001')
+        self.assertEqual(self.export(outsider)[0].status_code, 403)
+        self.assertEqual(self.export(year='last')[0].status_code, 400)
+
+
+class GarbageCollectionTests(EvidenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store(self.submission)
+        self.stray = self.write('evidence/2024/01/stray.pdf', age_hours=2)
+        self.fresh = self.write('evidence/2024/01/fresh.pdf')
+
+        self.upload = EvidenceUpload.objects.create(
+            company=self.company, submission=self.submission, filename='bill.pdf', total_size=len(CONTENT),
+            received_bytes=10,
+        )
+        EvidenceUpload.objects.filter(pk=self.upload.pk).update(updated_at=timezone.now() - timedelta(days=8))
+        self.part = self.touch(ChunkedUploadService.part_path(self.upload))
+        self.stray_part = self.touch(os.path.join(ChunkedUploadService.upload_dir(), f'{uuid.uuid4()}.part'))
+
+    def write(self, name, age_hours=0):
+        name = default_storage.save(name, ContentFile(b'orphaned bill'))
+        self.age(default_storage.path(name), age_hours)
+        return name
+
+    def touch(self, path, age_hours=2):
+        with open(path, 'wb') as part:
+            part.write(CONTENT[:10])
+        self.age(path, age_hours)
+        return path
+
+    def age(self, path, hours):
+        stamp = time.time() - hours * 3600
+        os.utime(path, (stamp, stamp))
+
+    def gc(self, *args):
+        output = io.StringIO()
+        call_command('gc_evidence', *args, stdout=output)
+        return output.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        output = self.gc('--dry-run')
+
+        self.assertIn(self.stray, output)
+        self.assertNotIn(self.fresh, output)
+        self.assertNotIn(self.submission.evidence_file.name, output)
+        self.assertTrue(default_storage.exists(self.stray))
+        self.assertTrue(os.path.exists(self.stray_part))
+        self.assertTrue(EvidenceUpload.objects.filter(pk=self.upload.pk).exists())
+
+    def test_unreferenced_files_are_quarantined(self):
+        self.gc()
+
+        self.assertFalse(default_storage.exists(self.stray))
+        quarantined = [name for name, _, _ in EvidenceGarbageCollector.stored_files(path=EvidenceGarbageCollector.QUARANTINE_ROOT)]
+        self.assertEqual(len(quarantined), 1)
+        self.assertTrue(quarantined[0].endswith(self.stray))
+        # Referenced and recently written files stay where they are
+        self.assertTrue(default_storage.exists(self.submission.evidence_file.name))
+        self.assertTrue(default_storage.exists(self.fresh))
+
+    def test_delete_mode(self):
+        self.gc('--files', 'delete')
+
+        self.assertFalse(default_storage.exists(self.stray))
+        self.assertFalse(list(EvidenceGarbageCollector.stored_files(path=EvidenceGarbageCollector.QUARANTINE_ROOT)))
+
+    def test_stale_uploads_are_aborted(self):
+        self.gc('--files', 'skip')
+
+        self.assertFalse(EvidenceUpload.objects.filter(pk=self.upload.pk).exists())
+        self.assertFalse(os.path.exists(self.part))
+        self.assertFalse(os.path.exists(self.stray_part))
+        self.assertTrue(default_storage.exists(self.stray))
+
+    def test_orphaned_submissions_are_deleted(self):
+        orphan = make_submission(self.company, self.element, site=self.site, period='Feb', value='1')
+        CompanyDataSubmission.objects.filter(pk=orphan.pk).update(framework_element_id=None, element_id=999999)
+
+        self.assertIn('Deleted 1 orphaned submissions', self.gc('--files', 'skip'))
+        self.assertEqual(list(CompanyDataSubmission.objects.values_list('pk', flat=True)), [self.submission.pk])
@@ -0,0 +1,97 @@
+import io
+from datetime import timedelta
+from unittest import mock, skipIf
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+
+from ..evidence_previews import Image, PreviewService
+from ..evidence_service import EvidenceStore
+from ..models import EvidenceBlob
+from .test_evidence import EvidenceTestCase
+
+
+class PreviewQueueTests(EvidenceTestCase):
+    def upload(self, name='notes.txt', content=b'meter readings for January'):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            blob, created = EvidenceStore.store_upload(SimpleUploadedFile(name, content))
+        self.assertTrue(created)
+        self.assertEqual(callbacks, [])  # Nothing is rendered in the uploading process
+        return blob
+
+    def test_new_blobs_wait_in_the_queue(self):
+        blob = self.upload()
+        self.assertEqual(EvidenceBlob.objects.get(pk=blob.pk).preview_status, 'pending')
+
+    def test_each_blob_is_claimed_once(self):
+        blob = self.upload()
+
+        self.assertEqual(PreviewService.claim_next(), blob.pk)
+        self.assertIsNone(PreviewService.claim_next())
+        self.assertFalse(PreviewService.claim(blob.pk))
+        self.assertEqual(EvidenceBlob.objects.get(pk=blob.pk).preview_status, 'processing')
+
+    def test_unpreviewable_files_are_marked_unsupported(self):
+        blob = self.upload()
+        PreviewService.claim(blob.pk)
+        self.assertEqual(PreviewService.process(blob.pk), 'unsupported')
+
+    def test_errors_mark_the_blob_failed(self):
+        blob = self.upload()
+        PreviewService.claim(blob.pk)
+        with mock.patch.object(PreviewService, 'generate', side_effect=OSError('disk full')), \
+                self.assertLogs('core.evidence_previews', 'ERROR'):
+            self.assertEqual(PreviewService.process(blob.pk), 'failed')
+        self.assertEqual(EvidenceBlob.objects.get(pk=blob.pk).preview_status, 'failed')
+
+    def test_blobs_of_dead_workers_are_requeued(self):
+        blob = self.upload()
+        PreviewService.claim(blob.pk)
+        EvidenceBlob.objects.filter(pk=blob.pk).update(preview_started_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(PreviewService.requeue_stale(timedelta(minutes=10)), 1)
+        self.assertEqual(PreviewService.claim_next(), blob.pk)
+
+    def test_worker_drains_the_queue(self):
+        first = self.upload('a.txt', b'first')
+        second = self.upload('b.txt', b'second')
+
+        call_command('run_preview_worker', '--once', stdout=io.StringIO())
+
+        statuses = set(EvidenceBlob.objects.filter(pk__in=[first.pk, second.pk]).values_list('preview_status', flat=True))
+        self.assertEqual(statuses, {'unsupported'})
+
+    @mock.patch('core.management.commands.run_preview_worker.connections')
+    @mock.patch('core.management.commands.run_preview_worker.REQUEUE_INTERVAL', 0)
+    def test_polling_worker_requeues_claims_of_dead_workers(self, _):
+        blob = self.upload()
+        PreviewService.claim(blob.pk)  # By another worker
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 1:  # The other worker dies
+                EvidenceBlob.objects.filter(pk=blob.pk).update(preview_started_at=timezone.now() - timedelta(hours=1))
+            elif len(sleeps) == 3:
+                raise KeyboardInterrupt
+
+        stdout = io.StringIO()
+        with mock.patch('time.sleep', side_effect=sleep):
+            call_command('run_preview_worker', stdout=stdout)
+
+        self.assertIn('requeued 1 stale previews', stdout.getvalue())
+        self.assertEqual(EvidenceBlob.objects.get(pk=blob.pk).preview_status, 'unsupported')
+
+    @skipIf(Image is None, 'Pillow is not installed')
+    def test_image_preview(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'green').save(buffer, 'PNG')
+        blob = self.upload('photo.png', buffer.getvalue())
+
+        call_command('run_preview_worker', '--once', stdout=io.StringIO())
+
+        blob.refresh_from_db()
+        self.assertEqual(blob.preview_status, 'ready')
+        with blob.preview.open('rb') as preview, Image.open(preview) as image:
+            self.assertEqual(max(image.size), 800)
@@ -0,0 +1,90 @@
+import csv
+import io
+
+from django.test import TestCase
+
+from ..exports import SubmissionExporter
+from ..models import CompanyDataSubmission
+from .factories import add_to_checklist, api_client, make_company, make_element, make_submission
+
+
+def read_csv(chunks):
+    return list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+
+
+class SubmissionExportTests(TestCase):
+    def setUp(self):
+        self.user, self.company, (self.marina, self.downtown) = make_company('DXB001')
+        self.element = make_element('ELEC', name_plain='Electricity Consumption')
+        self.submissions = {}
+        for site in (self.marina, self.downtown):
+            meter = add_to_checklist(self.company, site, self.element)
+            for period, value in (('Jan', '100'), ('Feb', ''), ('Mar', 'INACTIVE_PERIOD')):
+                self.submissions[site.name, period] = make_submission(
+                    self.company, self.element, site=site, meter=meter, period=period, value=value
+                )
+        make_submission(self.company, self.element, year=2024, site=self.marina, value='90')
+
+    def export(self, user=None, **params):
+        response = api_client(user or self.user).get(
+            '/api/data-collection/export/', {'company_id': self.company.id, **params}
+        )
+        rows = read_csv(response.streaming_content) if response.streaming else None
+        return response, rows
+
+    def test_rows_and_statuses(self):
+        response, rows = self.export(year=2025)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('DXB001_2025_submissions.csv', response['Content-Disposition'])
+        self.assertEqual(rows[0], SubmissionExporter.headers())
+
+        column = {header: index for index, header in enumerate(rows[0])}
+        exported = {(row[column['site']], row[column['reporting_period']]): row for row in rows[1:]}
+        self.assertEqual(set(exported), set(self.submissions))  # The 2024 row is left out
+
+        january = exported['Marina', 'Jan']
+        self.assertEqual(january[column['submission_id']], str(self.submissions['Marina', 'Jan'].id))
+        self.assertEqual(january[column['element_name']], 'Electricity Consumption')
+        self.assertEqual(january[column['meter']], 'Main')
+        self.assertEqual(january[column['unit']], 'kWh')
+        self.assertEqual(
+            [exported['Marina', period][column['status']] for period in ('Jan', 'Feb', 'Mar')],
+            ['partial', 'missing', 'inactive'],
+        )
+
+    def test_evidence_is_linked_not_located(self):
+        january = self.submissions['Marina', 'Jan']
+        CompanyDataSubmission.objects.filter(pk=january.pk).update(evidence_file='evidence/2025/01/bill.pdf')
+
+        _, rows = self.export(year=2025)
+
+        column = {header: index for index, header in enumerate(rows[0])}
+        exported = {row[column['submission_id']]: row for row in rows[1:]}
+        self.assertEqual(exported[str(january.id)][column['evidence_url']], f'/api/evidence/{january.id}/')
+        self.assertEqual(exported[str(january.id)][column['status']], 'complete')
+        self.assertEqual(exported[str(self.submissions['Marina', 'Feb'].id)][column['evidence_url']], '')
+        self.assertNotIn('bill.pdf', str(rows))
+
+    def test_site_filter(self):
+        _, rows = self.export(year=2025, site_id=self.downtown.id)
+        self.assertEqual({row[1] for row in rows[1:]}, {'Downtown'})
+        self.assertEqual(len(rows), 4)
+
+    def test_chunks_hold_the_requested_rows(self):
+        chunks = list(SubmissionExporter.stream_csv(SubmissionExporter.submissions(self.company, year=2025), rows_per_chunk=2))
+
+        self.assertEqual(len(chunks), 4)  # Header and two rows, two rows, two rows, then the empty tail
+        self.assertEqual(read_csv(chunks), read_csv([b''.join(chunks)]))
+        self.assertEqual(len(read_csv(chunks)), 7)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.export(file_type='pdf')[0].status_code, 400)
+        self.assertEqual(self.export(year='last')[0].status_code, 400)
+        if not SubmissionExporter.xlsx_available():
+            self.assertEqual(self.export(file_type='xlsx')[0].status_code, 400)
+
+    def test_other_companies_are_refused(self):
+        outsider, _, _ = make_company('AUH001')
+        self.assertEqual(self.export(outsider)[0].status_code, 403)
@@ -0,0 +1,73 @@
+import gzip
+import os
+from unittest import mock
+
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from .. import middleware
+from ..middleware import ApiCompressionMiddleware
+
+BODY = {'results': [{'id': index, 'name': f'Electricity meter {index}', 'value': '1200.5'} for index in range(200)]}
+
+
+class ApiCompressionMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def respond(self, accept_encoding, path='/api/data-collection/', response=None):
+        request = self.factory.get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        compressor = ApiCompressionMiddleware(lambda request: response or JsonResponse(BODY))
+        return compressor(request)
+
+    @mock.patch.object(middleware, 'brotli', mock.Mock())
+    def test_coding_follows_q_values(self):
+        cases = {
+            'gzip, deflate, br': 'br',
+            'br;q=0, gzip': 'gzip',
+            'gzip;q=0.5, br': 'br',
+            'br;q=0.5, gzip;q=0.8': 'gzip',
+            'BR; Q=0 , GZIP': 'gzip',
+            'br;q=0, gzip;q=0': None,
+            'identity': None,
+            '': None,
+            '*': 'br',
+            '*;q=0, gzip': 'gzip',
+            'br;q=abc, gzip': 'gzip',
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(ApiCompressionMiddleware.choose_encoding(header), expected)
+
+    def test_without_brotli_installed(self):
+        with mock.patch.object(middleware, 'brotli', None):
+            self.assertEqual(ApiCompressionMiddleware.choose_encoding('br, gzip;q=0.1'), 'gzip')
+            self.assertIsNone(ApiCompressionMiddleware.choose_encoding('br'))
+
+    @mock.patch.object(middleware, 'brotli', None)
+    def test_gzip_response(self):
+        response = self.respond('gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(gzip.decompress(response.content), JsonResponse(BODY).content)
+
+    def test_refused_codings_leave_the_body_alone(self):
+        response = self.respond('gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_small_and_non_api_responses_pass_through(self):
+        self.assertFalse(self.respond('gzip', response=JsonResponse({'ok': True})).has_header('Content-Encoding'))
+        self.assertFalse(self.respond('gzip', path='/admin/').has_header('Content-Encoding'))
+
+    def test_strong_etag_is_weakened(self):
+        response = JsonResponse(BODY)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.respond('gzip', response=response)['ETag'], 'W/"abc"')
+
+    def test_incompressible_body_is_sent_as_is(self):
+        noise = HttpResponse(os.urandom(4096), content_type='application/octet-stream')
+        with mock.patch.object(middleware, 'brotli', None):
+            response = self.respond('gzip', response=noise)
+        self.assertFalse(response.has_header('Content-Encoding'))
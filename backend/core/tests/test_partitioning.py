@@ -0,0 +1,58 @@
+import io
+from unittest import skipUnless
+
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+
+from ..models import CompanyDataSubmission
+from ..partitioning import DEFAULT_PARTITION, SubmissionPartitions, partition_name
+from .factories import make_company, make_element, make_submission
+
+
+class PartitionCommandTests(SimpleTestCase):
+    @skipUnless(connection.vendor != 'postgresql', 'checks the refusal on other databases')
+    def test_command_needs_postgresql(self):
+        with self.assertRaises(CommandError):
+            call_command('partition_submissions', '--convert', stdout=io.StringIO())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning needs PostgreSQL')
+class SubmissionPartitionTests(TransactionTestCase):
+    def setUp(self):
+        self.addCleanup(SubmissionPartitions.revert, connection)
+        _, self.company, (self.site, _) = make_company('DXB001')
+        self.element = make_element('ELEC', name_plain='Electricity Consumption')
+        make_submission(self.company, self.element, year=2023, site=self.site, value='10')
+        make_submission(self.company, self.element, year=2024, site=self.site, value='20')
+
+    def test_convert_and_revert_keep_the_rows(self):
+        result = SubmissionPartitions.convert(connection, ahead=0)
+
+        self.assertTrue(SubmissionPartitions.is_partitioned(connection))
+        self.assertEqual(result['rows'], 2)
+        names = {name for name, _, _ in SubmissionPartitions.partitions(connection)}
+        self.assertLessEqual({partition_name(2023), partition_name(2024), DEFAULT_PARTITION}, names)
+        self.assertEqual(CompanyDataSubmission.objects.filter(reporting_year=2024).get().value, '20')
+
+        SubmissionPartitions.revert(connection)
+        self.assertFalse(SubmissionPartitions.is_partitioned(connection))
+        self.assertEqual(CompanyDataSubmission.objects.count(), 2)
+
+    def test_slots_stay_unique_and_ids_keep_counting(self):
+        last_id = CompanyDataSubmission.objects.order_by('-id').values_list('id', flat=True).first()
+        SubmissionPartitions.convert(connection, ahead=0)
+
+        submission = make_submission(self.company, self.element, year=2024, period='Feb', site=self.site)
+        self.assertGreater(submission.id, last_id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_submission(self.company, self.element, year=2024, period='Feb', site=self.site)
+
+    def test_rows_of_new_years_move_out_of_the_default_partition(self):
+        SubmissionPartitions.convert(connection, ahead=0)
+        make_submission(self.company, self.element, year=2040, site=self.site, value='5')
+        self.assertEqual(SubmissionPartitions.default_rows(connection), 1)
+
+        self.assertEqual(SubmissionPartitions.ensure(connection, [2040]), [partition_name(2040)])
+        self.assertEqual(SubmissionPartitions.default_rows(connection), 0)
+        self.assertEqual(CompanyDataSubmission.objects.get(reporting_year=2040).value, '5')
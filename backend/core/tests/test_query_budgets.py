@@ -0,0 +1,202 @@
+import hashlib
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from ..emission_factors import EmissionFactorIndex
+from ..evidence_service import ChunkedUploadService
+from ..models import CompanyDataSubmission
+from .factories import add_to_checklist, make_company, make_element, make_submission
+
+YEAR = 2025
+CONTENT = b'%PDF-1.4 utility bill ' * 50
+
+# Every request reads its session and user; views that take company_id also load the user's company
+AUTH = 2
+COMPANY = 1
+
+
+def insert_statements(model, rows, batch_size=500):
+    """INSERTs bulk_create(batch_size=...) issues for rows: one on PostgreSQL, more under SQLite's parameter limit"""
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    per_statement = min(batch_size, connection.ops.bulk_batch_size(fields, [None] * rows))
+    return -(-rows // per_statement)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    A tenant with a metered and an unmetered element on every site's checklist
+    and a quarter of data. Budgets are for a cold report cache and are what
+    each endpoint needs, query by query; none has a per-site, per-meter or
+    per-row term, which the one-site subclasses check by holding the same
+    budgets with a third of the data.
+    """
+    SITES = ('Marina', 'Downtown', 'Airport')
+
+    def setUp(self):
+        cache.clear()
+        EmissionFactorIndex._compiled = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user, self.company, self.sites = make_company('DXB001', sites=self.SITES)
+            self.elements = [
+                make_element('ELEC', name_plain='Electricity Consumption'),
+                make_element('STAFF', metered=False, unit='count', name_plain='Staff headcount'),
+            ]
+            self.submissions = []
+            for site in self.sites:
+                for element in self.elements:
+                    meter = add_to_checklist(self.company, site, element)
+                    for period in ('Jan', 'Feb', 'Mar'):
+                        self.submissions.append(make_submission(
+                            self.company, element, year=YEAR, period=period, site=site, meter=meter, value='100'
+                        ))
+        self.client.force_login(self.user)
+
+    def get(self, path, **params):
+        response = self.client.get(path, {'company_id': self.company.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def new_slots(self, months):
+        return len(self.sites) * len(self.elements) * months
+
+
+class ReadQueryBudgetTests(QueryBudgetTestCase):
+    def test_dashboard(self):
+        self.get('/api/dashboard/')  # The first visit creates this year's slots
+        cache.clear()
+
+        # Framework, checklist and meter counts (3); sites, checklists, meters and the year's
+        # submissions to check every slot exists (4); progress and monthly progress (2); storage
+        # usage (1); emission factor table version, data version and meter rollups (3)
+        with self.assertNumQueries(AUTH + COMPANY + 13):
+            self.get('/api/dashboard/')
+
+    def test_dashboard_first_visit_of_the_year(self):
+        # As above, plus inserting the year's slots, bumping the data version, reading the stored
+        # slots back and compiling the emission factor index
+        with self.assertNumQueries(AUTH + COMPANY + 16 + insert_statements(CompanyDataSubmission, self.new_slots(12))):
+            self.get('/api/dashboard/')
+
+    def test_tasks(self):
+        self.get('/api/data-collection/tasks/', year=YEAR, month=1)
+
+        # Sites, checklists, active meters and the month's submissions
+        with self.assertNumQueries(AUTH + COMPANY + 4):
+            self.get('/api/data-collection/tasks/', year=YEAR, month=1)
+
+    def test_tasks_first_load_of_a_month(self):
+        # As above, plus inserting the slots, bumping the data version and reading the slots back
+        with self.assertNumQueries(AUTH + COMPANY + 6 + insert_statements(CompanyDataSubmission, self.new_slots(1))):
+            self.get('/api/data-collection/tasks/', year=YEAR, month=6)
+
+    def test_progress(self):
+        with self.assertNumQueries(AUTH + COMPANY + 1):
+            self.get('/api/data-collection/progress/', year=YEAR, month=1)
+
+        self.get('/api/data-collection/progress/', year=YEAR)
+        # Yearly progress first checks every month's slots exist, with the queries of one task load
+        with self.assertNumQueries(AUTH + COMPANY + 4 + 1):
+            self.get('/api/data-collection/progress/', year=YEAR)
+
+    def test_submissions_list(self):
+        # Page count and the page, with elements, meters and evidence joined in
+        with self.assertNumQueries(AUTH + 2):
+            response = self.get('/api/data-collection/', year=YEAR)
+        self.assertEqual(response.json()['count'], len(self.submissions))
+
+    def test_reports(self):
+        budgets = {
+            # Data version, coverage rows and framework names
+            'coverage': 3,
+            # Data version, yearly, quarterly and monthly rollups and element names
+            'consumption': 5,
+            # Factor table version, data version, meter rollups, the factor index and element factors
+            'emissions': 5,
+            'quality': 1,
+            # Data version, both years' rollups and element names
+            'year-comparison': 4,
+        }
+        for report, budget in budgets.items():
+            with self.subTest(report), self.assertNumQueries(AUTH + COMPANY + budget):
+                self.get(f'/api/reports/{report}/', year=YEAR)
+
+
+class WriteQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(ChunkedUploadService._running_hashes.clear)
+
+    def test_bulk_patch(self):
+        # The submissions and the editor's profile (2), then in one transaction: the values (1),
+        # one rollup UPDATE per grain (3), the changed series and their rules (2), clearing their
+        # quality flags (1) and the data version (1). Savepoints stand in for BEGIN and COMMIT
+        # under TestCase (4).
+        with self.assertNumQueries(AUTH + COMPANY + 2 + 8 + 4):
+            response = self.client.patch('/api/data-collection/bulk/', {
+                'company_id': self.company.id,
+                'changes': [{'id': submission.id, 'value': '250'} for submission in self.submissions],
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['updated']), len(self.submissions))
+
+    def test_batch(self):
+        requests = [
+            {'method': 'GET', 'path': '/api/sites/', 'query': {'company_id': self.company.id}},
+            {'method': 'GET', 'path': '/api/meters/', 'query': {'company_id': self.company.id}},
+        ]
+        # Sub-requests reuse the batch's user: each only costs its page count and page
+        with self.assertNumQueries(AUTH + COMPANY + 2 * 2):
+            response = self.client.post('/api/batch/', {'requests': requests}, content_type='application/json')
+        self.assertEqual([result['status'] for result in response.json()['results']], [200, 200])
+
+    def test_evidence_upload(self):
+        # The submission, its company and the uploader's role, then the upload row
+        with self.assertNumQueries(AUTH + 4):
+            response = self.client.post('/api/evidence-uploads/', {
+                'submission_id': self.submissions[0].id, 'filename': 'bill.pdf', 'size': len(CONTENT),
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['id']
+
+        # Locking the upload with its submission, its company, the uploader's role and recording
+        # the bytes received (2 savepoints)
+        with self.assertNumQueries(AUTH + 4 + 2):
+            response = self.client.put(
+                f'/api/evidence-uploads/{upload_id}/', CONTENT, content_type='application/octet-stream',
+                HTTP_CONTENT_RANGE=f'bytes 0-{len(CONTENT) - 1}/{len(CONTENT)}'
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # The locked upload with its submission, the company and the uploader's role (3); looking the content up among the company's
+        # evidence, then anywhere (2); storing the new blob (1), re-reading the submission's evidence under
+        # lock (1), counting its reference (1), attaching it (1) and adding to the site's storage usage (2,
+        # the first file inserts the row); completing the upload (1). Savepoints stand in for the
+        # transactions (8); the data version is bumped on commit.
+        with self.assertNumQueries(AUTH + 3 + 2 + 6 + 1 + 8):
+            response = self.client.post(f'/api/evidence-uploads/{upload_id}/finalize/', {
+                'sha256': hashlib.sha256(CONTENT).hexdigest(),
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_report_job(self):
+        # Data version, a finished job to reuse, the new job
+        with self.assertNumQueries(AUTH + COMPANY + 3):
+            response = self.client.post(f'/api/reports/jobs/?company_id={self.company.id}&year={YEAR}')
+        self.assertEqual(response.status_code, 202)
+
+
+class SingleSiteReadQueryBudgetTests(ReadQueryBudgetTests):
+    SITES = ('Marina',)
+
+
+class SingleSiteWriteQueryBudgetTests(WriteQueryBudgetTests):
+    SITES = ('Marina',)
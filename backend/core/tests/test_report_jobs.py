@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..models import ReportJob
+from ..report_jobs import ReportJobService, ReportPackRenderer
+from .factories import add_to_checklist, api_client, make_company, make_element, make_submission
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user, self.company, (self.site, _) = make_company('DXB001')
+            self.element = make_element('ELEC', name_plain='Electricity Consumption')
+            meter = add_to_checklist(self.company, self.site, self.element)
+            self.submission = make_submission(self.company, self.element, site=self.site, meter=meter, value='100')
+
+    def post_job(self):
+        return api_client(self.user).post(f'/api/reports/jobs/?company_id={self.company.id}&year=2025')
+
+    def test_jobs_wait_for_the_worker_by_default(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.post_job()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(callbacks, [])
+
+    @override_settings(REPORT_JOB_WORKER='thread', DEBUG=False)
+    def test_thread_worker_is_ignored_outside_debug(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks, self.assertLogs('core.report_jobs', 'WARNING'):
+            self.post_job()
+        self.assertEqual(callbacks, [])
+
+    @override_settings(REPORT_JOB_WORKER='thread', DEBUG=True)
+    def test_thread_worker_in_development(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.post_job()
+        self.assertEqual(len(callbacks), 1)
+
+    def test_worker_renders_the_pack(self):
+        job_id = self.post_job().data['id']
+
+        self.assertEqual(str(ReportJobService.claim_next()), job_id)
+        self.assertIsNone(ReportJobService.claim_next())
+        ReportJobService.run(job_id)
+
+        job = ReportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, 'complete')
+        with job.artifact.open('rb') as artifact, zipfile.ZipFile(artifact) as archive:
+            names = archive.namelist()
+            submissions_csv = archive.read('appendix/submissions.csv').decode('utf-8-sig')
+        self.assertIn('report.html', names)
+        self.assertIn('appendix/coverage.csv', names)
+        self.assertIn('100', submissions_csv)
+
+    def test_unchanged_data_reuses_the_job(self):
+        first = self.post_job().data
+        second = self.post_job()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['id'], first['id'])
+
+        self.submission.value = '120'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submission.save()
+        third = self.post_job()
+        self.assertEqual(third.status_code, 202)
+        self.assertNotEqual(third.data['id'], first['id'])
+
+    def test_failure_details_stay_in_the_log(self):
+        job_id = self.post_job().data['id']
+        ReportJobService.claim(job_id)
+
+        with mock.patch.object(ReportPackRenderer, 'render', side_effect=RuntimeError('password=hunter2')), \
+                self.assertLogs('core.report_jobs', 'ERROR') as logs:
+            ReportJobService.run(job_id)
+
+        self.assertIn('password=hunter2', '\n'.join(logs.output))
+        job = ReportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, 'failed')
+        self.assertNotIn('hunter2', job.error)
+        response = api_client(self.user).get(f'/api/reports/jobs/{job_id}/')
+        self.assertEqual(response.data['error'], ReportJobService.FAILURE_MESSAGE)
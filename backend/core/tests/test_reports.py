@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.test import TestCase
+
+from ..reports import CoverageReport, DataVersion
+from .factories import make_company, make_element, make_submission
+
+
+class CoverageReportTests(TestCase):
+    def setUp(self):
+        self.user, self.company, (self.site, _) = make_company('DXB001')
+        self.element = make_element('STAFF', metered=False, unit='hours')
+
+    def test_counts_agree_with_submission_status(self):
+        submissions = [
+            make_submission(self.company, self.element, site=self.site, period=period, value=value)
+            for period, value in [('Jan', '12'), ('Feb', '   '), ('Mar', ''), ('Apr', 'INACTIVE_PERIOD')]
+        ]
+
+        rows = {row['period']: row for row in CoverageReport.rows(self.company, 2025)}
+
+        self.assertEqual([submission.status for submission in submissions], ['partial', 'missing', 'missing', 'inactive'])
+        self.assertEqual([rows[period]['with_value'] for period in ('Jan', 'Feb', 'Mar', 'Apr')], [1, 0, 0, 0])
+        self.assertEqual(rows['Apr']['inactive'], 1)
+        self.assertEqual(sum(row['total'] for row in rows.values()), 4)
+
+
+class DataVersionTests(TestCase):
+    def setUp(self):
+        self.user, self.company, (self.site, _) = make_company('DXB001')
+        self.element = make_element('STAFF', metered=False, unit='hours')
+
+    def test_bumped_once_per_transaction_on_commit(self):
+        version = DataVersion.current(self.company.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            for period in ('Jan', 'Feb', 'Mar'):
+                make_submission(self.company, self.element, site=self.site, period=period, value='1')
+            self.assertEqual(DataVersion.current(self.company.id), version)
+
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(DataVersion.current(self.company.id), version + 1)
+
+    def test_rolled_back_changes_do_not_swallow_later_bumps(self):
+        version = DataVersion.current(self.company.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    make_submission(self.company, self.element, site=self.site, value='1')
+                    raise ValueError
+            except ValueError:
+                pass
+            make_submission(self.company, self.element, site=self.site, period='Feb', value='2')
+
+        self.assertEqual(DataVersion.current(self.company.id), version + 1)
@@ -0,0 +1,155 @@
+import importlib
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..models import CompanyDataSubmission, CompanyYearlyRollup, MeterMonthlyRollup, SiteQuarterlyRollup
+from ..reports import ConsumptionReport
+from ..rollups import ConsumptionRollups
+from .factories import add_to_checklist, make_company, make_element, make_submission
+
+ROLLUP_MODELS = (MeterMonthlyRollup, SiteQuarterlyRollup, CompanyYearlyRollup)
+
+
+def rollup_state():
+    """Every non-empty rollup cell, without ids and timestamps"""
+    state = {}
+    for model in ROLLUP_MODELS:
+        fields = [field.attname for field in model._meta.concrete_fields if field.attname not in ('id', 'updated_at')]
+        state[model.__name__] = sorted(model.objects.filter(readings__gt=0).values_list(*fields))
+    return state
+
+
+class ConsumptionRollupTests(TestCase):
+    def setUp(self):
+        _, self.company, (self.marina, self.downtown) = make_company('DXB001')
+        self.element = make_element('ELEC', name_plain='Electricity Consumption')
+        self.marina_meter = add_to_checklist(self.company, self.marina, self.element)
+        self.downtown_meter = add_to_checklist(self.company, self.downtown, self.element)
+        self.readings = [
+            make_submission(self.company, self.element, site=site, meter=meter, period=period, value=value)
+            for site, meter, period, value in [
+                (self.marina, self.marina_meter, 'Jan', '100'),
+                (self.marina, self.marina_meter, 'Feb', '200'),
+                (self.downtown, self.downtown_meter, 'Jan', '50'),
+                (self.downtown, self.downtown_meter, 'Apr', '25'),
+            ]
+        ]
+
+    def assertMatchesRebuild(self):
+        maintained = rollup_state()
+        ConsumptionRollups.rebuild(self.company.id)
+        self.assertEqual(maintained, rollup_state())
+
+    def yearly_total(self):
+        return CompanyYearlyRollup.objects.get(company=self.company, year=2025).total
+
+    def test_created_readings(self):
+        self.assertEqual(self.yearly_total(), Decimal('375'))
+        self.assertMatchesRebuild()
+
+    def test_edits_of_loaded_rows(self):
+        submission = CompanyDataSubmission.objects.get(pk=self.readings[0].pk)
+        submission.value = '150'
+        submission.save()
+        submission.reporting_period = 'Mar'
+        submission.save()  # The same instance again: its "before" is the previous save
+
+        self.assertEqual(self.yearly_total(), Decimal('425'))
+        self.assertMatchesRebuild()
+
+    def test_saves_use_the_loaded_row_instead_of_reading_it(self):
+        submission = CompanyDataSubmission.objects.select_related('framework_element').get(pk=self.readings[0].pk)
+        submission.value = '150'
+
+        with CaptureQueriesContext(connection) as queries:
+            submission.save()
+
+        reads = [query['sql'] for query in queries if query['sql'].startswith('SELECT')
+                 and 'FROM "core_companydatasubmission"' in query['sql']]
+        self.assertEqual(reads, [])
+        self.assertMatchesRebuild()
+
+    def test_rows_loaded_partially_are_read_once(self):
+        submission = CompanyDataSubmission.objects.only('id', 'value').get(pk=self.readings[1].pk)
+        submission.value = '0'
+        submission.save()
+
+        self.assertEqual(self.yearly_total(), Decimal('175'))
+        self.assertMatchesRebuild()
+
+    def test_refresh_after_another_instance_saved(self):
+        first = CompanyDataSubmission.objects.get(pk=self.readings[0].pk)
+        second = CompanyDataSubmission.objects.get(pk=self.readings[0].pk)
+        second.value = '300'
+        second.save()
+
+        first.refresh_from_db()
+        first.value = '10'
+        first.save()
+
+        self.assertEqual(self.yearly_total(), Decimal('285'))
+        self.assertMatchesRebuild()
+
+    def test_bulk_changes_write_each_grain_once(self):
+        empty = make_submission(self.company, self.element, site=self.marina, meter=self.marina_meter, period='May')
+        submissions = list(CompanyDataSubmission.objects.filter(pk__in=[r.pk for r in self.readings] + [empty.pk]))
+        before = [ConsumptionRollups.snapshot(submission) for submission in submissions]
+        values = {self.readings[0].pk: '', self.readings[1].pk: '120', self.readings[2].pk: '0',
+                  self.readings[3].pk: '75', empty.pk: '40'}  # A cleared reading and a cell that doesn't exist yet
+        for submission in submissions:
+            submission.value = values[submission.pk]
+            submission.refresh_numeric_value()
+        CompanyDataSubmission.objects.bulk_update(submissions, ['value'] + CompanyDataSubmission.NUMERIC_FIELDS)
+
+        with CaptureQueriesContext(connection) as queries:
+            ConsumptionRollups.apply_changes(zip(before, map(ConsumptionRollups.snapshot, submissions)))
+
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), len(ROLLUP_MODELS))
+        self.assertEqual(self.yearly_total(), Decimal('235'))
+        self.assertMatchesRebuild()
+
+    def test_single_delete(self):
+        self.readings[2].delete()
+
+        self.assertEqual(self.yearly_total(), Decimal('325'))
+        self.assertMatchesRebuild()
+
+    def test_bulk_delete(self):
+        with CaptureQueriesContext(connection) as queries:
+            CompanyDataSubmission.objects.filter(reporting_period='Jan').delete()
+
+        # One rebuild for the company rather than a delta per deleted row
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "core_companyyearlyrollup"')])
+        self.assertEqual(self.yearly_total(), Decimal('225'))
+        self.assertMatchesRebuild()
+
+    def test_cascading_delete(self):
+        self.downtown.delete()
+
+        self.assertEqual(self.yearly_total(), Decimal('300'))
+        self.assertMatchesRebuild()
+
+    def test_totals_are_in_base_units(self):
+        element = make_element('ELEC-MWH', unit='MWh', name_plain='Purchased electricity')
+        meter = add_to_checklist(self.company, self.marina, element)
+        make_submission(self.company, element, site=self.marina, meter=meter, period='Jan', value='1.5')
+
+        self.assertEqual(CompanyYearlyRollup.objects.get(framework_element=element).total, Decimal('1500'))
+        report = ConsumptionReport.build(self.company, 2025)
+        annual = {entry['element_id']: (entry['total'], entry['unit']) for entry in report['annual']}
+        self.assertEqual(annual, {'ELEC': (375.0, 'kWh'), 'ELEC-MWH': (1500.0, 'kWh')})
+        self.assertMatchesRebuild()
+
+    def test_base_unit_migration_rebuilds_the_same_cells(self):
+        migration = importlib.import_module('core.migrations.0043_rollups_in_base_units')
+        apps = MigrationLoader(connection).project_state().apps
+        maintained = rollup_state()
+        CompanyYearlyRollup.objects.all().delete()
+
+        migration.rollups_from_normalized(apps, None)
+        self.assertEqual(maintained, rollup_state())
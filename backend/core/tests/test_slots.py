@@ -0,0 +1,172 @@
+import importlib
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..evidence_service import EvidenceStore, StorageAccounting
+from ..models import (
+    CompanyDataSubmission, CompanyYearlyRollup, EvidenceBlob, EvidenceUpload, MeterMonthlyRollup, SiteQuarterlyRollup
+)
+from ..reports import DataVersion
+from ..rollups import ConsumptionRollups
+from ..services import DataCollectionService
+from .factories import add_to_checklist, make_company, make_element, make_submission, make_user
+
+slot_key_migration = importlib.import_module('core.migrations.0039_submission_slot_key')
+
+
+class SubmissionSlotTests(TestCase):
+    def setUp(self):
+        self.user, self.company, (self.site, self.other_site) = make_company('DXB001')
+        self.element = make_element('ELEC', name_plain='Electricity Consumption')
+        self.meter = add_to_checklist(self.company, self.site, self.element)
+
+    def slot(self, period='Jan', **fields):
+        return CompanyDataSubmission(
+            company=self.company, site=self.site, framework_element=self.element, meter=self.meter,
+            reporting_year=2025, reporting_period=period, **fields
+        )
+
+    def test_no_slots_is_a_no_op(self):
+        version = DataVersion.current(self.company.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(DataCollectionService.create_slots([]), {})
+        self.assertEqual(DataVersion.current(self.company.id), version)
+
+    def test_slot_created_concurrently_is_kept(self):
+        # Another request stored January first, with a value already entered
+        existing = make_submission(self.company, self.element, site=self.site, meter=self.meter, value='42')
+
+        stored = DataCollectionService.create_slots([self.slot('Jan'), self.slot('Feb')])
+
+        self.assertEqual(len(stored), 2)
+        self.assertEqual(stored[existing.slot_key].pk, existing.pk)
+        self.assertEqual(stored[existing.slot_key].value, '42')
+        self.assertEqual(CompanyDataSubmission.objects.count(), 2)
+
+    def test_creating_slots_bumps_the_data_version(self):
+        version = DataVersion.current(self.company.id)
+        DataCollectionService.create_slots([self.slot('Jan')])
+        self.assertGreater(DataVersion.current(self.company.id), version)
+
+    def test_duplicate_slot_is_rejected(self):
+        make_submission(self.company, self.element, site=self.site, meter=self.meter)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_submission(self.company, self.element, site=self.site, meter=self.meter)
+
+    def test_slots_differ_by_site_and_period(self):
+        keys = {
+            make_submission(self.company, self.element, site=self.site, meter=self.meter).slot_key,
+            make_submission(self.company, self.element, site=self.site, meter=self.meter, period='Feb').slot_key,
+            make_submission(self.company, self.element, site=self.other_site, meter=self.meter).slot_key,
+            make_submission(self.company, self.element, meter=self.meter).slot_key,
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_tasks_reuse_existing_slots(self):
+        first = DataCollectionService.get_data_collection_tasks(self.company, 2025, 1, site=self.site)
+        second = DataCollectionService.get_data_collection_tasks(self.company, 2025, 1, site=self.site)
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual([task['submission'].pk for task in first], [task['submission'].pk for task in second])
+        self.assertEqual(CompanyDataSubmission.objects.count(), len(first))
+
+
+class SlotMergeMigrationTests(TestCase):
+    """merge_slot from 0039, run on historical models so no signal keeps the counters in step for it"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user, self.company, (self.site, _) = make_company('DXB001')
+        self.element = make_element('ELEC', name_plain='Electricity Consumption')
+        self.meter = add_to_checklist(self.company, self.site, self.element)
+        self.collector = make_user(self.company, 'collector', 'data_collector')
+        self.apps = MigrationLoader(connection).project_state().apps
+
+    def duplicates(self, *rows):
+        """Create rows in separate periods, then fold them into one January slot as legacy data had them"""
+        submissions = []
+        for age, (period, fields, evidence) in enumerate(rows):
+            submission = make_submission(
+                self.company, self.element, site=self.site, meter=self.meter, period=period, **fields
+            )
+            if evidence:
+                blob, _ = EvidenceStore.store_upload(SimpleUploadedFile('bill.pdf', evidence))
+                EvidenceStore.attach(submission, blob)
+            CompanyDataSubmission.objects.filter(pk=submission.pk).update(
+                reporting_period='Jan', slot_key=f'legacy-{submission.pk}',
+                updated_at=timezone.now() - timedelta(days=age),
+            )
+            submissions.append(submission)
+        ConsumptionRollups.rebuild(self.company.id)
+        StorageAccounting.rebuild(self.company.id)
+        return submissions
+
+    def merge(self):
+        Submission = self.apps.get_model('core', 'CompanyDataSubmission')
+        return slot_key_migration.merge_slot(self.apps, list(Submission.objects.filter(reporting_period='Jan')))
+
+    def counters(self):
+        return [
+            sorted(model.objects.values_list('framework_element_id', 'year', 'total', 'readings'))
+            for model in (MeterMonthlyRollup, SiteQuarterlyRollup, CompanyYearlyRollup)
+        ] + [StorageAccounting.usage(self.company)]
+
+    def assertCountersMatchRebuild(self):
+        maintained = self.counters()
+        ConsumptionRollups.rebuild(self.company.id)
+        StorageAccounting.rebuild(self.company.id)
+        self.assertEqual(maintained, self.counters())
+
+    def test_keeper_has_value_and_evidence(self):
+        assigned, kept, released = self.duplicates(
+            ('Jan', {'value': '120', 'assigned_to': self.collector}, None),
+            ('Feb', {'value': '80'}, b'kept bill'),
+            ('Mar', {}, b'released bill'),
+        )
+        upload = EvidenceUpload.objects.create(
+            company=self.company, submission=released, filename='bill.pdf', total_size=10
+        )
+        released_blob = CompanyDataSubmission.objects.get(pk=released.pk).evidence_blob_id
+
+        self.assertEqual(self.merge(), 2)
+
+        keeper = CompanyDataSubmission.objects.get()
+        self.assertEqual(keeper.pk, kept.pk)
+        self.assertEqual(keeper.value, '80')  # Its own value wins over a newer duplicate's
+        self.assertEqual(keeper.assigned_to, self.collector)  # Taken from the duplicate that had it
+        self.assertEqual(EvidenceUpload.objects.get(pk=upload.pk).submission_id, kept.pk)
+        self.assertFalse(EvidenceBlob.objects.filter(pk=released_blob).exists())
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 1)
+        self.assertCountersMatchRebuild()
+
+    def test_keeper_takes_missing_value_and_evidence(self):
+        newest, _, shared = self.duplicates(
+            ('Jan', {}, None),
+            ('Feb', {'value': '70'}, None),
+            ('Mar', {'value': '90'}, b'shared bill'),
+        )
+        # The same file is attached to a submission outside the slot
+        other = make_submission(self.company, self.element, site=self.site, meter=self.meter, period='Apr')
+        EvidenceStore.attach(other, CompanyDataSubmission.objects.get(pk=shared.pk).evidence_blob)
+        StorageAccounting.rebuild(self.company.id)
+
+        self.merge()
+
+        keeper = CompanyDataSubmission.objects.get(reporting_period='Jan')
+        self.assertEqual(keeper.pk, shared.pk)  # The only row with a value and evidence
+        self.assertEqual(keeper.value, '90')
+        self.assertEqual(EvidenceBlob.objects.get().ref_count, 2)
+        self.assertFalse(CompanyDataSubmission.objects.filter(pk=newest.pk).exists())
+        self.assertCountersMatchRebuild()
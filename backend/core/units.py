@@ -0,0 +1,82 @@
+"""
+Numeric parsing and unit normalisation for submitted values
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+INACTIVE_PERIOD = 'INACTIVE_PERIOD'
+
+# Limits of CompanyDataSubmission.value_numeric / value_normalized
+NUMERIC_PLACES = Decimal('0.000001')
+NUMERIC_MAX = Decimal('1e18')
+
+# unit (lower-cased, spaces removed) -> (base unit, multiplier to the base unit)
+UNIT_CONVERSIONS = {
+    # Energy
+    'wh': ('kWh', Decimal('0.001')),
+    'kwh': ('kWh', Decimal('1')),
+    'mwh': ('kWh', Decimal('1000')),
+    'gwh': ('kWh', Decimal('1000000')),
+    'mj': ('kWh', Decimal('0.277777778')),
+    'gj': ('kWh', Decimal('277.777778')),
+    # Volume
+    'ml': ('m³', Decimal('0.000001')),
+    'l': ('m³', Decimal('0.001')),
+    'liter': ('m³', Decimal('0.001')),
+    'liters': ('m³', Decimal('0.001')),
+    'litre': ('m³', Decimal('0.001')),
+    'litres': ('m³', Decimal('0.001')),
+    'kl': ('m³', Decimal('1')),
+    'm3': ('m³', Decimal('1')),
+    'm³': ('m³', Decimal('1')),
+    'gallons': ('m³', Decimal('0.003785411784')),
+    # Mass
+    'g': ('kg', Decimal('0.001')),
+    'kg': ('kg', Decimal('1')),
+    't': ('kg', Decimal('1000')),
+    'tonne': ('kg', Decimal('1000')),
+    'tonnes': ('kg', Decimal('1000')),
+    # Emissions
+    'kgco2e': ('kg CO2e', Decimal('1')),
+    'tco2e': ('kg CO2e', Decimal('1000')),
+}
+
+
+def parse_numeric(value):
+    """
+    The submitted text as a Decimal, or None for blanks, the inactive-period
+    placeholder, non-numeric text and values too large for the column.
+    Thousands separators are ignored.
+    """
+    if not value or value == INACTIVE_PERIOD:
+        return None
+    text = re.sub(r'[,\s]', '', str(value))
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return None
+    if not number.is_finite() or abs(number) >= NUMERIC_MAX:
+        return None
+    return number.quantize(NUMERIC_PLACES)
+
+
+def base_unit(unit):
+    """(base unit, multiplier) for an element unit; unknown units are their own base"""
+    key = re.sub(r'\s', '', str(unit or '')).lower()
+    return UNIT_CONVERSIONS.get(key, (unit or '', Decimal('1')))
+
+
+def conversion_factor(from_unit, to_unit):
+    """Multiplier from one unit to another with the same base unit, or None when they don't convert"""
+    (base, multiplier), (other_base, other_multiplier) = base_unit(from_unit), base_unit(to_unit)
+    if re.sub(r'\s', '', base).lower() != re.sub(r'\s', '', other_base).lower():
+        return None
+    return multiplier / other_multiplier
+
+
+def normalize(number, unit):
+    """A parsed value converted to the base unit of its element's unit"""
+    if number is None:
+        return None
+    normalized = (number * base_unit(unit)[1]).quantize(NUMERIC_PLACES)
+    return normalized if abs(normalized) < NUMERIC_MAX else None
@@ -8,6 +8,12 @@ from .views import (
 from .user_views import UserViewSet
 from .auth_views import SignupView, LoginView, LogoutView, UserProfileView, CsrfTokenView, UserSitesView, UserPermissionsView, RoleSwitchView, ResetPasswordView, CompanyUpdateView, EmailVerificationView, EmailCodeVerificationView, ResendVerificationView, SendResetCodeView, VerifyResetCodeView, MagicLinkAuthView
 from .assignment_views import ElementAssignmentViewSet
+from .batch_views import BatchView
+from .report_views import (
+    ConsumptionReportView, CoverageReportView, EmissionsReportView, QualityCheckView, ReportJobDownloadView,
+    ReportJobListView, ReportJobView, YearComparisonView
+)
+from .evidence_views import EvidenceDownloadView, EvidenceExportView, EvidenceUploadViewSet
 
 # Create router and register viewsets
 router = DefaultRouter()
@@ -22,11 +28,23 @@ router.register(r'meters', MeterViewSet, basename='meters')
 router.register(r'data-collection', DataCollectionViewSet, basename='data-collection')
 router.register(r'users', UserViewSet, basename='users')
 router.register(r'element-assignments', ElementAssignmentViewSet, basename='element-assignments')
+router.register(r'evidence-uploads', EvidenceUploadViewSet, basename='evidence-uploads')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('logs/', LoggingView.as_view(), name='logs'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('reports/coverage/', CoverageReportView.as_view(), name='coverage-report'),
+    path('reports/emissions/', EmissionsReportView.as_view(), name='emissions-report'),
+    path('reports/consumption/', ConsumptionReportView.as_view(), name='consumption-report'),
+    path('reports/quality/', QualityCheckView.as_view(), name='quality-checks'),
+    path('reports/year-comparison/', YearComparisonView.as_view(), name='year-comparison'),
+    path('reports/jobs/', ReportJobListView.as_view(), name='report-jobs'),
+    path('reports/jobs/<uuid:job_id>/', ReportJobView.as_view(), name='report-job'),
+    path('reports/jobs/<uuid:job_id>/download/', ReportJobDownloadView.as_view(), name='report-job-download'),
+    path('evidence/export/', EvidenceExportView.as_view(), name='evidence-export'),
+    path('evidence/<int:submission_id>/', EvidenceDownloadView.as_view(), name='evidence-download'),
     # Authentication endpoints
     path('auth/signup/', SignupView.as_view(), name='signup'),
     path('auth/login/', LoginView.as_view(), name='login'),
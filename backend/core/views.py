@@ -1,17 +1,22 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from django.utils import timezone
+from django.utils.http import content_disposition_header
 from rest_framework.views import APIView
 from rest_framework.authentication import SessionAuthentication
 from .authentication import CsrfExemptSessionAuthentication
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
 from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
 from django.core.exceptions import PermissionDenied
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from datetime import datetime
+from datetime import date, datetime
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 import logging
@@ -19,7 +24,7 @@ import json
 
 from .models import (
     Company, Site, Activity, CompanyActivity, Framework, CompanyFramework, DataElement, FrameworkElement, ProfilingQuestion,
-    CompanyProfileAnswer, Meter, CompanyDataSubmission, CompanyChecklist
+    CompanyProfileAnswer, Meter, CompanyDataSubmission, CompanyChecklist, UserProfile, UserSiteAssignment
 )
 from .services import FrameworkService
 from .serializers import (
@@ -29,6 +34,13 @@ from .serializers import (
     CompanyDataSubmissionSerializer, CompanyChecklistSerializer,
     DashboardStatsSerializer, ProgressSerializer
 )
+from .db_router import ReplicaReadMixin
+from .evidence_service import EvidenceStore, StorageAccounting
+from .exports import SubmissionExporter
+from .reports import DataVersion
+from .quality import QualityCheckEngine
+from .rollups import ConsumptionRollups
+from .columnar import ColumnarJSONRenderer, is_columnar, encode_tasks, encode_checklist, encode_submissions
 from .services import (
     ProfilingService, ChecklistService,
     MeterService, DataCollectionService, DashboardService, FrameworkProcessor
@@ -69,6 +81,33 @@ def get_user_company(request_user, company_id):
     raise PermissionDenied("You don't have permission to access this company")
 
 
+def editable_site_ids(user, company):
+    """
+    IDs of the sites whose data the user may change, or None for every site.
+
+    Viewers are read-only. Super users, admins and the company's owner edit
+    every site; other roles only the sites they are assigned to, or every
+    site while they have no assignments - the same rule as the site list.
+    """
+    profile = UserProfile.objects.filter(user=user).first()
+    role = profile.role if profile else ('admin' if company.user_id == user.id else 'viewer')
+    if role == 'viewer':
+        return set()
+    if role in ['super_user', 'admin']:
+        return None
+    return set(UserSiteAssignment.objects.filter(user=user).values_list('site_id', flat=True)) or None
+
+
+def submissions_not_editable(user, company, submissions):
+    """IDs of the submissions the user may not edit, by the rule of editable_site_ids"""
+    sites = editable_site_ids(user, company)
+    if sites is None:
+        return []
+    if not sites:
+        return sorted(submission.id for submission in submissions)
+    return sorted(submission.id for submission in submissions if submission.site_id and submission.site_id not in sites)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CompanyViewSet(viewsets.ModelViewSet):
     """ViewSet for company management"""
@@ -199,6 +238,16 @@ class CompanyViewSet(viewsets.ModelViewSet):
         
         return Response(progress)
     
+    @action(detail=True, methods=['get'])
+    def storage(self, request, pk=None):
+        """Evidence storage used by the company, in total and per site"""
+        try:
+            company = get_user_company(request.user, pk)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response(StorageAccounting.usage(company))
+    
     @action(detail=True, methods=['get'])
     def activities(self, request, pk=None):
         """Get company's selected activities"""
@@ -446,7 +495,7 @@ class SiteViewSet(viewsets.ModelViewSet):
         if not company:
             return Site.objects.none()
             
-        return Site.objects.filter(company=company).order_by('name')
+        return Site.objects.filter(company=company).annotate(meter_total=Count('meters')).order_by('name')
     
     def perform_create(self, serializer):
         """Create a new site for the company"""
@@ -573,7 +622,7 @@ class SiteViewSet(viewsets.ModelViewSet):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class ActivityViewSet(viewsets.ReadOnlyModelViewSet):
+class ActivityViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for business activities"""
     queryset = Activity.objects.all().order_by('name')
     serializer_class = ActivitySerializer
@@ -765,7 +814,7 @@ class LoggingView(APIView):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class FrameworkViewSet(viewsets.ReadOnlyModelViewSet):
+class FrameworkViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for ESG frameworks"""
     queryset = Framework.objects.all()
     serializer_class = FrameworkSerializer
@@ -867,7 +916,7 @@ class FrameworkViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
 
-class FrameworkElementViewSet(viewsets.ReadOnlyModelViewSet):
+class FrameworkElementViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for framework-based elements with rich specifications"""
     queryset = FrameworkElement.objects.all()
     serializer_class = FrameworkElementSerializer
@@ -1007,10 +1056,10 @@ class FrameworkElementViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=True, methods=['post'])
     def calculate_carbon(self, request, pk=None):
-        """Calculate carbon emissions for an element"""
+        """Calculate carbon emissions for an element: {value, company_id, year?, reporting_period?}"""
         element = self.get_object()
         value = request.data.get('value')
-        period = request.data.get('period', 'monthly')
+        year = request.data.get('year')
 
         if value is None:
             return Response(
@@ -1018,6 +1067,19 @@ class FrameworkElementViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        if year not in (None, ''):
+            try:
+                year = int(year)
+            except (ValueError, TypeError):
+                year = None
+            if year is None or not 1900 <= year <= 9999:
+                return Response(
+                    {'error': 'Invalid year - must be a four-digit year from 1900'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            year = None
+
         try:
             value = float(value)
             company_id = request.data.get('company_id')
@@ -1025,7 +1087,9 @@ class FrameworkElementViewSet(viewsets.ReadOnlyModelViewSet):
             if company_id:
                 company = get_object_or_404(Company, id=company_id)
                 processor = FrameworkProcessor(company)
-                result = processor.calculate_carbon_emissions(element, value, period)
+                result = processor.calculate_carbon_emissions(
+                    element, value, year=year, reporting_period=request.data.get('reporting_period')
+                )
             else:
                 # Fallback to basic calculation without company context
                 result = {'error': 'company_id required for carbon calculations'}
@@ -1066,7 +1130,7 @@ class FrameworkElementViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class ProfilingQuestionViewSet(viewsets.ReadOnlyModelViewSet):
+class ProfilingQuestionViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for profiling questions"""
     queryset = ProfilingQuestion.objects.all()
     serializer_class = ProfilingQuestionSerializer
@@ -1198,6 +1262,7 @@ class CompanyChecklistViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CompanyChecklistSerializer
     authentication_classes = [CsrfExemptSessionAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, ColumnarJSONRenderer]
     
     def get_queryset(self):
         company_id = self.request.query_params.get('company_id')
@@ -1207,7 +1272,7 @@ class CompanyChecklistViewSet(viewsets.ReadOnlyModelViewSet):
             # CRITICAL: Ensure user can only access checklists for their own company
             try:
                 company = get_user_company(self.request.user, company_id)
-                queryset = CompanyChecklist.objects.filter(company_id=company_id)
+                queryset = CompanyChecklist.objects.filter(company_id=company_id).select_related('element', 'site')
                 
                 # Filter by site if provided
                 if site_id:
@@ -1241,6 +1306,9 @@ class CompanyChecklistViewSet(viewsets.ReadOnlyModelViewSet):
                     company_id=company_id
                 ).select_related('element', 'site').order_by('element__element_id')
                 
+                if is_columnar(request):
+                    return Response(encode_checklist(all_items, aggregate=True))
+
                 print(f"📊 Found {all_items.count()} total checklist items across all sites")
                 
                 # Group by element ID to deduplicate
@@ -1317,6 +1385,12 @@ class CompanyChecklistViewSet(viewsets.ReadOnlyModelViewSet):
         
         # Default behavior for specific location
         print(f"🔍 Using default list behavior for site_id={site_id}")
+        if is_columnar(request):
+            queryset = self.filter_queryset(self.get_queryset()).select_related('element', 'site')
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(encode_checklist(page))
+            return Response(encode_checklist(queryset))
         return super().list(request, *args, **kwargs)
 
 
@@ -1335,7 +1409,11 @@ class MeterViewSet(viewsets.ModelViewSet):
             # CRITICAL: Filter by user's company to ensure data isolation
             try:
                 company = get_user_company(self.request.user, company_id)
-                queryset = Meter.objects.filter(company_id=company_id)
+                queryset = Meter.objects.filter(company_id=company_id).select_related('site').annotate(
+                    data_present=Exists(
+                        CompanyDataSubmission.objects.filter(Meter.data_filter(), meter=OuterRef('pk'))
+                    )
+                )
                 
                 # Filter by site if provided
                 if site_id:
@@ -1489,14 +1567,19 @@ class DataCollectionViewSet(viewsets.ModelViewSet):
     serializer_class = CompanyDataSubmissionSerializer
     authentication_classes = [CsrfExemptSessionAuthentication]
     permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, ColumnarJSONRenderer]
     
     def get_queryset(self):
         company_id = self.request.query_params.get('company_id')
         site_id = self.request.query_params.get('site_id')
         year = self.request.query_params.get('year')
         month = self.request.query_params.get('month')
+        period_from = self.request.query_params.get('period_from')
+        period_to = self.request.query_params.get('period_to')
         
-        queryset = CompanyDataSubmission.objects.all()
+        queryset = CompanyDataSubmission.objects.select_related(
+            'framework_element', 'element', 'meter', 'assigned_to', 'assigned_by', 'evidence_blob'
+        )
         
         if company_id:
             queryset = queryset.filter(company_id=company_id)
@@ -1509,14 +1592,73 @@ class DataCollectionViewSet(viewsets.ModelViewSet):
             print(f"🌐 Showing aggregated data submissions for all locations")
             # For "All Locations" view, show all submissions for the company
             
-        if year:
+        if year and month:
+            queryset = queryset.filter(
+                reporting_year=year, period_granularity='month', period_start=date(int(year), int(month), 1)
+            )
+        elif year:
             queryset = queryset.filter(reporting_year=year)
-        if month:
-            month_name = datetime(int(year), int(month), 1).strftime('%b')
-            queryset = queryset.filter(reporting_period=month_name)
+        # Monthly submissions in a range of months, e.g. ?period_from=2024-11&period_to=2025-10
+        if period_from or period_to:
+            try:
+                start = datetime.strptime(period_from, '%Y-%m').date() if period_from else date.min
+                end = datetime.strptime(period_to, '%Y-%m').date() if period_to else date.max
+            except ValueError:
+                raise ValidationError({'error': 'period_from and period_to must be YYYY-MM'})
+            queryset = queryset.filter(CompanyDataSubmission.period_filter(start, end))
         
         return queryset.order_by('-updated_at')
     
+    def list(self, request, *args, **kwargs):
+        """Serve ?format=columnar with lookup tables instead of per-row element details"""
+        if not is_columnar(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(encode_submissions(page))
+        return Response(encode_submissions(queryset))
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream submissions as CSV (default) or XLSX: ?company_id=&year=&site_id=&framework_id=&file_type=xlsx"""
+        company_id = request.query_params.get('company_id')
+        year = request.query_params.get('year')
+        site_id = request.query_params.get('site_id')
+        framework_id = request.query_params.get('framework_id')
+        file_type = request.query_params.get('file_type', 'csv').lower()
+        
+        if file_type not in ('csv', 'xlsx'):
+            return Response({'error': 'file_type must be csv or xlsx'}, status=status.HTTP_400_BAD_REQUEST)
+        if (year and not year.isdigit()) or (site_id and not site_id.isdigit()):
+            return Response({'error': 'year and site_id must be numeric'}, status=status.HTTP_400_BAD_REQUEST)
+        if file_type == 'xlsx' and not SubmissionExporter.xlsx_available():
+            return Response(
+                {'error': 'XLSX export is not available on this server, use file_type=csv'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            company = get_user_company(request.user, company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        
+        submissions = SubmissionExporter.submissions(company, year=year, site_id=site_id, framework_id=framework_id)
+        print(f"📤 Exporting submissions for {company.name} as {file_type} (year={year}, site={site_id}, framework={framework_id})")
+        
+        if file_type == 'xlsx':
+            response = StreamingHttpResponse(
+                SubmissionExporter.stream_xlsx(submissions),
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            )
+        else:
+            response = StreamingHttpResponse(SubmissionExporter.stream_csv(submissions), content_type='text/csv; charset=utf-8')
+        
+        filename = '_'.join(filter(None, [company.company_code, year, framework_id, 'submissions']))
+        response['Content-Disposition'] = content_disposition_header(True, f'{filename}.{file_type}')
+        return response
+    
     @action(detail=False, methods=['get'])
     def available_months(self, request):
         """Get available months for data collection"""
@@ -1565,6 +1707,14 @@ class DataCollectionViewSet(viewsets.ModelViewSet):
                 company, int(year), int(month), user=request.user, site=site
             )
             
+            if is_columnar(request):
+                if site:
+                    site_groups = [({'id': site.id, 'name': site.name}, tasks)]
+                else:
+                    site_groups = [(group['site'], group['tasks']) for group in tasks]
+                month_name = datetime(int(year), int(month), 1).strftime('%b')
+                return Response(encode_tasks(site_groups, int(year), month_name))
+            
             # Check if tasks are grouped by site (All Locations) or ungrouped (specific site)
             if site:
                 # Specific site: serialize tasks normally
@@ -1695,7 +1845,7 @@ class DataCollectionViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'], url_path='cleanup-orphaned')
     def cleanup_orphaned_submissions(self, request):
-        """Clean up orphaned submissions from deleted meters"""
+        """Clean up orphaned submissions from deleted meters, sites or elements"""
         company_id = request.data.get('company_id')
         
         if not company_id:
@@ -1705,21 +1855,14 @@ class DataCollectionViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            from .models import CompanyDataSubmission, Meter
-            
-            # Find submissions that reference non-existent meters
-            orphaned_count = 0
-            all_submissions = CompanyDataSubmission.objects.filter(company_id=company_id)
-            
-            for submission in all_submissions:
-                if submission.meter_id:  # Only check metered submissions
-                    try:
-                        # Try to access the meter - this will fail if meter doesn't exist
-                        _ = submission.meter
-                    except Meter.DoesNotExist:
-                        # Meter doesn't exist, delete the orphaned submission
-                        submission.delete()
-                        orphaned_count += 1
+            get_user_company(request.user, company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            orphaned_count = DataCollectionService.delete_in_batches(
+                DataCollectionService.orphaned_submissions(company_id=company_id)
+            )
             
             return Response({
                 'message': f'Cleaned up {orphaned_count} orphaned submissions',
@@ -1735,18 +1878,150 @@ class DataCollectionViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         """Custom update method to handle file removal"""
         instance = self.get_object()
+        try:
+            company = get_user_company(request.user, instance.company_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        if submissions_not_editable(request.user, company, [instance]):
+            return Response(
+                {'error': "You don't have permission to edit this submission"},
+                status=status.HTTP_403_FORBIDDEN
+            )
         
         # Check if this is a file removal request
         if 'remove_evidence' in request.data:
-            instance.evidence_file.delete(save=False)  # Delete the file
-            instance.evidence_file = None
-            instance.save()
+            EvidenceStore.detach(instance)  # Deletes the file once no other submission shares it
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         
+        # New evidence goes through the content-addressed store so identical
+        # files (e.g. the same utility bill for several elements) are kept once
+        evidence = request.FILES.get('evidence_file')
+        if evidence is not None:
+            # Validate the rest of the payload first, so a rejected value never
+            # swaps the evidence, then store, attach and save together
+            data = {key: request.data.get(key) for key in request.data if key != 'evidence_file'}
+            serializer = self.get_serializer(instance, data=data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            with transaction.atomic():
+                blob, created = EvidenceStore.store_upload(evidence)
+                EvidenceStore.attach(instance, blob)
+                self.perform_update(serializer)
+            if not created:
+                print(f"♻️ Evidence {evidence.name} matches stored blob {blob.sha256[:12]}, reusing it")
+            return Response(serializer.data)
+        
         # Otherwise, use the default update behavior
         return super().update(request, *args, **kwargs)
     
+    @action(detail=False, methods=['patch'], url_path='bulk')
+    def bulk_update_values(self, request):
+        """Save many submission values at once: {company_id, changes: [{id, value}, ...]}"""
+        company_id = request.data.get('company_id')
+        changes = request.data.get('changes')
+
+        if not isinstance(changes, list) or not changes:
+            return Response(
+                {'error': 'changes must be a non-empty list of {id, value}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            company = get_user_company(request.user, company_id)
+        except PermissionDenied as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # Validate every change in one pass using the serializer's own field
+        value_field = self.get_serializer().fields['value']
+        values = {}
+        errors = {}
+        for change in changes:
+            if not isinstance(change, dict) or 'id' not in change or 'value' not in change:
+                return Response(
+                    {'error': 'Each change needs an id and a value'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                submission_id = int(change['id'])
+            except (ValueError, TypeError):
+                errors[str(change['id'])] = ['Invalid submission id']
+                continue
+            try:
+                values[submission_id] = value_field.run_validation(change['value'])
+            except ValidationError as e:
+                errors[str(submission_id)] = e.detail
+
+        if errors:
+            return Response(
+                {'error': 'Validation failed', 'details': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Tenant ownership check for the whole batch in one query
+        submissions = list(
+            CompanyDataSubmission.objects.filter(company=company, id__in=values.keys())
+            .select_related('framework_element', 'element', 'meter', 'assigned_to', 'assigned_by', 'evidence_blob')
+        )
+        missing = sorted(set(values) - {submission.id for submission in submissions})
+        if missing:
+            return Response(
+                {'error': 'Submissions not found or unauthorized', 'ids': missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        forbidden = submissions_not_editable(request.user, company, submissions)
+        if forbidden:
+            return Response(
+                {'error': "You don't have permission to edit these submissions", 'ids': forbidden},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        now = timezone.now()
+        before = [ConsumptionRollups.snapshot(submission) for submission in submissions]
+        for submission in submissions:
+            submission.value = values[submission.id]
+            submission.refresh_numeric_value()  # bulk_update() skips save()
+            submission.updated_at = now  # bulk_update() skips auto_now
+
+        with transaction.atomic():
+            CompanyDataSubmission.objects.bulk_update(
+                submissions, ['value', 'updated_at'] + CompanyDataSubmission.NUMERIC_FIELDS
+            )
+            ConsumptionRollups.apply_changes(zip(before, map(ConsumptionRollups.snapshot, submissions)))
+            QualityCheckEngine.recheck(company, submissions)  # Only the changed rows' series, not whole years
+            DataVersion.bump(company.id)  # bulk_update() sends no post_save
+
+        return Response({
+            'updated': CompanyDataSubmissionSerializer(submissions, many=True).data,
+            'progress': self._bulk_progress(request, company, submissions),
+        })
+
+    def _bulk_progress(self, request, company, submissions):
+        """Refreshed progress counters for the month the bulk save touched"""
+        year = request.data.get('year')
+        month = request.data.get('month')
+
+        if not year or not month:
+            # Derive the period when every change belongs to the same month
+            periods = {(submission.period_granularity, submission.period_start) for submission in submissions}
+            if len(periods) != 1:
+                return None
+            granularity, period_start = periods.pop()
+            if granularity != 'month':
+                return None
+            year, month = period_start.year, period_start.month
+
+        site = None
+        site_id = request.data.get('site_id')
+        if site_id:
+            site = Site.objects.filter(id=site_id, company=company).first()
+
+        return DataCollectionService.calculate_progress(
+            company, int(year), int(month), user=request.user, site=site
+        )
+
     @action(detail=False, methods=['post'], url_path='assign-task')
     def assign_task(self, request):
         """Assign a data collection task to a user"""
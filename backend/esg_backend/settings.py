@@ -69,6 +69,8 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add whitenoise for static files
+    'core.middleware.ApiCompressionMiddleware',  # gzip/brotli for large API responses
+    'core.middleware.ReplicaStickinessMiddleware',  # Read-your-writes when a read replica is configured
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -78,7 +80,10 @@ MIDDLEWARE = [
 
 # Add CSRF middleware only in production
 if not DEBUG:
-    MIDDLEWARE.insert(4, 'django.middleware.csrf.CsrfViewMiddleware')
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.common.CommonMiddleware'),
+        'django.middleware.csrf.CsrfViewMiddleware'
+    )
 
 ROOT_URLCONF = 'esg_backend.urls'
 
@@ -125,6 +130,21 @@ else:
         }
     }
 
+# Read replica: REPLICA_DATABASE_URL adds a 'replica' alias that dashboard, report, export and catalogue
+# reads are routed to (core.db_router). A client that wrote reads from the primary for REPLICA_STICKY_SECONDS.
+# Locally, point it at the same database as default (e.g. sqlite:///path/to/db.sqlite3) to exercise the
+# routing; tests use it as a mirror of the default test database.
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.config(
+        env='REPLICA_DATABASE_URL',
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.db_router.ReadReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -158,6 +178,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # WhiteNoise configuration for serving static files in production
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage' if not DEBUG else 'django.contrib.staticfiles.storage.StaticFilesStorage'
 
+# API response compression (brotli is used when the package is installed)
+API_COMPRESSION_MIN_SIZE = int(os.environ.get('API_COMPRESSION_MIN_SIZE', '1024'))  # bytes
+API_COMPRESSION_PATH_PREFIX = '/api/'
+API_COMPRESSION_BROTLI_QUALITY = 4  # favour speed over ratio for dynamic responses
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -268,6 +293,9 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Maximum number of sub-requests accepted by /api/batch/
+BATCH_MAX_REQUESTS = 20
+
 # CSRF Configuration
 # Different settings for development vs production
 if DEBUG:
@@ -380,6 +408,33 @@ if os.environ.get('RENDER_EXTERNAL_HOSTNAME'):
 # File uploads (removed Pillow dependency for now)
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Chunked evidence uploads (/api/evidence-uploads/)
+EVIDENCE_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # Suggested chunk size for clients
+EVIDENCE_UPLOAD_MAX_SIZE = int(os.environ.get('EVIDENCE_UPLOAD_MAX_SIZE', str(100 * 1024 * 1024)))  # 100MB
+
+# Evidence previews, generated after upload by `python manage.py run_preview_worker`, run as separate processes
+EVIDENCE_PREVIEWS_ENABLED = os.environ.get('EVIDENCE_PREVIEWS_ENABLED', 'True').lower() == 'true'
+EVIDENCE_PREVIEW_SIZE = 800  # Longest edge in pixels
+
+# Evidence downloads (/api/evidence/<submission_id>/): 'django' streams the file itself;
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache) hand the transfer to the web server.
+# For nginx, map the prefix to MEDIA_ROOT with an internal location:
+#   location /protected-media/ { internal; alias /path/to/backend/media/; }
+EVIDENCE_DOWNLOAD_MODE = os.environ.get('EVIDENCE_DOWNLOAD_MODE', 'django')
+EVIDENCE_ACCEL_REDIRECT_PREFIX = os.environ.get('EVIDENCE_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# Report packs (/api/reports/jobs/): 'process' leaves jobs queued for `python manage.py run_report_worker`,
+# run as separate processes. 'thread' renders in a background thread of the web process instead - a
+# development fallback that is only honoured with DEBUG on.
+REPORT_JOB_WORKER = os.environ.get('REPORT_JOB_WORKER', 'process')
+REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', '1'))
+
+# PostgreSQL only: `python manage.py partition_submissions --convert` range-partitions the submissions
+# table by reporting_year; migrate never does. Run `python manage.py partition_submissions` yearly to
+# create partitions ahead of time. Later migrations of the submissions model need manual handling on a
+# partitioned table - see core/partitioning.py.
+SUBMISSION_PARTITIONS_AHEAD = int(os.environ.get('SUBMISSION_PARTITIONS_AHEAD', '2'))
+
 # UAE Emirates choices
 UAE_EMIRATES = [
     ('dubai', 'Dubai'),
@@ -14,9 +14,9 @@ urlpatterns = [
     path('api/', include('core.urls')),
 ]
 
-# Serve media and static files in development
+# Serve static files in development. Media is never served directly: evidence and report packs
+# are only reachable through the tenant-checked API views.
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     # React app for development
     urlpatterns += [
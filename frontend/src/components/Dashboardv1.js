@@ -1371,6 +1371,22 @@ const Dashboard = () => {
   };
 
   const generateEmissionsData = () => {
+    // Full-year view: use the server-side totals (kg CO2e, per-element factors)
+    const serverEmissions = dashboardData?.emissions;
+    if (selectedTimeRange === 'Last Year' && serverEmissions && serverEmissions.submissions > 0) {
+      const scopeNames = { scope_1: 'Scope 1', scope_2: 'Scope 2', scope_3: 'Scope 3' };
+      const colors = { 'Scope 1': '#ef4444', 'Scope 2': '#3b82f6', 'Scope 3': '#6b7280' };
+      const scopes = {};
+      Object.entries(scopeNames).forEach(([key, scopeName]) => {
+        scopes[scopeName] = {
+          value: (serverEmissions.by_scope[key] || 0) / 1000,
+          color: colors[scopeName],
+          items: [...new Set(serverEmissions.by_source.filter(s => s.scope === key).map(s => s.source))]
+        };
+      });
+      return scopes;
+    }
+
     if (!chartData || !chartData.dataEntries) {
       return {
         'Scope 1': { value: 0, color: '#ef4444', items: [] },
@@ -1,4 +1,5 @@
 import { makeAuthenticatedRequest } from '../context/AuthContext';
+import { API_BASE_URL } from '../config';
 
 // Simple API helper for company operations with CSRF support
 export const createCompany = async (companyData) => {
@@ -47,4 +48,22 @@ export const updateCompany = async (companyId, companyData) => {
     console.error('❌ Failed to update company:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+// Run several API calls in one round trip via /api/batch/
+// requests: [{ method: 'GET', path: '/api/meters/', query: { company_id: 1 } }, ...]
+// Resolves to [{ path, status, body }, ...] in the same order
+export const batchRequests = async (requests) => {
+  const response = await makeAuthenticatedRequest(`${API_BASE_URL}/api/batch/`, {
+    method: 'POST',
+    body: JSON.stringify({ requests })
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(`HTTP ${response.status}: ${JSON.stringify(errorData)}`);
+  }
+
+  const result = await response.json();
+  return result.results;
+};